@@ -9,6 +9,9 @@ import urllib.request, urllib.parse, urllib.error
 import dateutil.parser
 from bson.json_util import dumps
 import socket
+import time
+import hashlib
+import requests
 import bleach
 from collections import OrderedDict
 import pytz
@@ -39,7 +42,7 @@ from sefaria.model.webpage import get_webpages_for_ref
 from sefaria.model.media import get_media_for_ref
 from sefaria.model.schema import SheetLibraryNode
 from sefaria.model.trend import user_stats_data, site_stats_data
-from sefaria.client.wrapper import format_object_for_client, format_note_object_for_client, get_notes, get_links
+from sefaria.client.wrapper import format_object_for_client, format_note_object_for_client, get_notes, get_links, get_related_bundle
 from sefaria.system.exceptions import InputError, PartialRefInputError, BookNameError, NoVersionFoundError, DictionaryEntryNotFoundError
 from sefaria.client.util import jsonResponse
 from sefaria.history import text_history, get_maximal_collapsed_activity, top_contributors, make_leaderboard, make_leaderboard_condition, text_at_revision, record_version_deletion, record_index_deletion
@@ -52,10 +55,11 @@ from sefaria.utils.talmud import daf_to_section
 from sefaria.utils.calendars import get_all_calendar_items, get_todays_calendar_items, get_keyed_calendar_items, get_parasha
 from sefaria.utils.util import short_to_long_lang_code, titlecase
 import sefaria.tracker as tracker
-from sefaria.system.cache import django_cache
+from sefaria.system.cache import django_cache, InMemoryCache
 from sefaria.settings import USE_VARNISH, USE_NODE, NODE_HOST, DOMAIN_LANGUAGES, MULTISERVER_ENABLED, SEARCH_ADMIN, RTC_SERVER
 from sefaria.site.site_settings import SITE_SETTINGS
 from sefaria.system.multiserver.coordinator import server_coordinator
+from sefaria.system.profiler import record_timing
 from sefaria.helper.search import get_query_obj
 from sefaria.helper.topic import get_topic, get_all_topics, get_topics_for_ref
 
@@ -73,17 +77,26 @@ library.get_toc_tree()
 
 
 """ """
-logger.warn("Initializing Full Auto Completer")
-library.build_full_auto_completer()
+# Auto completers may already have been loaded from a library snapshot, in sefaria.model
+snapshot_is_stale = not library.is_initialized()
+if not library._full_auto_completer_is_ready:
+    logger.warn("Initializing Full Auto Completer")
+    library.build_full_auto_completer()
 
-logger.warn("Initializing Ref Auto Completer")
-library.build_ref_auto_completer()
+if not library._ref_auto_completer_is_ready:
+    logger.warn("Initializing Ref Auto Completer")
+    library.build_ref_auto_completer()
 
-logger.warn("Initializing Lexicon Auto Completers")
-library.build_lexicon_auto_completers()
+if not library._lexicon_auto_completer_is_ready:
+    logger.warn("Initializing Lexicon Auto Completers")
+    library.build_lexicon_auto_completers()
 
-logger.warn("Initializing Cross Lexicon Auto Completer")
-library.build_cross_lexicon_auto_completer()
+if not library._cross_lexicon_auto_completer_is_ready:
+    logger.warn("Initializing Cross Lexicon Auto Completer")
+    library.build_cross_lexicon_auto_completer()
+
+if snapshot_is_stale and library.save_snapshot():
+    logger.warn("Saved library snapshot")
 
 logger.warn("Initializing Shared Cache")
 library.init_shared_cache()
@@ -116,49 +129,98 @@ def render_template(request, template_name='base.html', app_props=None, template
     propsJSON = json.dumps(props, ensure_ascii=False)
     template_context["propsJSON"] = propsJSON
     if app_props: # We are rendering the ReaderApp in Node, otherwise its jsut a Django template view with ReaderApp set to headerMode
-        html = render_react_component("ReaderApp", propsJSON)
+        html = render_react_component("ReaderApp", propsJSON, cacheable=not request.user.is_authenticated)
         template_context["html"] = html
     return render(request, template_name=template_name, context=template_context, content_type=content_type, status=status, using=using)
 
 
-def render_react_component(component, props):
+_node_session = None
+_react_render_cache = None
+
+
+def _get_node_session():
+    """
+    Session holding a pool of persistent connections to the Node server, shared by the threads of this process.
+    """
+    global _node_session
+    if _node_session is None:
+        from sefaria.settings import NODE_POOL_SIZE
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=NODE_POOL_SIZE, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _node_session = session
+    return _node_session
+
+
+def get_react_render_cache():
+    """
+    Cache of HTML rendered by Node, keyed on a hash of the component and its props.
+    """
+    global _react_render_cache
+    if _react_render_cache is None:
+        from sefaria.settings import NODE_RENDER_CACHE_TIMEOUT, NODE_RENDER_CACHE_MAX_BYTES
+        _react_render_cache = InMemoryCache(timeout=NODE_RENDER_CACHE_TIMEOUT, max_bytes=NODE_RENDER_CACHE_MAX_BYTES,
+                                            size=lambda result: len(result[0]))
+    return _react_render_cache
+
+
+def render_react_component(component, props, cacheable=False):
     """
     Asks the Node Server to render `component` with `props`.
     `props` may either be JSON (to save reencoding) or a dictionary.
     Returns HTML.
+    :param cacheable: If True, the HTML may be served from, and is stored in, the render cache.  Concurrent renders of
+    the same component and props share one call to Node.  Meant for anonymous users, whose props are the same for
+    everyone viewing a page.  Props include `last_cached`, so renders made with stale shared data are not reused.
     """
     if not USE_NODE:
         return render_to_string("elements/loading.html", context={"SITE_SETTINGS": SITE_SETTINGS})
 
+    propsJSON = json.dumps(props, ensure_ascii=False) if isinstance(props, dict) else props
+    cache_key = hashlib.sha1("{}|{}".format(component, propsJSON).encode("utf-8")).hexdigest()
+    if not cacheable:
+        return _render_react_component_with_node(component, propsJSON, cache_key)[0]
+
+    html, rendered = get_react_render_cache().get_or_set(
+        cache_key,
+        lambda: _render_react_component_with_node(component, propsJSON, cache_key),
+        cache_if=lambda result: result[1]
+    )
+    return html
+
+
+def _render_react_component_with_node(component, propsJSON, cache_key):
+    """
+    :return: (HTML, True) if Node rendered the component, or (loading HTML, False) if it failed
+    """
     from sefaria.settings import NODE_TIMEOUT
 
-    propsJSON = json.dumps(props, ensure_ascii=False) if isinstance(props, dict) else props
-    cache_key = "todo" # zlib.compress(propsJSON)
     url = NODE_HOST + "/" + component + "/" + cache_key
-
-    encoded_args = urllib.parse.urlencode({
-        "propsJSON": propsJSON,
-    }).encode("utf-8")
+    start = time.time()
     try:
-        req = urllib.request.Request(url)
-        response = urllib.request.urlopen(req, encoded_args, NODE_TIMEOUT)
-        html = response.read().decode("utf-8")
-        return html
+        response = _get_node_session().post(url, data={"propsJSON": propsJSON}, timeout=NODE_TIMEOUT)
+        response.raise_for_status()
+        response.encoding = "utf-8"
+        html = response.text
+        record_timing("node", time.time() - start)
+        return html, True
     except Exception as e:
+        record_timing("node", time.time() - start)
         # Catch timeouts, however they may come.
-        if isinstance(e, socket.timeout) or (hasattr(e, "reason") and isinstance(e.reason, socket.timeout)):
-            props = json.loads(props) if isinstance(props, str) else props
+        if isinstance(e, (requests.exceptions.Timeout, socket.timeout)):
+            props = json.loads(propsJSON)
             logger.exception("Node timeout: {} / {} / {} / {}\n".format(
                     props.get("initialPath"),
                     "MultiPanel" if props.get("multiPanel", True) else "Mobile",
                     "Logged In" if props.get("loggedIn", False) else "Logged Out",
                     props.get("interfaceLang")
             ))
-            return render_to_string("elements/loading.html", context={"SITE_SETTINGS": SITE_SETTINGS})
+            return render_to_string("elements/loading.html", context={"SITE_SETTINGS": SITE_SETTINGS}), False
         else:
             # If anything else goes wrong with Node, just fall back to client-side rendering
             logger.exception("Node error: Fell back to client-side rendering.")
-            return render_to_string("elements/loading.html", context={"SITE_SETTINGS": SITE_SETTINGS})
+            return render_to_string("elements/loading.html", context={"SITE_SETTINGS": SITE_SETTINGS}), False
 
 
 def base_props(request):
@@ -827,7 +889,7 @@ def collection_page(request, slug):
     del props["collectionData"]["lastModified"]
 
     propsJSON = json.dumps(props)
-    html = render_react_component("ReaderApp", propsJSON)
+    html = render_react_component("ReaderApp", propsJSON, cacheable=not request.user.is_authenticated)
     return render(request, 'base.html', {
         "propsJSON": propsJSON,
         "html": html,
@@ -1208,9 +1270,9 @@ def interface_language_redirect(request, language):
 def count_and_index(c_oref, c_lang, vtitle, to_count=1):
     # count available segments of text
     if to_count:
-        library.recount_index_in_toc(c_oref.index)
+        library.recount_index_in_toc(c_oref.index, c_oref.normal())
         if MULTISERVER_ENABLED:
-            server_coordinator.publish_event("library", "recount_index_in_toc", [c_oref.index.title])
+            server_coordinator.publish_event("library", "recount_index_in_toc", [c_oref.index.title, c_oref.normal()])
 
     from sefaria.settings import SEARCH_INDEX_ON_SAVE
     if SEARCH_INDEX_ON_SAVE:
@@ -1989,19 +2051,7 @@ def related_api(request, tref):
     elif request.GET.get("private", False) and not request.user.is_authenticated:
         response = {"error": "You must be logged in to access private content."}
     else:
-        response = {
-            "links": get_links(tref, with_text=False, with_sheet_links=request.GET.get("with_sheet_links", False)),
-            "sheets": get_sheets_for_ref(tref),
-            "notes": [],  # get_notes(oref, public=True) # Hiding public notes for now
-            "webpages": get_webpages_for_ref(tref),
-            "topics": get_topics_for_ref(tref, annotate=True),
-            "manuscripts": ManuscriptPageSet.load_set_for_client(tref),
-            "media": get_media_for_ref(tref),
-        }
-        for value in response.values():
-            for item in value:
-                if 'expandedRefs' in item:
-                    del item['expandedRefs']
+        response = get_related_bundle(tref, with_sheet_links=request.GET.get("with_sheet_links", False))
     return jsonResponse(response, callback=request.GET.get("callback", None))
 
 
@@ -77,7 +77,8 @@ def remove_old_index_and_rename(idx_title):
         print("...".join(l["refs"]))
         l["refs"] = [r.replace("Complex ","") for r in l["refs"]]
         print("...".join(l["refs"]))
-        db.links.save(l)
+        # Through Link, so that the expanded refs and the link section index follow the new refs
+        Link(l).save(override_dependencies=True)
 
     hs = db.history.find({"ref":{"$regex":"^{}".format(temp_title)}})
     for h in hs:
@@ -5,7 +5,14 @@ import sys
 import os
 import csv
 
+import argparse
+
 import sefaria.export as export
 
-export.export_all()
+parser = argparse.ArgumentParser(description="Export all texts, links and schemas to SEFARIA_EXPORT_PATH")
+parser.add_argument("-n", "--num-processes", type=int, default=1, help="number of processes to export texts with")
+parser.add_argument("--full", action="store_true", help="clear and rewrite all exports, not only texts that changed")
+args = parser.parse_args()
+
+export.export_all(num_processes=args.num_processes, skip_unchanged=not args.full)
 
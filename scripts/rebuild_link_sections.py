@@ -0,0 +1,5 @@
+import django
+django.setup()
+from sefaria.model import link_section_index
+
+link_section_index.rebuild(verbose=True)
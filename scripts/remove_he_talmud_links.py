@@ -48,6 +48,8 @@ tlinks = db.links.find(q)
 #		print t
 print("Removing " + str(tlinks.count()) + " links.")
 
+from sefaria.model.link import link_section_index
+link_section_index.remove(tlinks.distinct("_id"))
 db.links.remove(q)
 
 
@@ -14,6 +14,7 @@ sys.path.insert(0, p + "/sefaria")
 os.environ['DJANGO_SETTINGS_MODULE'] = "settings"
 
 from sefaria.system.database import db
+from sefaria.model.link import link_section_index
 
 
 keepers = []
@@ -27,8 +28,10 @@ for link in links:
     if not ref1.startswith(titles) and not ref2.startswith(titles):
         if ref2.find(":") > -1:
             keepers.append((link["refs"][0], link["refs"][1], link["type"], link.get("anchorText", "")))
+            link_section_index.remove([link["_id"]])
             db.links.remove(link)
     else:
+        link_section_index.remove([link["_id"]])
         db.links.remove(link)
 
 with open("../tmp/berakhot_review_links.csv", 'wb') as csvfile:
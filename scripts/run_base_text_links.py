@@ -2,6 +2,7 @@
 from sefaria.model import *
 from sefaria.system.database import db
 
+# A raw write, but it doesn't change `refs`, so link_section_index is unaffected
 db.links.update({}, {'$unset': {'is_first_comment': 1, 'first_comment_indexes': 1, 'first_comment_section_ref': 1}}, multi=True)
 
 idxset = IndexSet()
@@ -118,7 +118,7 @@ MULTISERVER_ENABLED = False
 MULTISERVER_REDIS_SERVER = "127.0.0.1"
 MULTISERVER_REDIS_PORT = 6379
 MULTISERVER_REDIS_DB = 0
-MULTISERVER_REDIS_EVENT_CHANNEL = "msync"   # Message queue on Redis
+MULTISERVER_REDIS_EVENT_STREAM = "msync-events"   # Event stream on Redis
 MULTISERVER_REDIS_CONFIRM_CHANNEL = "mconfirm"   # Message queue on Redis
 
 # OAUTH these fields dont need to be filled in. they are only required for oauth2client to __init__ successfully
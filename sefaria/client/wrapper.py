@@ -1,10 +1,18 @@
 # -*- coding: utf-8 -*-
 import re
+from concurrent.futures import ThreadPoolExecutor
 
 import logging
 logger = logging.getLogger(__name__)
 
+from django.db import close_old_connections
+
 from sefaria.model import *
+from sefaria.model.webpage import get_webpages_for_ref
+from sefaria.model.media import get_media_for_ref
+from sefaria.helper.topic import get_topics_for_ref
+from sefaria.settings import RELATED_BUNDLE_CACHE_TIMEOUT, RELATED_BUNDLE_THREADS
+import sefaria.system.cache as scache
 from sefaria.datatype.jagged_array import JaggedTextArray
 from sefaria.system.exceptions import InputError, NoVersionFoundError
 from sefaria.model.user_profile import user_link, public_user_data
@@ -12,6 +20,11 @@ from sefaria.sheets import get_sheets_for_ref
 from sefaria.utils.hebrew import hebrew_term
 
 
+# Hard-coding automatic display of links to an underlying text. e.g. ("Rashba on ",)
+# E.g., when requesting "Steinsaltz on X" also include links to "X" as though they were connected directly to Steinsaltz.
+BOUND_TEXT_PREFIXES = ("Steinsaltz on ",)
+
+
 def format_link_object_for_client(link, with_text, ref, pos=None):
     """
     :param link: Link object
@@ -183,12 +196,16 @@ def get_links(tref, with_text=True, with_sheet_links=False):
     texts = {}
 
     linkset = LinkSet(oref)
+    formatted = []  # (link, com) pairs that passed the filters below
     # For all links that mention ref (in any position)
     for link in linkset:
         # each link contains 2 refs in a list
         # find the position (0 or 1) of "anchor", the one we're getting links for
         # If both sides of the ref are in the same section of a text, only one direction will be used.  bug? maybe not.
-        if reRef:
+        pos = linkset.position(link)
+        if pos is not None:
+            pass  # From the link section index
+        elif reRef:
             pos = 0 if any(re.match(reRef, tref) for tref in link.expandedRefs0) else 1
         else:
             pos = 0 if any(nRef == tref[:lenRef] for tref in link.expandedRefs0) else 1
@@ -212,7 +229,20 @@ def get_links(tref, with_text=True, with_sheet_links=False):
         except AttributeError as e:
             logger.error("AttributeError in presenting link: {} - {} : {}".format(link.refs[0], link.refs[1], e))
             continue
+        formatted.append((link, com))
 
+    # Load the section level texts of all links together, rather than one section at a time
+    batch = None
+    if with_text:
+        top_orefs = []
+        for link, com in formatted:
+            try:
+                top_orefs += [com_oref.top_section_ref() for com_oref in Ref(com["ref"]).split_spanning_ref()]
+            except InputError:
+                pass  # Surfaces below, as it would have without batching
+        batch = TextChunkBatch(top_orefs)
+
+    for link, com in formatted:
         # Rather than getting text with each link, walk through all links here,
         # caching text so that redundant DB calls can be minimized
         # If link is spanning, split into section refs and rejoin
@@ -226,7 +256,7 @@ def get_links(tref, with_text=True, with_sheet_links=False):
                     top_nref = top_oref.normal()
                     if top_nref not in texts:
                         for lang in ("en", "he"):
-                            top_nref_tc = TextChunk(top_oref, lang)
+                            top_nref_tc = batch.get(top_oref, lang)
                             versionInfoMap = None if not top_nref_tc._versions else {
                                 v.versionTitle: {
                                     'license': getattr(v, 'license', ''),
@@ -293,10 +323,7 @@ def get_links(tref, with_text=True, with_sheet_links=False):
             logger.warning("Trying to get non existent text for ref '{}'. Link refs were: {}".format(top_nref, link.refs))
             continue
 
-    # Hard-coding automatic display of links to an underlying text. bound_texts = ("Rashba on ",)
-    # E.g., when requesting "Steinsaltz on X" also include links to "X" as though they were connected directly to Steinsaltz.
-    bound_texts = ("Steinsaltz on ",)
-    for prefix in bound_texts:
+    for prefix in BOUND_TEXT_PREFIXES:
         if nRef.startswith(prefix):
             base_ref = nRef[len(prefix):]
             base_links = get_links(base_ref)
@@ -316,3 +343,85 @@ def get_links(tref, with_text=True, with_sheet_links=False):
         links += formatted_sheet_links
 
     return links
+
+
+_related_bundle_executor = None
+
+
+def _get_related_bundle_executor():
+    global _related_bundle_executor
+    if _related_bundle_executor is None:
+        _related_bundle_executor = ThreadPoolExecutor(max_workers=RELATED_BUNDLE_THREADS, thread_name_prefix="related")
+    return _related_bundle_executor
+
+
+def _in_related_bundle_thread(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        close_old_connections()  # Django DB connections are per thread.  Let this one expire like a request's would.
+
+
+def _related_bundle_scopes(oref, for_change=False):
+    """
+    Returns the cache generation keys that cover `oref`.
+    Bundles of Refs with top level sections depend on those sections and on changes to the whole text;
+    bundles of whole texts depend on any change in the text.
+    :param for_change: if True, return the keys that a change at `oref` should bump
+    """
+    title = oref.index.title
+    if oref.sections and getattr(oref.index_node, "depth", 1) > 1:
+        sections = ["related:{}:{}".format(title, n) for n in range(oref.sections[0], oref.toSections[0] + 1)]
+        return sections + ["related-any:{}".format(title)] if for_change else sections + ["related-whole:{}".format(title)]
+    return ["related-whole:{}".format(title), "related-any:{}".format(title)] if for_change else ["related-any:{}".format(title)]
+
+
+def get_related_bundle(tref, with_sheet_links=False):
+    """
+    Returns the public content related to `tref`, as used by the reader sidebar:
+    links, sheets, webpages, topics, manuscripts and media.
+    Bundles are cached until content they depend on changes (see `invalidate_related_bundles`).
+    On a miss, the lookups run concurrently.
+    """
+    oref = Ref(tref)
+    nref = oref.normal()
+    with_sheet_links = bool(with_sheet_links)
+    scopes = _related_bundle_scopes(oref)
+    for prefix in BOUND_TEXT_PREFIXES:
+        if nref.startswith(prefix):
+            scopes += _related_bundle_scopes(Ref(nref[len(prefix):]))
+    cache_key = scache.cache_get_key("related_bundle", nref, with_sheet_links, *scache.get_cache_generations(scopes))
+    bundle = scache.get_cache_elem(cache_key)
+    if bundle is not None:
+        return bundle
+
+    executor = _get_related_bundle_executor()
+    futures = {
+        "links": executor.submit(_in_related_bundle_thread, get_links, nref, with_text=False, with_sheet_links=with_sheet_links),
+        "sheets": executor.submit(_in_related_bundle_thread, get_sheets_for_ref, nref),
+        "webpages": executor.submit(_in_related_bundle_thread, get_webpages_for_ref, nref),
+        "topics": executor.submit(_in_related_bundle_thread, get_topics_for_ref, nref, annotate=True),
+        "manuscripts": executor.submit(_in_related_bundle_thread, ManuscriptPageSet.load_set_for_client, nref),
+        "media": executor.submit(_in_related_bundle_thread, get_media_for_ref, nref),
+    }
+    bundle = {key: future.result() for key, future in futures.items()}
+    bundle["notes"] = []  # get_notes(oref, public=True) # Hiding public notes for now
+    for value in bundle.values():
+        for item in value:
+            if 'expandedRefs' in item:
+                del item['expandedRefs']
+    scache.set_cache_elem(cache_key, bundle, timeout=RELATED_BUNDLE_CACHE_TIMEOUT)
+    return bundle
+
+
+def invalidate_related_bundles(trefs):
+    """
+    Drops cached related bundles that could include content at any of `trefs`.
+    """
+    scopes = set()
+    for tref in trefs:
+        try:
+            scopes.update(_related_bundle_scopes(Ref(tref), for_change=True))
+        except InputError:
+            continue
+    scache.bump_cache_generations(list(scopes))
@@ -1,3 +1,6 @@
+import pytest
+
+
 def pytest_configure(config):
     import sys
     import django
@@ -8,3 +11,17 @@ def pytest_configure(config):
 def pytest_unconfigure(config):
     import sys
     del sys._called_from_test
+
+
+@pytest.fixture
+def locmem_cache():
+    """
+    Runs a test with in-memory Django caches.  CI configures DummyCache, under which nothing is stored, so generation
+    tokens change on every read.
+    """
+    from django.test import override_settings
+    from sefaria.system.cache import SHARED_DATA_CACHE_ALIAS
+    backend = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    caches = {alias: dict(backend, LOCATION="test-{}".format(alias)) for alias in {"default", SHARED_DATA_CACHE_ALIAS}}
+    with override_settings(CACHES=caches):
+        yield
@@ -11,7 +11,8 @@ jagged_array.py: a sparse array of arrays
 
 import re
 from functools import reduce
-from itertools import zip_longest
+from itertools import zip_longest, chain
+import numpy
 import logging
 logger = logging.getLogger(__name__)
 
@@ -786,3 +787,215 @@ class JaggedIntArray(JaggedArray):
             for i in range(len(curr)):
                 sum += JaggedIntArray._depth_sum(curr[i], depth - 1)
             return sum
+
+
+class PackedJaggedArray(object):
+    """
+    A jagged array of uniform depth, stored as a flat buffer of terminal values plus one offset array per level,
+    in the manner of Arrow list arrays.  The lists at level k are numbered in depth first order, and list i spans
+    elements offsets[k][i]:offsets[k][i + 1] of level k + 1 (or of `values`, at the last level).  Level 0 is the
+    single outermost list.
+
+    Counts, masks, sums and subarrays are computed over the offset arrays with numpy, rather than by recursion.
+    Only regular arrays can be packed: every terminal value is at the same depth, and every element above that depth
+    is a list.  Irregular arrays raise ValueError from `from_list()`, and should be handled with JaggedArray.
+
+        >>> p = PackedJaggedArray.from_list([["a", ""], [], ["b"]])
+        >>> p.mask().to_list()
+        [[1, 0], [], [1]]
+    """
+
+    def __init__(self, offsets, values):
+        """
+        :param offsets: list of numpy int arrays, one per level
+        :param values: numpy array of terminal values
+        """
+        self.offsets = offsets
+        self.values = values
+
+    @classmethod
+    def from_list(cls, ja, depth=None):
+        """
+        :param ja: nested list
+        :param depth: depth of `ja`.  Defaults to the depth of its deepest branch.  Passing it allows empty arrays
+        (or arrays with empty sections) to be combined with deeper ones.
+        :raises ValueError: if `ja` is not a regular jagged array of `depth`
+        """
+        if not isinstance(ja, list):
+            raise ValueError("Can not pack {}".format(type(ja).__name__))
+        if depth is None:
+            depth = JaggedArray(ja).depth(deep=True) or 1
+        offsets = []
+        level = [ja]
+        for k in range(depth):
+            offsets += [cls._lengths_to_offsets(numpy.fromiter(map(len, level), dtype=numpy.int64, count=len(level)))]
+            level = list(chain.from_iterable(level))
+            expect_lists = k < depth - 1
+            if any(isinstance(e, list) != expect_lists for e in level):
+                raise ValueError("Jagged array is not regular at depth {}".format(k + 1))
+        values = numpy.empty(len(level), dtype=object)
+        values[:] = level
+        if len(level) and all(type(v) is int for v in level):
+            values = values.astype(numpy.int64)
+        return cls(offsets, values)
+
+    @classmethod
+    def empty(cls, depth):
+        return cls.from_list([], depth)
+
+    @staticmethod
+    def _lengths_to_offsets(lengths):
+        offsets = numpy.zeros(len(lengths) + 1, dtype=numpy.int64)
+        numpy.cumsum(lengths, out=offsets[1:])
+        return offsets
+
+    def _nest(self, items, levels):
+        # Rebuild nested lists from a flat list of items, using the offsets of `levels`, innermost first
+        for off in levels:
+            off = off.tolist()
+            items = [items[off[i]:off[i + 1]] for i in range(len(off) - 1)]
+        return items
+
+    def to_list(self):
+        return self._nest(self.values.tolist(), reversed(self.offsets))[0]
+
+    def array(self):
+        return self.to_list()
+
+    def get_depth(self):
+        return len(self.offsets)
+
+    def flatten_to_array(self):
+        return self.values.tolist()
+
+    def element_count(self):
+        return len(self.values)
+
+    def word_count(self):
+        """ Word count of the string values, as JaggedTextArray.word_count() """
+        return sum(len(re.split(r"[\s\u05be]+", v.strip())) for v in self.values if isinstance(v, str))
+
+    def shape(self):
+        """
+        As JaggedArray.shape()
+        """
+        lengths = numpy.diff(self.offsets[-1]).tolist()
+        if self.get_depth() == 1:
+            return lengths[0]
+        items = lengths
+        for off in reversed(self.offsets[:-1]):
+            off = off.tolist()
+            items = [items[off[i]:off[i + 1]] if off[i + 1] > off[i] else 0 for i in range(len(off) - 1)]
+        return items[0]
+
+    def mask(self):
+        """
+        :return PackedJaggedArray: of the same shape, with 1 at truthy positions and 0 elsewhere
+        """
+        if self.values.dtype == object:
+            truthy = numpy.fromiter(map(bool, self.values), dtype=bool, count=len(self.values))
+        else:
+            truthy = self.values != 0
+        return PackedJaggedArray(self.offsets, truthy.astype(numpy.int64))
+
+    def zero_mask(self):
+        return PackedJaggedArray(self.offsets, numpy.zeros(len(self.values), dtype=numpy.int64))
+
+    def __add__(self, other):
+        return self.add(other)
+
+    def add(self, other):
+        """
+        Position-wise sum of two int arrays of the same depth.  Positions missing in one of them count as 0,
+        so the result has the shape of the union of both, as JaggedIntArray.add()
+        """
+        if self.get_depth() != other.get_depth():
+            raise ValueError("Can not add arrays of depth {} and {}".format(self.get_depth(), other.get_depth()))
+        offsets = []
+        a_idx = b_idx = numpy.zeros(1, dtype=numpy.int64)  # index of each union list in a and b, -1 if missing
+        for a_off, b_off in zip(self.offsets + [None], other.offsets + [None]):
+            if a_off is None:
+                a_vals = numpy.where(a_idx >= 0, self.values[numpy.maximum(a_idx, 0)] if len(self.values) else 0, 0)
+                b_vals = numpy.where(b_idx >= 0, other.values[numpy.maximum(b_idx, 0)] if len(other.values) else 0, 0)
+                return PackedJaggedArray(offsets, (a_vals + b_vals).astype(numpy.int64))
+            a_len, a_start = self._child_spans(a_off, a_idx)
+            b_len, b_start = self._child_spans(b_off, b_idx)
+            lengths = numpy.maximum(a_len, b_len)
+            offsets += [self._lengths_to_offsets(lengths)]
+            a_idx = self._child_indexes(lengths, a_len, a_start)
+            b_idx = self._child_indexes(lengths, b_len, b_start)
+
+    @staticmethod
+    def _child_spans(off, idx):
+        present = idx >= 0
+        if len(off) == 1:  # No lists at this level
+            return numpy.zeros(len(idx), dtype=numpy.int64), numpy.zeros(len(idx), dtype=numpy.int64)
+        safe = numpy.where(present, idx, 0)
+        lengths = numpy.where(present, off[safe + 1] - off[safe], 0)
+        starts = numpy.where(present, off[safe], 0)
+        return lengths, starts
+
+    @staticmethod
+    def _child_indexes(lengths, own_len, own_start):
+        # For each child of the union lists, its index in one of the operands, or -1 where that operand is shorter
+        total = int(lengths.sum())
+        position = numpy.arange(total, dtype=numpy.int64) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+        return numpy.where(position < numpy.repeat(own_len, lengths), numpy.repeat(own_start, lengths) + position, -1)
+
+    def depth_sum(self, depth):
+        """
+        As JaggedIntArray.depth_sum()
+        """
+        contrib = numpy.minimum(self.values, 1)
+        for off in reversed(self.offsets[depth + 1:]):
+            cumulative = numpy.concatenate(([0], numpy.cumsum(contrib)))
+            contrib = numpy.minimum(cumulative[off[1:]] - cumulative[off[:-1]], 1)
+        return int(contrib.sum())
+
+    def subarray(self, start_indexes, end_indexes=None):
+        """
+        As JaggedArray.subarray(): everything between the positions `start_indexes` and `end_indexes`, inclusive.
+        Indexes common to both are dropped from the depth of the result.
+        :param start_indexes: List of zero-based indexes
+        :param end_indexes: List of zero-based indexes
+        :return: PackedJaggedArray, or the terminal value if a single terminal position is requested
+        """
+        if not end_indexes:
+            end_indexes = start_indexes
+        assert len(start_indexes) == len(end_indexes)
+        depth = self.get_depth()
+        if len(start_indexes) > depth:
+            return PackedJaggedArray.empty(1)
+
+        range_index = len(start_indexes)
+        for i in range(len(start_indexes)):
+            if start_indexes[i] != end_indexes[i]:
+                range_index = i
+                break
+
+        node = 0  # Index of the common ancestor at level range_index
+        for k in range(range_index):
+            off = self.offsets[k]
+            if start_indexes[k] >= off[node + 1] - off[node]:
+                return PackedJaggedArray.empty(max(depth - range_index, 1))
+            node = off[node] + start_indexes[k]
+        if range_index == depth:
+            return self.values[node].item() if hasattr(self.values[node], "item") else self.values[node]
+
+        lo, hi = node, node + 1
+        offsets = []
+        for k in range(range_index, depth):
+            off = self.offsets[k]
+            if hi > lo:
+                next_lo = off[lo] + start_indexes[k] if k < len(start_indexes) else off[lo]
+                next_hi = off[hi - 1] + end_indexes[k] + 1 if k < len(end_indexes) else off[hi]
+                next_lo, next_hi = min(next_lo, off[lo + 1]), min(next_hi, off[hi])
+                next_hi = max(next_hi, next_lo)
+            else:
+                next_lo = next_hi = off[lo]
+            offsets += [numpy.clip(off[lo:hi + 1], next_lo, next_hi) - next_lo]
+            lo, hi = next_lo, next_hi
+        return PackedJaggedArray(offsets, self.values[lo:hi])
+
+    def __eq__(self, other):
+        return self.to_list() == other.to_list()
@@ -335,3 +335,42 @@ class Test_Modify_by_Func():
         self.modifier_input += [(s, sections)]
         return s
 
+
+
+class Test_Packed_Jagged_Array(object):
+
+    def test_round_trip(self):
+        for arr in (twoby, threeby, threeby_empty_section, [], [[], []]):
+            assert ja.PackedJaggedArray.from_list(arr).to_list() == arr
+
+    def test_irregular(self):
+        with pytest.raises(ValueError):
+            ja.PackedJaggedArray.from_list([["a"], "b"])
+        with pytest.raises(ValueError):
+            ja.PackedJaggedArray.from_list(["a", "b"], depth=2)
+
+    def test_counts(self):
+        for arr in (twoby, threeby, threeby_empty_section):
+            packed = ja.PackedJaggedArray.from_list(arr)
+            assert packed.element_count() == ja.JaggedTextArray(arr).element_count()
+            assert packed.word_count() == ja.JaggedTextArray(arr).word_count()
+            assert packed.shape() == ja.JaggedTextArray(arr).shape()
+            assert packed.flatten_to_array() == ja.JaggedTextArray(arr).flatten_to_array()
+            assert packed.mask().to_list() == ja.JaggedTextArray(arr).mask().array()
+
+    def test_add(self):
+        x = ja.PackedJaggedArray.from_list([[1, 2], [3, 4]]) + ja.PackedJaggedArray.from_list([[2, 3], [4]])
+        assert x.to_list() == [[3, 5], [7, 4]]
+        x = ja.PackedJaggedArray.empty(3) + ja.PackedJaggedArray.from_list(threeby_empty_section).mask()
+        assert x.to_list() == ja.JaggedTextArray(threeby_empty_section).mask().array()
+        mask = ja.JaggedTextArray(threeby_empty_section).mask() + ja.JaggedTextArray(threeby).mask()
+        x = ja.PackedJaggedArray.from_list(threeby_empty_section).mask() + ja.PackedJaggedArray.from_list(threeby).mask()
+        assert x.to_list() == mask.array()
+        assert [x.depth_sum(d) for d in range(3)] == [mask.depth_sum(d) for d in range(3)]
+
+    def test_subarray(self):
+        packed = ja.PackedJaggedArray.from_list(threeby_empty_section)
+        for start, end in (([0], [0]), ([1], [3]), ([0, 1], [0, 2]), ([0, 1, 1], [3, 0, 1]), ([2], [2]), ([1, 2], [3, 1])):
+            expected = ja.JaggedTextArray(threeby_empty_section).subarray(start, end).array()
+            assert packed.subarray(start, end).to_list() == expected
+        assert packed.subarray([3, 2, 2]) == threeby_empty_section[3][2][2]
@@ -6,6 +6,8 @@ Exports to the directory specified in SEFARIA_EXPORT_PATH.
 import sys
 import os
 import io
+import hashlib
+import multiprocessing
 import unicodecsv as csv
 import re
 import json
@@ -24,7 +26,7 @@ from sefaria.utils.talmud import section_to_daf
 from sefaria.system.exceptions import InputError
 from .summaries import CATEGORY_ORDER
 from .settings import SEFARIA_EXPORT_PATH
-from sefaria.system.database import db
+from sefaria.system.database import db, reconnect
 
 
 lang_codes = {
@@ -263,11 +265,12 @@ export_formats = (
 )
 
 
-def clear_exports():
+def clear_exports(texts=True):
     """
     Deletes all files from any export directory listed in export_formats.
+    :param texts: if False, only the schemas and links directories are cleared
     """
-    for format in export_formats:
+    for format in (export_formats if texts else []):
         if os.path.exists(SEFARIA_EXPORT_PATH + "/" + format[0]):
             rmtree(SEFARIA_EXPORT_PATH + "/" + format[0])
     if os.path.exists(SEFARIA_EXPORT_PATH + "/schemas"):
@@ -278,21 +281,25 @@ def clear_exports():
 def write_text_doc_to_disk(doc=None):
     """
     Writes document to disk according to all formats in export_formats
+    :return: dict of the checksum of each file written, by path relative to SEFARIA_EXPORT_PATH
     """
     assert doc is not None
+    written = {}
     for format in export_formats:
         out = format[1](doc)
         if not out:
             print("Skipping %s - no content" % doc["title"])
-            return
+            return written
         path = make_path(doc, format[0], extension=format[2] if len(format) == 3 else None)
         if not os.path.exists(os.path.dirname(path)):
-            os.makedirs(os.path.dirname(path))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
         try:
             with open(path, "w") as f:
                 f.write(out)
+            written[os.path.relpath(path, SEFARIA_EXPORT_PATH)] = hashlib.sha256(out.encode("utf-8")).hexdigest()
         except IOError as e:
             log_error('failed to write to disk: {}'.format(str(e)))
+    return written
 
 def prepare_text_for_export(text):
     """
@@ -358,25 +365,6 @@ def text_is_copyright(text):
            and text["license"].startswith("Copyright")
 
 
-def export_texts():
-    """
-    Step through every text in the texts collection and export it with each format
-    listed in export_formats.
-    """
-    clear_exports()
-
-    texts = db.texts.find()
-
-    for text in texts:
-        if text_is_copyright(text):
-            # Don't export copyrighted texts.
-            continue
-
-        prepped_text = prepare_text_for_export(text)
-        if prepped_text:
-            write_text_doc_to_disk(prepped_text)
-
-
 def prepare_merged_text_for_export(title, lang=None):
     """
     Exports a "merged" version of title, including the maximal text we have available
@@ -429,27 +417,6 @@ def prepare_merged_text_for_export(title, lang=None):
     return prepare_text_for_export(doc)
 
 
-def export_all_merged():
-    """
-    Iterate through all index records and exports a merged text for each.
-    """
-    texts = db.texts.find().distinct("title")
-
-    for title in texts:
-        try:
-            Ref(title)
-        except:
-            continue
-
-        print(title)
-        if not title:
-            log_error('None title in texts')
-            continue
-        for lang in ("he", "en"):
-            prepped_text = prepare_merged_text_for_export(title, lang=lang)
-            if prepped_text:
-                write_text_doc_to_disk(prepped_text)
-
 def export_schemas():
     print('exporting schemas...')
     path = SEFARIA_EXPORT_PATH + "/schemas/"
@@ -592,13 +559,183 @@ def make_export_log():
         f.write(datetime.now().isoformat())
 
 
-def export_all():
+def checksum(obj):
+    """
+    Stable checksum of a JSON serializable document (ObjectIds and dates are serialized as strings).
+    """
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+class ExportManifest(object):
+    """
+    Record of the files written by the last export of each text version and merged text, with checksums of both
+    the inputs they were made from and their contents.  Exports whose inputs are unchanged can then be skipped.
+
+    Entries are keyed by "<title>|<language>|<versionTitle or 'merged'>", and look like:
+        {"input": <checksum of the index and version(s)>, "files": {<path relative to export dir>: <sha256>}}
+    """
+    format_version = 1
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(SEFARIA_EXPORT_PATH, "manifest.json")
+        self.entries = {}
+        self.exists = False
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            if data.get("format") == self.format_version:
+                self.entries = data["entries"]
+                self.exists = True
+        except (IOError, ValueError, KeyError):
+            pass
+
+    @staticmethod
+    def key(title, lang, version_title):
+        return "|".join([title, lang, version_title])
+
+    def entries_for_title(self, title):
+        prefix = title + "|"
+        return {k: v for k, v in self.entries.items() if k.startswith(prefix)}
+
+    @staticmethod
+    def is_current(entry, input_checksum):
+        """
+        :return: True if `entry` was made from `input_checksum` and all of its files are still on disk
+        """
+        return bool(entry) and entry["input"] == input_checksum \
+            and all(os.path.exists(os.path.join(SEFARIA_EXPORT_PATH, path)) for path in entry["files"])
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"format": self.format_version, "date": datetime.now().isoformat(), "entries": self.entries}, f, indent=1, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def export_title(title, previous_entries=None):
+    """
+    Exports every version of `title`, and its merged text in each language, in all of export_formats.
+    Versions are read one at a time from a cursor.  Exports whose entry in `previous_entries` was made from
+    the same inputs are not rewritten.
+    :param previous_entries: manifest entries of this title from the last export
+    :return: (title, manifest entries of this title, number of exports written, number skipped)
+    """
+    previous_entries = previous_entries or {}
+    entries = {}
+    written = skipped = 0
+    try:
+        index = library.get_index(title)
+        index_checksum = checksum(index.contents(raw=True))
+    except Exception as e:
+        print("Skipping %s - %s" % (title, str(e)))
+        return title, entries, written, skipped
+
+    version_checksums = {"he": [], "en": []}
+    for text in db.texts.find({"title": title}).sort([["priority", -1], ["_id", 1]]):
+        if text_is_copyright(text):
+            # Don't export copyrighted texts.
+            continue
+        input_checksum = checksum([index_checksum, {k: v for k, v in text.items() if k != "_id"}])
+        if text.get("language") in version_checksums:
+            version_checksums[text["language"]].append(input_checksum)
+        key = ExportManifest.key(title, text.get("language", ""), text.get("versionTitle", ""))
+        if ExportManifest.is_current(previous_entries.get(key), input_checksum):
+            entries[key] = previous_entries[key]
+            skipped += 1
+            continue
+        prepped_text = prepare_text_for_export(text)
+        if prepped_text:
+            entries[key] = {"input": input_checksum, "files": write_text_doc_to_disk(prepped_text)}
+            written += 1
+
+    try:
+        Ref(title)
+    except InputError:
+        return title, entries, written, skipped
+    for lang in ("he", "en"):
+        if not version_checksums[lang]:
+            continue
+        input_checksum = checksum([index_checksum] + version_checksums[lang])
+        key = ExportManifest.key(title, lang, "merged")
+        if ExportManifest.is_current(previous_entries.get(key), input_checksum):
+            entries[key] = previous_entries[key]
+            skipped += 1
+            continue
+        prepped_text = prepare_merged_text_for_export(title, lang=lang)
+        if prepped_text:
+            entries[key] = {"input": input_checksum, "files": write_text_doc_to_disk(prepped_text)}
+            written += 1
+
+    return title, entries, written, skipped
+
+
+def _export_title_in_worker(args):
+    title, previous_entries = args
+    log_error.all_errors = []
+    result = export_title(title, previous_entries)
+    return result + (log_error.all_errors,)
+
+
+def export_all_texts(num_processes=1, skip_unchanged=True):
+    """
+    Exports every text version and merged text, fanning out across `num_processes` processes by title,
+    and records the results in the export manifest.
+    :param skip_unchanged: if True, skip exports whose inputs haven't changed since the last export.
+    Otherwise, all exports are cleared and rewritten.
+    """
+    manifest = ExportManifest()
+    if not (skip_unchanged and manifest.exists):
+        clear_exports()
+        manifest.entries = {}
+    previous = manifest.entries
+    titles = sorted(t for t in db.texts.distinct("title") if t)
+
+    start = datetime.now()
+    args = [(title, manifest.entries_for_title(title)) for title in titles]
+    if num_processes > 1:
+        # Workers are forked, so that they inherit the loaded library.  Mongo connections are reopened per process.
+        pool = multiprocessing.get_context("fork").Pool(num_processes, initializer=reconnect)
+        results = pool.imap_unordered(_export_title_in_worker, args)
+    else:
+        pool = None
+        results = (export_title(*a) + ([],) for a in args)
+
+    entries = {}
+    total_written = total_skipped = 0
+    try:
+        for i, (title, title_entries, written, skipped, errors) in enumerate(results, 1):
+            entries.update(title_entries)
+            total_written += written
+            total_skipped += skipped
+            for error in errors:
+                log_error(error.rstrip("\n"))
+            print("Exported {} {}/{}. {} written, {} unchanged".format(title, i, len(titles), written, skipped))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    # Remove files of exports that no longer exist, e.g. of deleted or renamed versions
+    current_files = {path for entry in entries.values() for path in entry["files"]}
+    for entry in previous.values():
+        for path in entry["files"]:
+            if path not in current_files and os.path.exists(os.path.join(SEFARIA_EXPORT_PATH, path)):
+                os.remove(os.path.join(SEFARIA_EXPORT_PATH, path))
+
+    manifest.entries = entries
+    manifest.save()
+    print("Exported texts in {} seconds. {} written, {} unchanged".format((datetime.now() - start).seconds, total_written, total_skipped))
+
+
+def export_all(num_processes=1, skip_unchanged=True):
     """
     Export all texts, merged texts, links, schemas, toc, links & export log.
+    :param num_processes: number of processes to export texts with
+    :param skip_unchanged: if True, texts that haven't changed since the last export (per its manifest) aren't rewritten
     """
-    clear_exports()
-    export_texts()
-    export_all_merged()
+    clear_exports(texts=False)
+    export_all_texts(num_processes=num_processes, skip_unchanged=skip_unchanged)
     export_links()
     export_schemas()
     export_toc()
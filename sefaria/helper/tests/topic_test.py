@@ -0,0 +1,62 @@
+# encoding=utf-8
+import math
+import pytest
+from functools import cmp_to_key
+from sefaria.model import *
+from sefaria.helper.topic import get_topic, invalidate_topic_pages, sort_refs_by_relevance, relevance_sort_key, TOPIC_PAGE_PARAMS, \
+    calculate_mean_tfidf_scores, calculate_tfidf_related_sheet_links, _topic_page_scopes
+import sefaria.system.cache as scache
+
+
+def test_relevance_sort_key():
+    links = [
+        {"order": {}},
+        {"order": {"pr": 1, "numDatasource": 1, "tfidf": 0.5}},
+        {"order": {"pr": 2}},
+        {"order": {"numDatasource": 3, "tfidf": 0.2}},
+        {"order": {"pr": 1, "numDatasource": 2, "tfidf": 0.5}},
+        {},
+    ]
+    assert sorted(links, key=relevance_sort_key) == sorted(links, key=cmp_to_key(sort_refs_by_relevance))
+
+
+def test_mean_tfidf_scores():
+    ref_topic_map = {"a": ["r1", "r2", "r4"], "b": ["r2"], "c": ["r3"]}
+    ref_words_map = {"r1": ["x", "y"], "r2": ["x", "y"], "r3": ["z"]}
+    scores = calculate_mean_tfidf_scores(ref_topic_map, ref_words_map)
+    idf = math.log2(3 / 2)
+    # in topic "a", x and y each have tf 2, of which each ref contributes 1
+    assert scores[("a", "r1")] == pytest.approx(idf)
+    assert scores[("a", "r2")] == pytest.approx(idf)
+    assert scores[("a", "r4")] == 0
+    assert scores[("b", "r2")] == pytest.approx(0)
+    assert scores[("c", "r3")] == pytest.approx(0)
+
+
+def test_tfidf_related_sheet_links():
+    links = calculate_tfidf_related_sheet_links([{"a": "x", "b": "y", "user_votes": 2}, {"a": "x", "b": "z", "user_votes": 1}])
+    scores = {(l["fromTopic"], l["toTopic"]): l["order"]["tfidf"] for l in links}
+    assert scores == pytest.approx({
+        ("x", "y"): 2 * math.log2(3) / 3,
+        ("x", "z"): math.log2(3) / 3,
+        ("y", "x"): 2 * math.log2(1.5) / 2,
+        ("z", "x"): math.log2(1.5),
+    })
+
+
+class TestTopicPageCache(object):
+
+    def test_cached_page_matches_built_page(self):
+        cached = get_topic("shabbat", **TOPIC_PAGE_PARAMS)
+        built = get_topic("shabbat", refresh=True, **TOPIC_PAGE_PARAMS)
+        assert get_topic("shabbat", **TOPIC_PAGE_PARAMS) == built
+        assert cached["slug"] == built["slug"]
+
+    def test_invalidate(self, locmem_cache):
+        page = get_topic("shabbat", **TOPIC_PAGE_PARAMS)
+        before = scache.get_cache_generations(_topic_page_scopes("shabbat") + _topic_page_scopes("moses"))
+        invalidate_topic_pages(["shabbat"])
+        after = scache.get_cache_generations(_topic_page_scopes("shabbat") + _topic_page_scopes("moses"))
+        assert after[0] != before[0]   # the page of "shabbat" is under a new key
+        assert after[1:] == before[1:]  # other pages are not
+        assert get_topic("shabbat", **TOPIC_PAGE_PARAMS) == page
@@ -3,17 +3,74 @@ from tqdm import tqdm
 from pymongo import UpdateOne, InsertOne
 from typing import Optional, Union
 from collections import defaultdict
-from functools import cmp_to_key
 from sefaria.model import *
 from sefaria.system.exceptions import InputError
 from sefaria.model.topic import TopicLinkHelper
 from sefaria.system.database import db
+from sefaria.settings import TOPIC_PAGE_CACHE_TIMEOUT, TOPIC_PAGE_PREBUILD_COUNT
+import sefaria.system.cache as scache
 import logging
 
 logger = logging.getLogger(__name__)
 
+# The parameters that topic pages request (see Sefaria.getTopic), which build_topic_pages() precomputes
+TOPIC_PAGE_PARAMS = {"with_links": True, "annotate_links": True, "with_refs": True, "group_related": True,
+                     "annotate_time_period": False, "ref_link_type_filters": ["about"]}
 
-def get_topic(topic, with_links, annotate_links, with_refs, group_related, annotate_time_period, ref_link_type_filters):
+
+def _topic_page_scopes(slug):
+    return ["topic-page:{}".format(slug), "topic-page-all"]
+
+
+def get_topic(topic, with_links, annotate_links, with_refs, group_related, annotate_time_period, ref_link_type_filters, refresh=False):
+    """
+    Returns the topic page data of the topic with slug `topic`.
+    Responses are cached until the topic, its links, or a topic it links to changes (see `invalidate_topic_pages`).
+    :param refresh: if True, rebuild the response rather than read it from the cache
+    """
+    params = (bool(with_links), bool(annotate_links), bool(with_refs), bool(group_related), bool(annotate_time_period),
+              "|".join(sorted(ref_link_type_filters)))
+    cache_key = scache.cache_get_key("topic_page", topic, *params, *scache.get_cache_generations(_topic_page_scopes(topic)))
+    if not refresh:
+        response = scache.get_cache_elem(cache_key)
+        if response is not None:
+            return response
+    response = _get_topic(topic, with_links, annotate_links, with_refs, group_related, annotate_time_period, ref_link_type_filters)
+    scache.set_cache_elem(cache_key, response, timeout=TOPIC_PAGE_CACHE_TIMEOUT)
+    return response
+
+
+def invalidate_topic_pages(slugs, with_linked=False):
+    """
+    Drops the cached topic pages of `slugs`.
+    :param with_linked: if True, also drop the pages of the topics linked to `slugs`, which show their titles
+    """
+    slugs = {slug for slug in slugs if slug}
+    if with_linked and slugs:
+        for link in IntraTopicLinkSet({"$or": [{"fromTopic": {"$in": list(slugs)}}, {"toTopic": {"$in": list(slugs)}}]}):
+            slugs.update([link.fromTopic, link.toTopic])
+    scache.bump_cache_generations(["topic-page:{}".format(slug) for slug in slugs])
+
+
+def invalidate_all_topic_pages():
+    """
+    Drops every cached topic page.  For bulk writes to topics and topic links, which don't trigger dependencies.
+    """
+    scache.bump_cache_generations(["topic-page-all"])
+
+
+def build_topic_pages(limit=TOPIC_PAGE_PREBUILD_COUNT):
+    """
+    Rebuilds the cached pages of the `limit` topics with the most sources
+    """
+    for topic in get_all_topics(limit):
+        try:
+            get_topic(topic.slug, refresh=True, **TOPIC_PAGE_PARAMS)
+        except Exception as e:
+            logger.warning("Failed to build topic page of {}: {}".format(topic.slug, e))
+
+
+def _get_topic(topic, with_links, annotate_links, with_refs, group_related, annotate_time_period, ref_link_type_filters):
     topic_obj = Topic.init(topic)
     response = topic_obj.contents(annotate_time_period=annotate_time_period)
     response['primaryTitle'] = {
@@ -72,7 +129,7 @@ def get_topic(topic, with_links, annotate_links, with_refs, group_related, annot
                     response['links'][link_type_slug]['pluralTitle'] = link_type.get('pluralDisplayName', is_inverse)
     if with_refs:
         # sort by relevance and group similar refs
-        response['refs'].sort(key=cmp_to_key(sort_refs_by_relevance))
+        response['refs'].sort(key=relevance_sort_key)
         subset_ref_map = defaultdict(list)
         new_refs = []
         for link in response['refs']:
@@ -160,6 +217,17 @@ def sort_refs_by_relevance(a, b):
     return (bord.get('numDatasource', 0) * bord.get('tfidf', 0)) - (aord.get('numDatasource', 0) * aord.get('tfidf', 0))
 
 
+def relevance_sort_key(link):
+    """
+    Sort key that orders links as `sort_refs_by_relevance` does: links with an order first, then by pagerank and
+    weighted tfidf, descending
+    """
+    order = link.get('order', {})
+    if not order:
+        return 1, 0, 0
+    return 0, -order.get('pr', 0), -(order.get('numDatasource', 0) * order.get('tfidf', 0))
+
+
 def get_random_topic(good_to_promote=True) -> Optional[Topic]:
     query = {"good_to_promote": True} if good_to_promote else {}
     random_topic_dict = list(db.topics.aggregate([
@@ -398,7 +466,7 @@ def generate_sheet_topic_links():
 
 
 def calculate_tfidf_related_sheet_links(related_links):
-    import math
+    import numpy
 
     MIN_SCORE_THRESH = 0.1  # min tfidf score that will be saved in db
 
@@ -407,22 +475,24 @@ def calculate_tfidf_related_sheet_links(related_links):
         docs[l['a']][l['b']] = {"dir": 'to', 'count': l['user_votes'], 'id': '{}|{}'.format(l['a'], l['b'])}
         docs[l['b']][l['a']] = {"dir": 'from', 'count': l['user_votes'], 'id': '{}|{}'.format(l['a'], l['b'])}
 
+    # topic x topic matrix in coordinate form
+    slug_index = {slug: i for i, slug in enumerate(docs)}
+    entries = [(slug, counts) for slug, topic_counts in docs.items() for counts in topic_counts.values()]
+    rows = numpy.array([slug_index[slug] for slug, _ in entries], dtype=numpy.int64)
+    cols = numpy.array([slug_index[temp_slug] for slug, topic_counts in docs.items() for temp_slug in topic_counts], dtype=numpy.int64)
+    counts = numpy.array([c['count'] for _, c in entries], dtype=numpy.float64)
+
     # idf
-    doc_topic_counts = defaultdict(int)
-    doc_len = defaultdict(int)
-    for slug, topic_counts in docs.items():
-        for temp_slug, counts in topic_counts.items():
-            doc_topic_counts[temp_slug] += 1
-            doc_len[temp_slug] += counts['count']
-    idf_dict = {slug: math.log2(len(docs)/count) for slug, count in doc_topic_counts.items()}
+    doc_topic_counts = numpy.bincount(cols, minlength=len(docs))
+    doc_len = numpy.bincount(cols, weights=counts, minlength=len(docs))
+    with numpy.errstate(divide='ignore'):
+        idf = numpy.log2(len(docs) / doc_topic_counts)
 
     # tf-idf
+    scores = counts * idf[cols] / doc_len[rows]
     id_score_map = defaultdict(dict)
-    for slug, topic_counts in docs.items():
-        for temp_slug, counts in topic_counts.items():
-            id_score_map[counts['id']][counts['dir']] = {
-                "tfidf": (counts['count'] * idf_dict[temp_slug]) / doc_len[slug],
-            }
+    for (_, c), score in zip(entries, scores.tolist()):
+        id_score_map[c['id']][c['dir']] = {"tfidf": score}
 
     # filter
     final_related_links = []
@@ -475,85 +545,146 @@ def tokenize_words_for_tfidf(text, stopwords):
     return words
 
 
-def calculate_mean_tfidf(ref_topic_links):
-    import math
+def load_hebrew_texts(trefs):
+    """
+    :return: dict from each of `trefs` that is a valid Ref to its Hebrew text, as a string.
+    Texts are loaded with a TextChunkBatch per book, rather than a query per Ref.
+    """
+    orefs_by_title = defaultdict(list)
+    for tref in trefs:
+        oref = get_ref_safely(tref)
+        if oref is not None:
+            orefs_by_title[oref.index.title] += [(tref, oref)]
+    texts = {}
+    for title, orefs in tqdm(orefs_by_title.items(), desc='load text'):
+        batch = TextChunkBatch([oref for _, oref in orefs], langs=("he",))
+        for tref, oref in orefs:
+            texts[tref] = batch.get(oref, 'he').as_string()
+    return texts
+
+
+def tokenize_texts_for_tfidf(texts, stopwords, num_processes=1):
+    """
+    :return: list of the words of each of `texts`, as `tokenize_words_for_tfidf` returns them
+    """
+    import multiprocessing
+    from functools import partial
+
+    tokenize = partial(tokenize_words_for_tfidf, stopwords=stopwords)
+    if num_processes > 1:
+        with multiprocessing.get_context("fork").Pool(num_processes) as pool:
+            return list(tqdm(pool.imap(tokenize, texts, chunksize=100), total=len(texts), desc='tokenize'))
+    return [tokenize(text) for text in tqdm(texts, desc='tokenize')]
+
+
+def calculate_mean_tfidf(ref_topic_links, num_processes=None):
+    """
+    :param num_processes: number of processes to tokenize in.  Defaults to the number of CPUs.
+    :return: (dict from (topic, tref) to the mean tfidf of the words of tref in topic, dict from topic to its trefs)
+    """
+    import os
     with open('data/hebrew_stopwords.txt', 'r') as fin:
         stopwords = set()
         for line in fin:
             stopwords.add(line.strip())
 
     ref_topic_map = defaultdict(list)
-    ref_words_map = {}
-    for l in tqdm(ref_topic_links, total=len(ref_topic_links), desc='process text'):
+    for l in ref_topic_links:
         ref_topic_map[l.toTopic] += [l.ref]
-        if l.ref not in ref_words_map:
-            oref = get_ref_safely(l.ref)
-            if oref is None:
-                continue
 
-            ref_words_map[l.ref] = tokenize_words_for_tfidf(oref.text('he').as_string(), stopwords)
+    texts = load_hebrew_texts(list(dict.fromkeys(l.ref for l in ref_topic_links)))
+    words = tokenize_texts_for_tfidf(list(texts.values()), stopwords, num_processes or os.cpu_count() or 1)
+    ref_words_map = dict(zip(texts.keys(), words))
+    return calculate_mean_tfidf_scores(ref_topic_map, ref_words_map), ref_topic_map
 
-    # idf
-    doc_word_counts = defaultdict(int)
+
+def calculate_mean_tfidf_scores(ref_topic_map, ref_words_map):
+    """
+    Treating each topic as a document made of the words of its refs, scores each ref of a topic by the mean tfidf in
+    the topic of the words of the ref, leaving out the ref's own contribution to the term frequencies, so that a ref
+    can't influence its own score.
+    :param ref_topic_map: dict from topic to list of trefs.  A tref that is listed twice counts twice.
+    :param ref_words_map: dict from tref to list of its words.  Missing trefs have no words.
+    :return: dict from (topic, tref) to score.  Refs without words score 0.
+    """
+    import numpy
+
+    # term ids of the words of each ref
+    vocab = {}
+    ref_index = {}
+    ref_terms = []
+    for tref, words in ref_words_map.items():
+        ref_index[tref] = len(ref_terms)
+        ref_terms.append(numpy.array([vocab.setdefault(w, len(vocab)) for w in words], dtype=numpy.int64))
+    empty = numpy.zeros(0, dtype=numpy.int64)
+
+    # rows of the sparse topic x term matrix: the sorted term ids of each topic, with their counts
+    topic_rows = {}
+    doc_word_counts = numpy.zeros(len(vocab))
     for topic, ref_list in tqdm(ref_topic_map.items(), desc='idf'):
-        unique_words = set()
-        for tref in ref_list:
-            try:
-                words = ref_words_map[tref]
-            except KeyError:
-                print("Dont have {}".format(tref))
-                continue
-            for w in words:
-                if w not in unique_words:
-                    doc_word_counts[w] += 1
-                    unique_words.add(w)
-    idf_dict = {}
-    for w, count in doc_word_counts.items():
-        idf_dict[w] = math.log2(len(ref_topic_map)/count)
+        ids = [ref_terms[ref_index[tref]] for tref in ref_list if tref in ref_index]
+        terms, counts = numpy.unique(numpy.concatenate(ids) if ids else empty, return_counts=True)
+        topic_rows[topic] = (terms, counts)
+        doc_word_counts[terms] += 1
+    with numpy.errstate(divide='ignore'):
+        idf = numpy.log2(len(ref_topic_map) / doc_word_counts)
+
+    # each listing of a ref adds its term counts to the topic.  sum over the words of the ref of those counts * idf
+    self_weight = numpy.zeros(len(ref_terms))
+    for i, ids in enumerate(ref_terms):
+        terms, counts = numpy.unique(ids, return_counts=True)
+        self_weight[i] = numpy.dot(counts * counts, idf[terms])
 
     # tf-idf
     topic_tref_score_map = {}
-    top_words_map = {}
-    for topic, ref_list in ref_topic_map.items():
-        total_tf = defaultdict(int)
-        tref_tf = defaultdict(lambda: defaultdict(int))
-        for tref in ref_list:
-            words = ref_words_map.get(tref, [])
-            for w in words:
-                total_tf[w] += 1
-                tref_tf[tref][w] += 1
-        tfidf_dict = {}
-        for w, tf in total_tf.items():
-            tfidf_dict[w] = tf * idf_dict[w]
+    for topic, ref_list in tqdm(ref_topic_map.items(), desc='tfidf'):
+        terms, counts = topic_rows[topic]
+        tfidf = counts * idf[terms]
+        listings = defaultdict(int)
         for tref in ref_list:
-            words = ref_words_map.get(tref, [])
-            if len(words) == 0:
+            listings[tref] += 1
+        scored = []
+        for tref in listings:
+            if tref in ref_index and len(ref_terms[ref_index[tref]]) > 0:
+                scored += [tref]
+            else:
                 topic_tref_score_map[(topic, tref)] = 0
-                continue
-            # calculate avg tfidf - tfidf for words that appear in this tref
-            # so that tref can't influence score
-            topic_tref_score_map[(topic, tref)] = sum((tfidf_dict[w] - tref_tf[tref].get(w, 0)*idf_dict[w]) for w in words)/len(words)
-            # top_words_map[(topic, tref)] = [x[0] for x in sorted([(w, (tfidf_dict[w] - tref_tf[tref].get(w, 0)*idf_dict[w])) for w in words], key=lambda x: x[1], reverse=True)[:10]]
-    return topic_tref_score_map, ref_topic_map
+        if not scored:
+            continue
+        indexes = numpy.array([ref_index[tref] for tref in scored], dtype=numpy.int64)
+        lengths = numpy.array([len(ref_terms[i]) for i in indexes], dtype=numpy.int64)
+        ids = numpy.concatenate([ref_terms[i] for i in indexes])
+        word_tfidf = tfidf[numpy.searchsorted(terms, ids)]
+        sums = numpy.add.reduceat(word_tfidf, numpy.concatenate(([0], numpy.cumsum(lengths)[:-1])))
+        listed = numpy.array([listings[tref] for tref in scored])
+        scores = (sums - listed * self_weight[indexes]) / lengths
+        topic_tref_score_map.update(zip([(topic, tref) for tref in scored], scores.tolist()))
+    return topic_tref_score_map
 
 
 def calculate_pagerank_scores(ref_topic_map):
     from sefaria.pagesheetrank import pagerank_rank_ref_list
     pr_map = {}
     pr_seg_map = {}  # keys are (topic, seg_tref). used for sheet relevance
+    orefs = {}  # tref -> Ref or None.  Refs are shared by many topics, so are resolved once.
+    segment_refs = {}  # normal ref -> normal refs of its segments
     for topic, ref_list in tqdm(ref_topic_map.items(), desc='calculate pr'):
         oref_list = []
         for tref in ref_list:
-            oref = get_ref_safely(tref)
-            if oref is None:
+            if tref not in orefs:
+                orefs[tref] = get_ref_safely(tref)
+            if orefs[tref] is None:
                 continue
-            oref_list += [oref]
+            oref_list += [orefs[tref]]
 
         oref_pr_list = pagerank_rank_ref_list(oref_list, normalize=True)
         for oref, pr in oref_pr_list:
-            pr_map[(topic, oref.normal())] = pr
-            for seg_oref in oref.all_segment_refs():
-                pr_seg_map[(topic, seg_oref.normal())] = pr
+            nref = oref.normal()
+            pr_map[(topic, nref)] = pr
+            if nref not in segment_refs:
+                segment_refs[nref] = [seg_oref.normal() for seg_oref in oref.all_segment_refs()]
+            for seg_tref in segment_refs[nref]:
+                pr_seg_map[(topic, seg_tref)] = pr
     return pr_map, pr_seg_map
 
 
@@ -814,6 +945,8 @@ def recalculate_secondary_topic_data():
     ])
     add_num_sources_to_topics()
     make_titles_unique()
+    invalidate_all_topic_pages()
+    build_topic_pages()
 
 
 def set_all_slugs_to_primary_title():
@@ -144,6 +144,10 @@ EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 
 MONGO_HOST = "localhost"
 MONGO_PORT = 27017
+# Connection pool options and per request query accounting.  See sefaria/settings.py for the rest.
+# MONGO_MAX_POOL_SIZE = 100
+# MONGO_READ_PREFERENCE = "primary"
+# MONGO_QUERY_ACCOUNTING = True
 # Name of the MongoDB database to use.
 SEFARIA_DB = 'sefaria'
 # Leave user and password blank if not using Mongo Auth
@@ -209,12 +213,17 @@ CLOUDFLARE_ZONE = ""
 CLOUDFLARE_EMAIL = ""
 CLOUDFLARE_TOKEN = ""
 
+# Bounds on the in-process Ref cache, and the library snapshot file.  See sefaria/settings.py for the defaults.
+# REF_CACHE_MAX_ENTRIES = 500000
+# REF_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # estimated bytes
+# LIBRARY_SNAPSHOT_PATH = "/var/tmp/sefaria_library_snapshot.pickle"
+
 # Multiserver
 MULTISERVER_ENABLED = False
 MULTISERVER_REDIS_SERVER = "127.0.0.1"
 MULTISERVER_REDIS_PORT = 6379
 MULTISERVER_REDIS_DB = 0
-MULTISERVER_REDIS_EVENT_CHANNEL = "msync"   # Message queue on Redis
+MULTISERVER_REDIS_EVENT_STREAM = "msync-events"   # Event stream on Redis
 MULTISERVER_REDIS_CONFIRM_CHANNEL = "mconfirm"   # Message queue on Redis
 
 # OAUTH these fields dont need to be filled in. they are only required for oauth2client to __init__ successfully
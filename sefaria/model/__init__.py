@@ -18,8 +18,8 @@ from . import history, schema, text, link, note, layer, notification, queue, loc
 from .history import History, HistorySet, log_add, log_delete, log_update, log_text
 from .schema import deserialize_tree, Term, TermSet, TermScheme, TermSchemeSet, TitledTreeNode, SchemaNode, \
     ArrayMapNode, JaggedArrayNode, NumberedTitledTreeNode
-from .text import library, Index, IndexSet, Version, VersionSet, TextChunk, TextFamily, Ref, merge_texts
-from .link import Link, LinkSet, get_link_counts, get_book_link_collection, get_book_category_linkset
+from .text import library, Index, IndexSet, Version, VersionSet, VersionCatalog, TextChunk, TextChunkBatch, TextFamily, Ref, merge_texts
+from .link import Link, LinkSet, LinkSectionIndex, link_section_index, get_link_counts, get_book_link_collection, get_book_category_linkset
 from .note import Note, NoteSet
 from .layer import Layer, LayerSet
 from .notification import Notification, NotificationSet, GlobalNotification, GlobalNotificationSet
@@ -40,7 +40,7 @@ from .place import Place, PlaceSet
 from .person import Person, PersonSet, PersonRelationship, PersonRelationshipSet, PersonRelationshipType, PersonRelationshipTypeSet
 from .garden import Garden, GardenStop, GardenStopRelation, GardenSet, GardenStopSet, GardenStopRelationSet
 from .category import Category, CategorySet
-from .passage import Passage, PassageSet
+from .passage import Passage, PassageSet, passage_index
 from .ref_data import RefData, RefDataSet
 from .webpage import WebPage, WebPageSet
 from .media import Media, MediaSet
@@ -49,4 +49,5 @@ from .manuscript import Manuscript, ManuscriptSet, ManuscriptPage, ManuscriptPag
 
 from . import dependencies
 
-library._build_index_maps()
+if not library.load_snapshot():
+    library._build_index_maps()
@@ -320,6 +320,25 @@ class AbstractMongoSet(collections.abc.Iterable):
         self.max = None
         self._local_iter = None
 
+    @classmethod
+    def from_records(cls, records):
+        """
+        Builds a set around records that have already been loaded, without querying the database
+        :param records: list of instances of `recordClass`
+        """
+        obj = cls.__new__(cls)
+        obj.query = None
+        obj.record_kwargs = {}
+        obj.raw_records = None
+        obj.hint = None
+        obj.limit = 0
+        obj.skip = 0
+        obj.records = list(records)
+        obj.current = 0
+        obj.max = len(obj.records)
+        obj._local_iter = None
+        return obj
+
     def __iter__(self):
         self._read_records()
         return iter(self.records)
@@ -13,6 +13,7 @@ from django.contrib.auth.models import User
 from sefaria.model import *
 from sefaria.model.schema import SheetLibraryNode
 from sefaria.utils import hebrew
+from sefaria.utils.mapped_trie import MappedTrie
 from sefaria.system.database import db
 
 import logging
@@ -185,9 +186,32 @@ class AutoCompleter(object):
             self.spell_checker.train_phrases(forms)
             self.ngram_matcher.train_phrases(forms, normal_forms)
 
+    def __getstate__(self):
+        # Used when the library is snapshotted.  The library is not part of the snapshot, and normalizers are lambdas.
+        state = self.__dict__.copy()
+        del state["library"]
+        del state["normalizer"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.library = library
+        self.normalizer = normalizer(self.lang)
+
     def set_other_lang_ac(self, ac):
         self.other_lang_ac = ac
 
+    def map_tries(self, path_prefix):
+        """
+        Replaces the title trie, and the tries and dictionaries of the ngram matcher and spell checker, with read only
+        MappedTries written to files beginning with `path_prefix`.  Processes that load these MappedTries (e.g. from
+        a library snapshot) share the files' pages, rather than each holding a copy.
+        The auto completer can't be trained further after this.
+        """
+        self.title_trie = MappedTrie.build(path_prefix + "-titles.trie", self.title_trie.items())
+        self.ngram_matcher.map_tries(path_prefix)
+        self.spell_checker.map_tries(path_prefix)
+
     @staticmethod
     def _get_main_categories(otoc):
         cats = []
@@ -425,14 +449,28 @@ class Completions(object):
 class LexiconTrie(datrie.Trie):
     dict_letter_scope = "\u05b0\u05b4\u05b5\u05b6\u05b7\u05b8\u05b9\u05bc\u05c1\u05d0\u05d1\u05d2\u05d3\u05d4\u05d5\u05d6\u05d7\u05d8\u05d9\u05da\u05db\u05dc\u05dd\u05de\u05df\u05e0\u05e1\u05e2\u05e3\u05e4\u05e5\u05e6\u05e7\u05e8\u05e9\u05ea\u05f3\u05f4\u200e\u200f\u2013\u201d\ufeff`' \""
 
-    def __init__(self, lexicon_name):
+    def __init__(self, lexicon_name, items=None):
+        """
+        :param lexicon_name:
+        :param items: list of (key, headword) tuples.  If passed, the trie is built from these, rather than the database.
+        """
         super(LexiconTrie, self).__init__(self.dict_letter_scope)
+        self.lexicon_name = lexicon_name
+
+        if items is not None:
+            for k, v in items:
+                self[k] = v
+            return
 
         for entry in LexiconEntrySet({"parent_lexicon": lexicon_name}, sort=[("_id", -1)]):
             self[hebrew.strip_nikkud(entry.headword)] = entry.headword
             for ahw in getattr(entry, "alt_headwords", []):
                 self[hebrew.strip_nikkud(ahw)] = entry.headword
 
+    def __reduce__(self):
+        # datrie pickles subclasses as plain datrie.Trie objects.  Keep the class, and don't go back to the database on load.
+        return self.__class__, (self.lexicon_name, self.items())
+
 
 class TitleTrie(datrie.Trie):
     """
@@ -452,6 +490,17 @@ class TitleTrie(datrie.Trie):
         self.lang = lang
         self.normalizer = normalizer(lang)
 
+    def __reduce__(self):
+        # datrie pickles subclasses as plain datrie.Trie objects.  Keep the class and its attributes.
+        return self.__class__._from_items, (self.lang, self.items())
+
+    @classmethod
+    def _from_items(cls, lang, items):
+        trie = cls(lang)
+        for k, v in items:
+            datrie.Trie.__setitem__(trie, k, v)
+        return trie
+
     def __setitem__(self, key, value):
         try:
             item = self[key]
@@ -517,7 +566,15 @@ class SpellChecker(object):
     """
     Utilities to find small edits of a given string,
     and also to find edits of a given string that result in words in our title list.
+
+    Words within `max_edit_distance` edits of a string are found with a symmetric delete index (as in SymSpell):
+    each word is stored under every variant of its first `prefix_length` characters with up to `max_edit_distance`
+    characters deleted.  The variants of a misspelling lead to the candidate words, which are then checked with
+    the true edit distance.  As in `single_edits()`, the first letter is never edited.
     """
+    max_edit_distance = 2
+    prefix_length = 7
+
     def __init__(self, lang):
         assert lang in ["en", "he"]
         self.lang = lang
@@ -527,6 +584,16 @@ class SpellChecker(object):
         else:
             self.letters = hebrew.ALPHABET_22 + hebrew.GERESH + hebrew.GERSHAYIM + '".' + "'"
         self.WORDS = defaultdict(int)
+        self.deletes = {}  # delete variant -> list of words
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["normalizer"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.normalizer = normalizer(self.lang)
 
     def train_phrases(self, phrases):
         """
@@ -537,8 +604,64 @@ class SpellChecker(object):
             for w in splitter.split(p):
                 if not w:
                     continue
+                if w not in self.WORDS:
+                    for variant in self._delete_variants(w, self.max_edit_distance):
+                        self.deletes.setdefault(variant, []).append(w)
                 self.WORDS[w] += 1
 
+    def map_tries(self, path_prefix):
+        """
+        Replaces WORDS and the delete index with MappedTries.  See :meth:`AutoCompleter.map_tries`
+        """
+        self.WORDS = MappedTrie.build(path_prefix + "-words.trie", self.WORDS.items())
+        self.deletes = MappedTrie.build(path_prefix + "-deletes.trie", self.deletes.items())
+
+    def _delete_variants(self, word, distance):
+        """`word`, cut to `prefix_length`, with up to `distance` characters other than the first deleted."""
+        word = word[:self.prefix_length]
+        variants = frontier = {word}
+        for _ in range(distance):
+            frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(1, len(w))}
+            variants = variants | frontier
+        return variants
+
+    @staticmethod
+    def _edit_distance(a, b, max_distance):
+        """
+        Optimal string alignment distance (deletes, inserts, replaces and adjacent transposes) between `a` and `b`,
+        or `max_distance` + 1 if it is more than `max_distance`.
+        """
+        if abs(len(a) - len(b)) > max_distance:
+            return max_distance + 1
+        prev2, prev = None, list(range(len(b) + 1))
+        for i in range(1, len(a) + 1):
+            cur = [i] + [0] * len(b)
+            for j in range(1, len(b) + 1):
+                cost = 0 if a[i - 1] == b[j - 1] else 1
+                cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+                if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                    cur[j] = min(cur[j], prev2[j - 2] + 1)
+            if min(cur) > max_distance:
+                return max_distance + 1
+            prev2, prev = prev, cur
+        return min(prev[-1], max_distance + 1)
+
+    def known_edits(self, word, max_distance=None):
+        """
+        :return dict: words in WORDS that are within `max_distance` edits of `word`, other than its first letter,
+        to their distance from `word`
+        """
+        max_distance = self.max_edit_distance if max_distance is None else min(max_distance, self.max_edit_distance)
+        if not word:
+            return {}
+        known = {}
+        for variant in self._delete_variants(word, max_distance):
+            for candidate in self.deletes.get(variant, ()):
+                if candidate in known or candidate[0] != word[0]:
+                    continue
+                known[candidate] = self._edit_distance(word[1:], candidate[1:], max_distance)
+        return {w: d for w, d in known.items() if d <= max_distance}
+
     def single_edits(self, word, hold_first_letter=True):
         """All edits that are one edit away from `word`."""
         start      = 1 if hold_first_letter else 0
@@ -550,16 +673,37 @@ class SpellChecker(object):
         return set(deletes + transposes + replaces + inserts)
 
     def _known_edits2(self, word):
-        """All edits that are two edits away from `word`."""
-        return (e2 for e1 in self.single_edits(word) for e2 in self.single_edits(e1) if e2 in self.WORDS)
+        """All words in WORDS that are up to two edits away from `word`."""
+        return (w for w in self.known_edits(word, 2))
 
     def _known(self, words):
         """The subset of `words` that appear in the dictionary of WORDS."""
         return set(w for w in words if w in self.WORDS)
 
+    @staticmethod
+    def token_edit_distance(token):
+        """
+        :return int: the most edits allowed when correcting `token`.  Short tokens are close to too many words to be
+        corrected far: none for up to 2 characters, 1 for up to 4, and 2 for longer tokens.
+        """
+        if len(token) <= 2:
+            return 0
+        if len(token) <= 4:
+            return 1
+        return 2
+
     def correct_token(self, token):
-        candidates = self._known([token]) or self._known(self.single_edits(token)) or [token] #self._known_edits2(token) or [token]
-        return max(candidates, key=self.WORDS.get)
+        if token in self.WORDS:
+            return token
+        max_distance = self.token_edit_distance(token)
+        if not max_distance:
+            return token
+        known = self.known_edits(token, max_distance)
+        if not known:
+            return token
+        # The closest words, and of those the most common
+        distance = min(known.values())
+        return max(sorted(w for w, d in known.items() if d == distance), key=self.WORDS.get)
 
     def correct_phrase(self, text):
         normal_text = self.normalizer(text)
@@ -581,6 +725,15 @@ class NGramMatcher(object):
         self.token_to_titles = defaultdict(list)
         self.token_trie = datrie.BaseTrie(letter_scope)
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["normalizer"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.normalizer = normalizer(self.lang)
+
     def train_phrases(self, titles, normal_titles):
         for title, normal_title in zip(titles, normal_titles):
             tokens = splitter.split(normal_title)
@@ -591,6 +744,12 @@ class NGramMatcher(object):
         for k in list(self.token_to_titles.keys()):
             self.token_trie[k] = 1
 
+    def map_tries(self, path_prefix):
+        """
+        Replaces the token trie and the titles of each token with one MappedTrie.  See :meth:`AutoCompleter.map_tries`
+        """
+        self.token_trie = self.token_to_titles = MappedTrie.build(path_prefix + "-tokens.trie", self.token_to_titles.items())
+
     def _get_real_tokens_from_possible_n_grams(self, tokens):
         return list({k for token in tokens for k in self.token_trie.keys(token)})
 
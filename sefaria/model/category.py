@@ -321,7 +321,10 @@ class TocTree(object):
         del self._path_hash[tuple(toc_node.categories + [toc_node.primary_title()])]
         toc_node.detach()
 
-    def update_title(self, index, old_ref=None, recount=True):
+    def update_title(self, index, old_ref=None, recount=True, changed_ref=None):
+        """
+        :param changed_ref: optional.  Ref to changed text.  If passed, only its sections are recounted.
+        """
         title = old_ref or index.title
         node = self.lookup(index.categories, title)
 
@@ -332,7 +335,10 @@ class TocTree(object):
             except BookNameError:
                 logger.warning("Failed to find VersionState for {} in TocTree.update_title()".format(title))
                 return
-            vs.refresh()
+            if changed_ref:
+                vs.refresh_ref(changed_ref)
+            else:
+                vs.refresh()
             sn = vs.state_node(index.nodes)
             self._vs_lookup[title] = {
                 "first_section_ref": vs.first_section_ref,
@@ -2,7 +2,7 @@
 dependencies.py -- list cross model dependencies and subscribe listeners to changes.
 """
 
-from . import abstract, link, note, history, schema, text, layer, version_state, timeperiod, person, garden, notification, story, collection, library, category, ref_data, user_profile, manuscript
+from . import abstract, link, note, history, schema, text, layer, version_state, timeperiod, person, garden, notification, story, collection, library, category, ref_data, user_profile, manuscript, webpage, topic, passage, lexicon
 
 from .abstract import subscribe, cascade, cascade_to_list, cascade_delete, cascade_delete_to_list
 import sefaria.system.cache as scache
@@ -57,6 +57,14 @@ def process_version_title_change_in_search(ver, **kwargs):
             # TextIndexer.index_ref(search_index_name_merged, ref, None, ver.language, True)
 
 
+# Version Save / Delete
+subscribe(text.process_version_change_in_catalog,                       text.Version, "save")
+subscribe(text.process_version_change_in_catalog,                       text.Version, "delete")
+
+# WordForm Save / Delete
+subscribe(lexicon.process_word_form_change_in_lookup_cache,             lexicon.WordForm, "save")
+subscribe(lexicon.process_word_form_change_in_lookup_cache,             lexicon.WordForm, "delete")
+
 # Version Title Change
 subscribe(history.process_version_title_change_in_history,              text.Version, "attributeChange", "versionTitle")
 subscribe(process_version_title_change_in_search,                       text.Version, "attributeChange", "versionTitle")
@@ -65,6 +73,44 @@ subscribe(cascade(notification.GlobalNotificationSet, "content.version"), text.V
 subscribe(cascade_delete(notification.GlobalNotificationSet, "content.version", "versionTitle"),   text.Version, "delete")
 
 
+# Related content bundles
+def process_ref_change_in_related_bundles(obj, **kwargs):
+    from sefaria.client.wrapper import invalidate_related_bundles
+    invalidate_related_bundles(obj.refs if hasattr(obj, "refs") else [obj.ref])
+
+subscribe(process_ref_change_in_related_bundles,                        link.Link, "save")
+subscribe(process_ref_change_in_related_bundles,                        link.Link, "delete")
+subscribe(process_ref_change_in_related_bundles,                        webpage.WebPage, "save")
+subscribe(process_ref_change_in_related_bundles,                        webpage.WebPage, "delete")
+subscribe(process_ref_change_in_related_bundles,                        topic.RefTopicLink, "save")
+subscribe(process_ref_change_in_related_bundles,                        topic.RefTopicLink, "delete")
+
+
+# Topic pages
+def process_topic_link_change_in_topic_pages(link, **kwargs):
+    from sefaria.helper.topic import invalidate_topic_pages
+    invalidate_topic_pages([getattr(link, "fromTopic", None), link.toTopic])
+
+
+def process_topic_change_in_topic_pages(topic_obj, **kwargs):
+    from sefaria.helper.topic import invalidate_topic_pages
+    invalidate_topic_pages([topic_obj.slug], with_linked=True)
+
+subscribe(process_topic_link_change_in_topic_pages,                     topic.RefTopicLink, "save")
+subscribe(process_topic_link_change_in_topic_pages,                     topic.RefTopicLink, "delete")
+subscribe(process_topic_link_change_in_topic_pages,                     topic.IntraTopicLink, "save")
+subscribe(process_topic_link_change_in_topic_pages,                     topic.IntraTopicLink, "delete")
+subscribe(process_topic_change_in_topic_pages,                          topic.Topic, "save")
+subscribe(process_topic_change_in_topic_pages,                          topic.Topic, "delete")
+
+# Link Delete (Link.save() updates the section index itself)
+subscribe(link.process_link_delete_in_section_index,                    link.Link, "delete")
+
+# Passage Save / Delete
+subscribe(passage.process_passage_change_in_segment_index,              passage.Passage, "save")
+subscribe(passage.process_passage_change_in_segment_index,              passage.Passage, "delete")
+
+
 # Note Delete
 subscribe(layer.process_note_deletion_in_layer,                         note.Note, "delete")
 
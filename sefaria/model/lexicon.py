@@ -5,9 +5,12 @@ Writes to MongoDB Collection: word_form, lexicon_entry
 import re
 import unicodedata
 from . import abstract as abst
+import sefaria.system.cache as scache
+from sefaria.system.database import db
 from sefaria.datatype.jagged_array import JaggedTextArray
 from sefaria.system.exceptions import InputError
 from sefaria.utils.hebrew import is_hebrew, strip_cantillation, has_cantillation
+from sefaria.settings import LEXICON_FORM_CACHE_MAX_ENTRIES, LEXICON_FORM_CACHE_TIMEOUT
 
 
 class WordForm(abst.AbstractMongoRecord):
@@ -288,6 +291,15 @@ class LexiconEntrySet(abst.AbstractMongoSet):
 
 
 class LexiconLookupAggregator(object):
+    """
+    Finds the lexicon entries of a word or phrase through the WordForms of it and of its n-grams.
+
+    The WordForms of all candidate strings of a lookup are fetched with one query, and the records of each string are
+    kept in an in-process cache.  The cache is invalidated when a WordForm is saved or deleted, in any process.
+    """
+    generation_key = "lexicon-word-forms"
+    _form_cache = scache.InMemoryCache(timeout=LEXICON_FORM_CACHE_TIMEOUT, max_entries=LEXICON_FORM_CACHE_MAX_ENTRIES)
+    _generations = scache.SharedGenerations(check_interval=60)
 
     @classmethod
     def _split_input(cls, input_str):
@@ -302,10 +314,25 @@ class LexiconLookupAggregator(object):
         return gram_list
 
     @classmethod
-    def get_word_form_objects(cls, input_word, lookup_key='form', **kwargs):
-        from sefaria.model import Ref
+    def _unique_ngrams(cls, input_str):
+        """
+        :return: the n-grams that `_ngram_lookup` looks up, longest first, each once
+        """
+        words = cls._split_input(input_str)
+        ngrams = []
+        seen = set()
+        for i in reversed(list(range(len(words)))):
+            for ng in cls._create_ngrams(words, i):
+                if ng not in seen:
+                    seen.add(ng)
+                    ngrams.append(ng)
+        return ngrams
 
-        lookup_ref = kwargs.get("lookup_ref", None)
+    @classmethod
+    def _form_key(cls, input_word, lookup_key='form'):
+        """
+        :return: (field, value) of the WordForms of `input_word`
+        """
         wform_pkey = lookup_key
         if is_hebrew(input_word):
             # This step technically used to happen in the lookup main method `lexicon_lookup` if there were no initial results, but in case where a
@@ -313,54 +340,130 @@ class LexiconLookupAggregator(object):
             input_word = strip_cantillation(input_word)
             if not has_cantillation(input_word, detect_vowels=True):
                 wform_pkey = 'c_form'
+        return wform_pkey, input_word
+
+    @classmethod
+    def _ref_prefix(cls, lookup_ref):
+        from sefaria.model import Ref
+        return Ref(lookup_ref).normal() if lookup_ref else None
+
+    @classmethod
+    def get_word_form_objects(cls, input_word, lookup_key='form', **kwargs):
+        lookup_ref = kwargs.get("lookup_ref", None)
+        wform_pkey, input_word = cls._form_key(input_word, lookup_key)
         query_obj = {wform_pkey: input_word}
         if lookup_ref:
-            nref = Ref(lookup_ref).normal()
-            query_obj["refs"] = {'$regex': '^{}'.format(nref)}
+            # An anchored regex of literal characters is a prefix range on the `refs` index
+            query_obj["refs"] = {'$regex': '^{}'.format(re.escape(cls._ref_prefix(lookup_ref)))}
         forms = WordFormSet(query_obj)
         if lookup_ref and len(forms) == 0:
             del query_obj["refs"]
             forms = WordFormSet(query_obj)
         return forms
 
+    @classmethod
+    def _forms_query(cls, keys):
+        """
+        :param keys: list of (field, value), as returned by `_form_key`
+        :return: query for the WordForms of `keys`
+        """
+        clauses = []
+        for field in ("form", "c_form"):
+            values = sorted({value for f, value in keys if f == field})
+            if values:
+                clauses.append({field: {"$in": values}})
+        return clauses[0] if len(clauses) == 1 else {"$or": clauses}
 
     @classmethod
-    def _single_lookup(cls, input_word, lookup_key='form', **kwargs):
-        forms = cls.get_word_form_objects(input_word, lookup_key=lookup_key, **kwargs)
-        if len(forms) > 0:
-            headword_query = []
-            for form in forms:
-                for lookup in form.lookups:
-                    headword_query.append(lookup)
-            return headword_query
-        else:
-            return []
+    def _load_forms(cls, keys):
+        """
+        Fetches the WordForm records of `keys` that aren't cached, with one query, and caches them.
+        Only the fields needed for lookups are fetched.  The `refs` of a WordForm can be long, and are checked in the
+        query of `_forms_in_ref` instead.
+        :param keys: list of (field, value), as returned by `_form_key`
+        :return: dict from each key to the list of its WordForm records, with `_id`, `form`, `c_form` and `lookups`
+        """
+        generation = cls._generations.get(cls.generation_key)
+        forms = {}
+        missing = set()
+        for key in keys:
+            records = cls._form_cache.get((generation,) + key)
+            if records is None:
+                missing.add(key)
+            else:
+                forms[key] = records
+        if missing:
+            found = {key: [] for key in missing}
+            for record in db.word_form.find(cls._forms_query(missing), {"form": 1, "c_form": 1, "lookups": 1}):
+                for key in (("form", record.get("form")), ("c_form", record.get("c_form"))):
+                    if key in found:
+                        found[key].append(record)
+            for key, records in found.items():
+                cls._form_cache.set((generation,) + key, records)
+                forms[key] = records
+        return forms
 
     @classmethod
-    def _ngram_lookup(cls, input_str, **kwargs):
-        words = cls._split_input(input_str)
-        input_length = len(words)
+    def _forms_in_ref(cls, keys, lookup_ref):
+        """
+        :param keys: list of (field, value), as returned by `_form_key`
+        :return: set of the _ids of the WordForms of `keys` that occur in `lookup_ref`
+        """
+        query = dict(cls._forms_query(keys))
+        # An anchored regex of literal characters is a prefix range on the `refs` index
+        query["refs"] = {'$regex': '^{}'.format(re.escape(cls._ref_prefix(lookup_ref)))}
+        return {record["_id"] for record in db.word_form.find(query, {"_id": 1})}
+
+    @classmethod
+    def _single_lookup(cls, input_word, lookup_key='form', forms=None, in_ref=None, **kwargs):
+        """
+        :param forms: WordForm records already fetched by `_load_forms`, if any
+        :param in_ref: _ids of WordForms that occur in `lookup_ref`, already fetched by `_forms_in_ref`, if any
+        :return: list of the lookups of the WordForms of `input_word`.  If there is a `lookup_ref`, only those of the
+        WordForms that occur in it, unless there are none.
+        """
+        key = cls._form_key(input_word, lookup_key)
+        records = (forms if forms is not None and key in forms else cls._load_forms([key]))[key]
+        lookup_ref = kwargs.get("lookup_ref", None)
+        if lookup_ref and records:
+            if in_ref is None:
+                in_ref = cls._forms_in_ref([key], lookup_ref)
+            records = [r for r in records if r["_id"] in in_ref] or records
+        # Copies, as lexicon_lookup() modifies them, and the records are cached
+        return [dict(lookup) for r in records for lookup in r["lookups"]]
+
+    @classmethod
+    def _ngram_lookup(cls, input_str, forms=None, in_ref=None, **kwargs):
         queries = []
-        for i in reversed(list(range(input_length))):
-            ngrams = cls._create_ngrams(words, i)
-            for ng in ngrams:
-                res = cls._single_lookup(ng, **kwargs)
-                if res:
-                    queries += res
+        for ng in cls._unique_ngrams(input_str):
+            queries += cls._single_lookup(ng, forms=forms, in_ref=in_ref, **kwargs)
         return queries
 
+    @classmethod
+    def invalidate(cls):
+        cls._generations.bump([cls.generation_key])
+
+    @classmethod
+    def stats(cls):
+        return cls._form_cache.stats()
+
     @classmethod
     def lexicon_lookup(cls, input_str, **kwargs):
         input_str = unicodedata.normalize("NFC", input_str)
-        results = cls._single_lookup(input_str, **kwargs)
+        consonants = strip_cantillation(input_str, True)
+        keys = [cls._form_key(input_str), cls._form_key(consonants, 'c_form')]
+        if not kwargs.get('never_split', None):
+            keys += [cls._form_key(ng) for ng in cls._unique_ngrams(input_str)]
+        forms = cls._load_forms(keys)
+        in_ref = cls._forms_in_ref(keys, kwargs["lookup_ref"]) if kwargs.get("lookup_ref", None) else None
+        results = cls._single_lookup(input_str, forms=forms, in_ref=in_ref, **kwargs)
         if not results or kwargs.get('always_consonants', False):
-            results += cls._single_lookup(strip_cantillation(input_str, True), lookup_key='c_form', **kwargs)
+            results += cls._single_lookup(consonants, lookup_key='c_form', forms=forms, in_ref=in_ref, **kwargs)
         if not kwargs.get('never_split', None) and (len(results) == 0 or kwargs.get("always_split", None)):
-            ngram_results = cls._ngram_lookup(input_str, **kwargs)
+            ngram_results = cls._ngram_lookup(input_str, forms=forms, in_ref=in_ref, **kwargs)
             results += ngram_results
         if len(results):
             primary_tuples = set()
-            query = set() #TODO: optimize number of word form lookups? there can be a lot of duplicates... is it needed?
             for r in results:
                 # extract the lookups with "primary" field so it can be used for sorting lookup in the LexiconEntrySet,
                 # but also delete it, because its not part of the query obj
@@ -371,3 +474,7 @@ class LexiconLookupAggregator(object):
             return LexiconEntrySet({"$or": results}, primary_tuples=primary_tuples)
         else:
             return None
+
+
+def process_word_form_change_in_lookup_cache(word_form, **kwargs):
+    LexiconLookupAggregator.invalidate()
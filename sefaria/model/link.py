@@ -4,6 +4,9 @@ Writes to MongoDB Collection: links
 """
 
 import regex as re
+import time
+from datetime import datetime
+from collections import defaultdict
 from bson.objectid import ObjectId
 from sefaria.model.text import AbstractTextRecord
 from sefaria.system.exceptions import DuplicateRecordError, InputError, BookNameError
@@ -60,6 +63,14 @@ class Link(abst.AbstractMongoRecord):
 
         return True
 
+    def save(self, override_dependencies=False):
+        """
+        Also updates the link section index, even with `override_dependencies`, as LinkSet finds links through it.
+        """
+        super(Link, self).save(override_dependencies=override_dependencies)
+        link_section_index.add(self)
+        return self
+
     def _pre_save(self):
         if getattr(self, "_id", None) is None:
             # Don't bother saving a connection that already exists, or that has a more precise link already
@@ -162,13 +173,37 @@ class LinkSet(abst.AbstractMongoSet):
         and will use the :py:meth: `sefaria.text.Ref.regex()` method to return the set of Links that refer to that Ref or below.
         :param query_or_ref: A query dict, or a :py:class: `sefaria.text.Ref` object
         '''
+        self._positions = None
         try:
             regex_list = query_or_ref.regex(as_list=True)
+        except AttributeError:
+            super(LinkSet, self).__init__(query_or_ref, page, limit)
+            return
+
+        self._positions = link_section_index.positions(query_or_ref)
+        if self._positions is not None:
+            super(LinkSet, self).__init__({"_id": {"$in": list(self._positions)}}, page, limit)
+        else:
             ref_clauses = [{"expandedRefs0": {"$regex": r}} for r in regex_list]
             ref_clauses += [{"expandedRefs1": {"$regex": r}} for r in regex_list]
             super(LinkSet, self).__init__({"$or": ref_clauses}, page, limit)
-        except AttributeError:
-            super(LinkSet, self).__init__(query_or_ref, page, limit)
+
+    def position(self, link):
+        """
+        For a LinkSet initialized with a Ref, and answered from the link section index,
+        the position (0 or 1) in `link.refs` of the side that is within that Ref.  If both are, 0.
+        :return: int, or None if not known
+        """
+        positions = getattr(self, "_positions", None)
+        if positions is None:
+            return None
+        return positions.get(link._id)
+
+    def delete(self, force=False, bulk_delete=False):
+        if bulk_delete:
+            # Bulk deletion doesn't trigger dependencies, so remove these links from the index here
+            link_section_index.remove(self.distinct("_id"))
+        super(LinkSet, self).delete(force=force, bulk_delete=bulk_delete)
 
     def filter(self, sources):
         """
@@ -275,6 +310,206 @@ class LinkSet(abst.AbstractMongoSet):
         return [{"name": key, "count": results[key]["count"], "books": results[key]["books"] } for key in list(results.keys())]
 
 
+class LinkSectionIndex(object):
+    """
+    Materialized view of the links collection by section.
+    Writes to MongoDB Collection: link_sections
+
+    For each side of each link, there is one record per section of the text that the side covers:
+        {"section": "Genesis 1", "link": <link _id>, "pos": 0, "segments": ["Genesis 1:3"],
+         "anchor": "Genesis 1:3", "other": "Rashi on Genesis 1:3:1"}
+    `segments` are the link's `expandedRefs` within the section.  `anchor` is the link ref on this side,
+    and `other` the link ref on the other side.
+
+    Links to section or segment level Refs are found by equality on `section`, rather than by regex over
+    `expandedRefs0` and `expandedRefs1`.  Records are kept current on Link save and delete, and on
+    `LinkSet.delete()`.  Until the collection has been built with `rebuild()`, `positions()` returns None and
+    LinkSet falls back to regex queries.
+
+    Writes to the links collection that don't go through Link or LinkSet (raw `db.links` writes) must update the
+    index themselves, with `add()` or `remove()` for the links written, or be followed by `rebuild()`.  Otherwise
+    LinkSet won't find the links they add or change.
+    """
+    collection = "link_sections"
+    built_marker = "__built__"
+    check_interval = 60
+
+    def __init__(self):
+        self._ready = False
+        self._checked_at = 0
+
+    def _collection(self):
+        return getattr(db, self.collection)
+
+    def ready(self):
+        """
+        :return bool: True if the collection has been built.  Checked at most every `check_interval` seconds.
+        """
+        now = time.time()
+        if not self._ready and now - self._checked_at >= self.check_interval:
+            self._ready = self._collection().find_one({"_id": self.built_marker}, {"_id": 1}) is not None
+            self._checked_at = now
+        return self._ready
+
+    @staticmethod
+    def _section_of(tref):
+        return text.Ref(tref).section_ref().normal()
+
+    @staticmethod
+    def _section_of_segment_string(tref):
+        """
+        :param tref: normal segment ref, as stored in `expandedRefs`
+        :return: the normal ref of its section, from the string alone.  For links whose refs can't be parsed,
+        e.g. while an Index title change cascades to links.
+        """
+        return tref.rsplit(":", 1)[0] if ":" in tref else tref.rsplit(" ", 1)[0]
+
+    @classmethod
+    def records_for_link(cls, link_id, refs, expanded_refs):
+        """
+        :param link_id: _id of the link
+        :param refs: `refs` of the link
+        :param expanded_refs: [`expandedRefs0`, `expandedRefs1`] of the link
+        :return: list of index records for the link
+        """
+        records = []
+        for pos in (0, 1):
+            segments_by_section = defaultdict(list)
+            try:
+                oref = text.Ref(refs[pos])
+                if oref.is_segment_level() and not oref.is_spanning():
+                    # The common case - every segment is in one section
+                    section = oref.section_ref().normal()
+                    segments_by_section[section] = list(expanded_refs[pos])
+                else:
+                    for tref in expanded_refs[pos]:
+                        segments_by_section[cls._section_of(tref)].append(tref)
+            except (InputError, AttributeError, IndexError) as e:
+                # Index the link anyway, as the index is the only way that LinkSet finds links
+                logger.warning("Can't parse link {} - {}, indexing it by its expanded refs: {}".format(refs[0], refs[1], e))
+                segments_by_section = defaultdict(list)
+                for tref in expanded_refs[pos]:
+                    segments_by_section[cls._section_of_segment_string(tref)].append(tref)
+            records += [{
+                "section": section,
+                "link": link_id,
+                "pos": pos,
+                "segments": segments,
+                "anchor": refs[pos],
+                "other": refs[1 - pos],
+            } for section, segments in segments_by_section.items()]
+        return records
+
+    def add(self, link):
+        """
+        Replaces the index records of `link`.
+        """
+        self._collection().delete_many({"link": link._id})
+        records = self.records_for_link(link._id, link.refs,
+                                        [getattr(link, "expandedRefs0", []), getattr(link, "expandedRefs1", [])])
+        if records:
+            self._collection().insert_many(records, ordered=False)
+
+    def remove(self, link_ids):
+        self._collection().delete_many({"link": {"$in": list(link_ids)}})
+
+    def rebuild(self, verbose=False):
+        """
+        Builds the collection from scratch, in a temporary collection which then replaces it.
+        Links added while the build runs are indexed again after the swap.
+        """
+        started = ObjectId.from_datetime(datetime.utcnow())
+        tmp = getattr(db, self.collection + "_tmp")
+        tmp.drop()
+        batch = []
+        for i, record in enumerate(db.links.find({}, {"refs": 1, "expandedRefs0": 1, "expandedRefs1": 1})):
+            batch += self.records_for_link(record["_id"], record["refs"],
+                                           [record.get("expandedRefs0", []), record.get("expandedRefs1", [])])
+            if len(batch) >= 10000:
+                tmp.insert_many(batch, ordered=False)
+                batch = []
+            if verbose and i % 100000 == 0:
+                print("Indexed {} links".format(i))
+        if batch:
+            tmp.insert_many(batch, ordered=False)
+        tmp.insert_one({"_id": self.built_marker})
+        tmp.create_index("section")
+        tmp.create_index("link")
+        tmp.rename(self.collection, dropTarget=True)
+        for link in LinkSet({"_id": {"$gte": started}}):
+            self.add(link)
+        self._ready = True
+
+    def _lookup(self, oref):
+        """
+        :return: list of (section, set of segment refs or None for the whole section) covered by `oref`,
+        or None if `oref` is above section level
+        """
+        if not (oref.is_section_level() or oref.is_segment_level()):
+            return None
+        lookup = []
+        for sub_ref in oref.split_spanning_ref():
+            if sub_ref.is_section_level():
+                lookup.append((sub_ref.normal(), None))
+            else:
+                segments = sub_ref.range_list() if sub_ref.is_range() else [sub_ref]
+                lookup.append((sub_ref.section_ref().normal(), {r.normal() for r in segments}))
+        return lookup
+
+    def records(self, oref):
+        """
+        :return: list of the index records of the link sides within `oref`,
+        or None if `oref` is above section level or the index isn't built
+        """
+        if not self.ready():
+            return None
+        try:
+            lookup = self._lookup(oref)
+        except (InputError, AttributeError):
+            return None
+        if lookup is None:
+            return None
+        segments_of = {}  # section -> set of segment refs within `oref`, or None for the whole section
+        for section, segments in lookup:
+            if segments is None or segments_of.get(section, set()) is None:
+                segments_of[section] = None
+            else:
+                segments_of[section] = segments_of.get(section, set()) | segments
+        records = self._collection().find({"section": {"$in": list(segments_of)}}, {"_id": 0})
+        return [r for r in records
+                if segments_of[r["section"]] is None or segments_of[r["section"]].intersection(r["segments"])]
+
+    def positions(self, oref):
+        """
+        :return: dict from _id of each link with a side within `oref` to the position of that side (0 if both are),
+        or None if the index can't answer for `oref`
+        """
+        records = self.records(oref)
+        if records is None:
+            return None
+        positions = {}
+        for record in records:
+            positions[record["link"]] = min(record["pos"], positions.get(record["link"], 1))
+        return positions
+
+    def linked_refs(self, oref):
+        """
+        :return: set of the refs on the other side of links with a side within `oref`,
+        or None if the index can't answer for `oref`
+        """
+        records = self.records(oref)
+        if records is None:
+            return None
+        return {record["other"] for record in records}
+
+
+link_section_index = LinkSectionIndex()
+
+
+def process_link_delete_in_section_index(link, **kwargs):
+    link_section_index.remove([link._id])
+
+
 def process_index_title_change_in_links(indx, **kwargs):
     print("Cascading Links {} to {}".format(kwargs['old'], kwargs['new']))
 
@@ -1,6 +1,11 @@
 # coding=utf-8
+import copy
+import time
+import threading
 from . import abstract as abst
 from . import text
+from sefaria.system.database import db
+import sefaria.system.cache as scache
 import logging
 logger = logging.getLogger(__name__)
 
@@ -24,7 +29,7 @@ class Passage(abst.AbstractMongoRecord):
     def containing_segment(cls, ref):
         assert isinstance(ref, text.Ref)
         assert ref.is_segment_level()
-        return cls().load({"ref_list": ref.starting_ref().normal()})
+        return passage_index.passage_of_segment(ref.starting_ref().normal())
 
     def _normalize(self):
         super(Passage, self)._normalize()
@@ -45,3 +50,76 @@ class PassageSet(abst.AbstractMongoSet):
     recordClass = Passage
 
 
+class PassageSegmentIndex(object):
+    """
+    In memory map of every segment in the passage collection to its Passage, so that passages can be looked up
+    without querying.
+
+    The map is rebuilt when a Passage is saved or deleted in any process, and at least every `max_age` seconds.
+    """
+    max_age = 60 * 60 * 6
+    generation_key = "passage-segment-index"
+
+    def __init__(self):
+        self._generations = scache.SharedGenerations(check_interval=60)
+        # (generation, time loaded, (normal segment ref -> full_ref, full_ref -> passage record)).  Replaced, never changed.
+        self._state = None
+        self._lock = threading.Lock()
+
+    def _is_current(self, state, generation):
+        return state is not None and state[0] == generation and time.time() - state[1] < self.max_age
+
+    def _current(self):
+        """
+        :return: the current (segments, passages) maps.  Callers read both from the one tuple returned, so that a
+        concurrent rebuild can't pair the segments of one build with the passages of another.
+        """
+        generation = self._generations.get(self.generation_key)
+        state = self._state
+        if not self._is_current(state, generation):
+            with self._lock:
+                state = self._state
+                if not self._is_current(state, generation):
+                    state = self._state = (generation, time.time(), self._build())
+        return state[2]
+
+    @staticmethod
+    def _build():
+        passages, segments = {}, {}
+        for record in db.passage.find({}):
+            passages[record["full_ref"]] = record
+            for tref in record.get("ref_list", []):
+                segments[tref] = record["full_ref"]
+        return segments, passages
+
+    def full_ref(self, segment_tref):
+        """
+        :param segment_tref: normal segment level ref
+        :return: `full_ref` of the passage containing `segment_tref`, or None
+        """
+        segments, _ = self._current()
+        return segments.get(segment_tref)
+
+    def passage_of_segment(self, segment_tref):
+        """
+        :param segment_tref: normal segment level ref
+        :return: Passage containing `segment_tref`, or None
+        """
+        segments, passages = self._current()
+        full_ref = segments.get(segment_tref)
+        # A copy, as the records are shared by every lookup
+        return Passage(copy.deepcopy(passages[full_ref])) if full_ref else None
+
+    def invalidate(self):
+        """
+        Rebuilds the maps on the next lookup in any process.  The current maps stay in place until then.
+        """
+        self._generations.bump([self.generation_key])
+
+
+passage_index = PassageSegmentIndex()
+
+
+def process_passage_change_in_segment_index(passage, **kwargs):
+    passage_index.invalidate()
+
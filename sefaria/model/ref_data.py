@@ -19,6 +19,9 @@ class RefData(abst.AbstractMongoRecord):
         "ref",           # segment ref
         "pagesheetrank", # pagesheetrank value for segment ref
     ]
+    optional_attrs = [
+        "pagerank",      # raw pagerank value for segment ref, used to warm start the next pagerank run
+    ]
 
     def inverse_pagesheetrank(self):
         # returns float which is inversely proportional to pr, on a log-scale
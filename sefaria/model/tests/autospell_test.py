@@ -54,3 +54,101 @@ class Test_Complete_Method(object):
     # Do cross dictionary ac return results from all dicts?
     # Are all refs noted as such in name api?
     # Do dictionary entries resolve in name api?
+
+
+class Test_Spell_Checker(object):
+
+    @classmethod
+    def setup_class(cls):
+        from sefaria.model.autospell import SpellChecker
+        cls.sc = SpellChecker("en")
+        cls.sc.train_phrases(["genesis", "exodus", "shabbat", "rashi on genesis", "ramban", "rambam", "deuteronomy"])
+
+    @pytest.mark.parametrize("token,expected", [
+        ("genesis", "genesis"),
+        ("genisis", "genesis"),     # one edit
+        ("genisus", "genesis"),     # two edits
+        ("shabat", "shabbat"),
+        ("rambma", "rambam"),       # transpose
+        ("deuteronomyy", "deuteronomy"),
+        ("xenesis", "xenesis"),     # the first letter is held
+        ("xyz", "xyz"),
+    ])
+    def test_correct_token(self, token, expected):
+        assert self.sc.correct_token(token) == expected
+
+    @pytest.mark.parametrize("token,expected", [
+        ("or", "or"),       # up to 2 characters: not corrected
+        ("rab", "rav"),     # up to 4 characters: one edit
+        ("shs", "shas"),
+        ("rxx", "rxx"),     # two edits from "rav"
+        ("sxxs", "sxxs"),   # two edits from "shas"
+    ])
+    def test_correct_short_token(self, token, expected):
+        from sefaria.model.autospell import SpellChecker
+        sc = SpellChecker("en")
+        sc.train_phrases(["on", "rav", "shas"])
+        assert sc.correct_token(token) == expected
+
+    def test_known_edits_match_single_edits(self):
+        for word in ["genesis", "shabbat", "rambam"]:
+            for edit in self.sc.single_edits(word):
+                expected = {w for w in self.sc.single_edits(edit) | {edit} if w in self.sc.WORDS}
+                assert set(self.sc.known_edits(edit, 1)) == expected
+
+
+class Test_Pickling(object):
+    # Auto completers are stored in library snapshots.  Do they complete the same way after a round trip?
+    @pytest.mark.parametrize("ac,search", [
+        (library.full_auto_completer("en"), "cor"),
+        (library.full_auto_completer("he"), "תור"),
+        (library.cross_lexicon_auto_completer(), "גדד")
+    ])
+    def test_round_trip(self, ac, search):
+        import pickle
+        loaded = pickle.loads(pickle.dumps(ac))
+        assert loaded.complete(search, 10) == ac.complete(search, 10)
+        assert loaded.library is library
+
+    def test_lexicon_trie_round_trip(self):
+        import pickle
+        trie = library.lexicon_auto_completer("Jastrow Dictionary")
+        loaded = pickle.loads(pickle.dumps(trie))
+        assert type(loaded) is type(trie)
+        assert loaded.items("אב") == trie.items("אב")
+
+
+def test_library_snapshot(tmpdir):
+    path = str(tmpdir.join("library_snapshot.pickle"))
+    assert library.save_snapshot(path)
+    assert library.load_snapshot(path)
+    assert library.is_initialized()
+    assert Ref("Genesis 1:1").normal() == "Genesis 1:1"
+    assert library.full_auto_completer("en").complete("cor", 10)[0]
+
+
+def test_snapshot_keeps_referenced_tries(tmpdir):
+    import os
+    import re
+    import glob
+    path = str(tmpdir.join("library_snapshot.pickle"))
+    trie_dir = str(tmpdir.join("tries"))
+    tokens = lambda: {re.search(r"\.([0-9a-f]{12})[.-]", f).group(1) for f in glob.glob(os.path.join(trie_dir, "*.trie"))}
+    assert library.save_snapshot(path, trie_dir)
+    first = tokens()
+    assert not library.save_snapshot(path, trie_dir)  # Already current
+    assert tokens() == first
+    assert library.save_snapshot(path, trie_dir, force=True)
+    assert len(tokens()) == 1 and tokens() != first
+    assert library.load_snapshot(path)
+    assert library.full_auto_completer("en").complete("gen", 10)[0]
+
+
+def test_mapped_tries(tmpdir):
+    import pickle
+    ac = library.full_auto_completer("en")
+    mapped = pickle.loads(pickle.dumps(ac))
+    mapped.map_tries(str(tmpdir.join("full-en")))
+    for search in ["cor", "gen", "rashi on gen", "shabat", "rambma"]:
+        assert mapped.complete(search, 10) == ac.complete(search, 10)
+    assert pickle.loads(pickle.dumps(mapped)).complete("gen", 10) == ac.complete("gen", 10)
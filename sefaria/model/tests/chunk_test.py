@@ -138,6 +138,28 @@ def test_commentary_chunks():
     assert span.text[-1][-1] == verse.text
 
 
+def test_chunk_batch():
+    orefs = [Ref(r) for r in ("Rashi on Exodus 3", "Rashi on Exodus 4:10", "Exodus 3:1-4:10", "Genesis 1", "Shulchan Arukh, Even HaEzer 1")]
+    batch = TextChunkBatch(orefs)
+    for oref in orefs:
+        for lang in ("en", "he"):
+            expected = TextChunk(oref, lang)
+            actual = batch.get(oref, lang)
+            assert actual.text == expected.text
+            assert actual.is_merged == expected.is_merged
+            assert actual.sources == expected.sources
+            assert [v.versionTitle for v in actual._versions] == [v.versionTitle for v in expected._versions]
+
+
+def test_chunk_batch_section_runs():
+    orefs = [Ref(r) for r in ("Genesis 45", "Genesis 1", "Genesis 2:3", "Genesis 40")]
+    runs = TextChunkBatch._section_runs([(o, o) for o in orefs])
+    assert [[o.normal() for o, _ in run] for run in runs] == [["Genesis 1", "Genesis 2:3"], ["Genesis 40", "Genesis 45"]]
+    batch = TextChunkBatch(orefs)
+    for oref in orefs:
+        assert batch.get(oref, "he").text == TextChunk(oref, "he").text
+
+
 def test_default_in_family():
     r = Ref('Shulchan Arukh, Even HaEzer')
     f = TextFamily(r)
@@ -197,6 +219,31 @@ def test_chapter_result_merge():
         assert key in c
 
 
+def test_concurrent_family(monkeypatch):
+    import sefaria.model.text as text
+    monkeypatch.setattr(text, "TEXT_FAMILY_THREADS", 4)
+    for r in [Ref("Daniel 2"), Ref("Daniel 2:3-4:5")]:
+        assert TextFamily(r, concurrent=True).contents() == TextFamily(r, concurrent=False).contents()
+
+
+def test_concurrent_families_from_cold_caches(monkeypatch):
+    # Families on several threads at once build the Ref cache, the title scanners and the version catalogs together
+    from concurrent.futures import ThreadPoolExecutor
+    import sefaria.model.text as text
+    monkeypatch.setattr(text, "TEXT_FAMILY_THREADS", 4)
+    trefs = ["Daniel 2", "Genesis 4", "Shabbat 3a", "Rashi on Exodus 3", "Daniel 2:3-4:5"]
+    expected = [TextFamily(Ref(tref), wrapLinks=True, concurrent=False).contents() for tref in trefs]
+
+    Ref.clear_cache()
+    library._reset_index_derivative_objects()
+    for tref in trefs:
+        text.VersionCatalog.invalidate(Ref(tref).index.title)
+    Ref.clear_cache()
+    with ThreadPoolExecutor(max_workers=len(trefs) * 2) as executor:
+        results = list(executor.map(lambda tref: TextFamily(Ref(tref), wrapLinks=True, concurrent=True).contents(), trefs * 2))
+    assert results == expected * 2
+
+
 def test_text_family_alts():
     tf = TextFamily(Ref("Exodus 6"), commentary=False, alts=True)
     c = tf.contents()
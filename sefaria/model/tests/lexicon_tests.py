@@ -41,6 +41,36 @@ class Test_Lexicon_Lookup(object):
         results = LexiconLookupAggregator.lexicon_lookup(word3)
         assert results.count() == 1
 
+    def test_batched_lookup_matches_queries(self):
+        phrase = "Am Ha'aretz Bikurim"
+        expected = []
+        for ng in LexiconLookupAggregator._unique_ngrams(phrase):
+            for form in LexiconLookupAggregator.get_word_form_objects(ng):
+                expected += form.lookups
+        results = LexiconLookupAggregator.lexicon_lookup(phrase, always_split=1)
+        assert {(r.headword, r.parent_lexicon) for r in results} == {(l["headword"], l["parent_lexicon"]) for l in expected}
+
+    def test_ref_lookup_matches_queries(self):
+        word, lookup_ref = "תִּשְׁמֹ֑רוּ", "Leviticus 19.3"
+        expected = [l for form in LexiconLookupAggregator.get_word_form_objects(word, lookup_ref=lookup_ref) for l in form.lookups]
+        records = LexiconLookupAggregator._single_lookup(word, lookup_ref=lookup_ref)
+        assert {(r["headword"], r["parent_lexicon"]) for r in records} == {(l["headword"], l["parent_lexicon"]) for l in expected}
+        forms = LexiconLookupAggregator._load_forms([LexiconLookupAggregator._form_key(word)])
+        assert all("refs" not in r for records in forms.values() for r in records)
+
+    def test_word_form_save_invalidates_cache(self):
+        form = "Bikurim Test Form"
+        assert LexiconLookupAggregator.lexicon_lookup(form, never_split=1) is None
+        lookups = LexiconLookupAggregator.get_word_form_objects("Bikurim")[0].lookups
+        wf = WordForm({"form": form, "lookups": [{"headword": l["headword"], "parent_lexicon": l["parent_lexicon"]} for l in lookups[:1]]})
+        wf.save()
+        try:
+            results = LexiconLookupAggregator.lexicon_lookup(form, never_split=1)
+            assert results is not None and results.count() == 1
+        finally:
+            wf.delete()
+        assert LexiconLookupAggregator.lexicon_lookup(form, never_split=1) is None
+
 
 class Test_Lexicon_Save(object):
 
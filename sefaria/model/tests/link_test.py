@@ -50,4 +50,81 @@ class Test_Link_Save(object):
                      "refs": ["Deuteronomy 10", "Avi Ezer, Deuteronomy 10:16:1"]})
         with pytest.raises(DuplicateRecordError) as e_info:
             link._pre_save()
-            assert "A more precise link already exists: {} - {}".format("Avi Ezer, Deuteronomy 10:16:1", "Deuteronomy 10:16") in str(e_info.value)
\ No newline at end of file
+            assert "A more precise link already exists: {} - {}".format("Avi Ezer, Deuteronomy 10:16:1", "Deuteronomy 10:16") in str(e_info.value)
+
+class Test_Link_Section_Index(object):
+
+    @classmethod
+    def setup_class(cls):
+        LinkSet({"generated_by": "link_section_tester"}).delete()
+        cls.link = Link({"auto": True,
+                         "generated_by": "link_section_tester",
+                         "type": "commentary",
+                         "refs": ["Genesis 1:2-2:1", "Avi Ezer, Deuteronomy 10:16:1"]}).save()
+
+    @classmethod
+    def teardown_class(cls):
+        LinkSet({"generated_by": "link_section_tester"}).delete()
+
+    def test_records_for_link(self):
+        records = LinkSectionIndex.records_for_link(self.link._id, self.link.refs,
+                                                    [self.link.expandedRefs0, self.link.expandedRefs1])
+        sections = {(r["section"], r["pos"]) for r in records}
+        assert sections == {("Avi Ezer, Deuteronomy 10:16", 0), ("Genesis 1", 1), ("Genesis 2", 1)}
+        genesis_2 = [r for r in records if r["section"] == "Genesis 2"][0]
+        assert genesis_2["segments"] == ["Genesis 2:1"]
+        assert genesis_2["other"] == "Avi Ezer, Deuteronomy 10:16:1"
+
+    def test_records_for_unparseable_link(self):
+        # e.g. while an Index title change cascades to its links
+        records = LinkSectionIndex.records_for_link("x", ["Not A Book 1:2-3", "Genesis 1:1"],
+                                                    [["Not A Book 1:2", "Not A Book 1:3"], ["Genesis 1:1"]])
+        sections = {(r["section"], r["pos"]) for r in records}
+        assert sections == {("Not A Book 1", 0), ("Genesis 1", 1)}
+        assert [r for r in records if r["pos"] == 0][0]["segments"] == ["Not A Book 1:2", "Not A Book 1:3"]
+
+    def test_records_kept_on_save_and_delete(self):
+        assert link_section_index._collection().count_documents({"link": self.link._id}) == 3
+        link = Link({"auto": True, "generated_by": "link_section_tester", "type": "commentary",
+                     "refs": ["Genesis 3:4", "Avi Ezer, Deuteronomy 10:16:1"]}).save()
+        assert link_section_index._collection().count_documents({"link": link._id}) == 2
+        link.refs = ["Genesis 3:5", "Avi Ezer, Deuteronomy 10:16:1"]
+        link.save(override_dependencies=True)
+        assert link_section_index._collection().count_documents({"link": link._id, "section": "Genesis 3", "segments": "Genesis 3:5"}) == 1
+        link.delete()
+        assert link_section_index._collection().count_documents({"link": link._id}) == 0
+
+    def test_raw_link_writes_update_index(self):
+        # Writes to db.links that bypass Link and LinkSet must keep the index current, see LinkSectionIndex
+        import os
+        import re
+        raw_write = re.compile(r"db\.links\.(insert|update|delete|replace|remove|save|bulk_write|find_one_and)")
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        offenders = []
+        for top in ("sefaria", "scripts", "reader", "sourcesheets"):
+            for dirpath, dirnames, filenames in os.walk(os.path.join(root, top)):
+                dirnames[:] = [d for d in dirnames if d not in ("archive", "tests")]
+                for filename in filenames:
+                    if not filename.endswith(".py"):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    with open(path, encoding="utf-8", errors="ignore") as f:
+                        source = f.read()
+                    if raw_write.search(source) and "link_section_index" not in source:
+                        offenders.append(os.path.relpath(path, root))
+        assert offenders == []
+
+    def test_positions(self):
+        link_section_index._ready = True
+        try:
+            assert link_section_index.positions(Ref("Genesis 1:3"))[self.link._id] == 1
+            assert link_section_index.positions(Ref("Genesis 1"))[self.link._id] == 1
+            assert self.link._id not in link_section_index.positions(Ref("Genesis 2:2"))
+            assert link_section_index.positions(Ref("Genesis")) is None
+            assert "Genesis 1:2-2:1" in link_section_index.linked_refs(Ref("Avi Ezer, Deuteronomy 10:16"))
+            linkset = LinkSet(Ref("Genesis 2:1"))
+            assert linkset.position(self.link) == 1
+            assert self.link._id in {l._id for l in linkset}
+        finally:
+            link_section_index._ready = False
+            link_section_index._checked_at = 0
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from sefaria.model import *
+from sefaria.model.passage import PassageSegmentIndex
+
+
+def test_segment_index_matches_passage_collection():
+    index = PassageSegmentIndex()
+    for p in PassageSet(limit=20):
+        for tref in p.ref_list:
+            assert index.full_ref(tref) == p.full_ref
+    assert index.full_ref("Not a Ref 1:1") is None
+
+
+def test_containing_segment():
+    p = Passage().load({})
+    segment = Ref(p.ref_list[0])
+    found = Passage.containing_segment(segment)
+    assert found.full_ref == p.full_ref
+    assert found._id == p._id
+
+
+def test_invalidate_on_save():
+    p = Passage({"full_ref": "Genesis 1:1-2", "type": "Sugya", "ref_list": []})
+    try:
+        assert passage_index.full_ref("Genesis 1:1") is None
+        p.save()
+        assert passage_index.full_ref("Genesis 1:1") == "Genesis 1:1-2"
+        p.delete()
+        assert passage_index.full_ref("Genesis 1:1") is None
+    finally:
+        PassageSet({"full_ref": "Genesis 1:1-2"}).delete()
@@ -439,6 +439,34 @@ class Test_Ref(object):
         assert len(Ref("Shabbat").version_list()) > 3
         assert len(Ref("Shabbat").version_list()) > len(Ref("Shabbat 5b").version_list())
 
+    def test_version_list_matches_query(self):
+        for tref in ["Exodus", "Exodus 5", "Exodus 5:3", "Exodus 5:3-7", "Exodus 5:3-6:2", "Shabbat 5b",
+                     "Rashi on Exodus 5", "Rashi on Exodus 5:3:1", "Pesach Haggadah, Kadesh"]:
+            oref = Ref(tref)
+            expected = [(v.versionTitle, v.language) for v in VersionSet(oref.condition_query())]
+            assert [(v["versionTitle"], v["language"]) for v in oref.version_list()] == expected
+
+    def test_version_catalog_reloads_only_changed_version(self):
+        from sefaria.model.text import VersionCatalog
+        before = VersionCatalog.get("Exodus")
+        changed = Version().load({"title": "Exodus"})
+        VersionCatalog.invalidate("Exodus", changed._id)
+        after = VersionCatalog.get("Exodus")
+        assert after is not before
+        assert after.versions == before.versions
+        for i, v in enumerate(after.versions):
+            same_version = v["versionTitle"] == changed.versionTitle and v["language"] == changed.language
+            assert (after.bitmaps[i] is before.bitmaps[i]) != same_version
+            assert after.bitmaps[i] == before.bitmaps[i]
+
+    def test_version_catalog_rebuilt_on_index_refresh(self, locmem_cache):
+        # Restructuring helpers save without notifying dependencies, and then refresh the Index in the library
+        from sefaria.model.text import VersionCatalog
+        before = VersionCatalog.get("Exodus")
+        assert VersionCatalog.get("Exodus") is before
+        library.refresh_index_record_in_cache(library.get_index("Exodus"))
+        assert VersionCatalog.get("Exodus") is not before
+
     def test_in_terms_of(self):
         Ref("Genesis 6:3").in_terms_of(Ref("Genesis 6")) == [3]
         Ref("Genesis 6:3").in_terms_of(Ref("Genesis")) == [6, 3]
@@ -557,6 +585,69 @@ class Test_Cache(object):
         r2 = Ref("Ramban on Genesis 1")
         assert r1 is not r2
 
+    def test_index_flush_after_repeated_hits(self):
+        for i in range(3):
+            Ref("Genesis 5")
+            Ref("Gen. 5")
+        assert {k for k in Ref._raw_cache().keys() if k.startswith("Gen")} >= {"Genesis 5", "Gen. 5"}
+        Ref.remove_index_from_cache("Genesis")
+        assert "Genesis 5" not in Ref._raw_cache()
+        assert "Gen. 5" not in Ref._raw_cache()
+
+    def test_lru_eviction(self):
+        stats = Ref.cache_stats()
+        try:
+            Ref.clear_cache()
+            Ref.set_cache_limits(max_entries=3)
+            r1 = Ref("Genesis 1")  # keys: "Genesis 1"
+            Ref("Exodus 1")
+            Ref("Genesis 1")       # Genesis 1 is now most recently used
+            Ref("Leviticus 1")
+            Ref("Numbers 1")
+            assert Ref.cache_size() <= 3
+            assert "Exodus 1" not in Ref._raw_cache()
+            assert r1 is Ref("Genesis 1")
+            assert Ref.cache_stats()["evictions"] > stats["evictions"]
+        finally:
+            Ref.set_cache_limits(max_entries=stats["max_entries"], max_bytes=stats["max_bytes"])
+
+    def test_byte_budget(self):
+        stats = Ref.cache_stats()
+        try:
+            Ref.clear_cache()
+            Ref("Genesis 1")
+            one_ref_bytes = Ref.cache_stats()["bytes"]
+            assert one_ref_bytes > 0
+            Ref.set_cache_limits(max_bytes=one_ref_bytes * 2)
+            for i in range(1, 10):
+                Ref("Exodus {}".format(i))
+            assert Ref.cache_stats()["bytes"] <= one_ref_bytes * 2
+        finally:
+            Ref.set_cache_limits(max_entries=stats["max_entries"], max_bytes=stats["max_bytes"])
+
+    def test_hit_miss_counters(self):
+        Ref("Deuteronomy 3")
+        before = Ref.cache_stats()
+        Ref("Deuteronomy 3")
+        after = Ref.cache_stats()
+        assert after["hits"] == before["hits"] + 1
+        assert after["misses"] == before["misses"]
+
+    def test_concurrent_eviction(self):
+        from concurrent.futures import ThreadPoolExecutor
+        stats = Ref.cache_stats()
+        trefs = ["{} {}".format(book, i) for book in ["Genesis", "Exodus", "Leviticus"] for i in range(1, 21)]
+        try:
+            Ref.clear_cache()
+            Ref.set_cache_limits(max_entries=10)
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                normals = list(executor.map(lambda tref: Ref(tref).normal(), trefs * 5))
+            assert normals == trefs * 5
+            assert Ref.cache_size() <= 10
+            assert Ref.cache_stats()["refs"] <= Ref.cache_size()
+        finally:
+            Ref.set_cache_limits(max_entries=stats["max_entries"], max_bytes=stats["max_bytes"])
+
     '''
     # Retired.  Since we're dealing with objects, tref will either bleed one way or the other.
     # Removed last dependencies on tref outside of object init. 
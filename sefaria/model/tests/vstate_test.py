@@ -14,6 +14,26 @@ class Test_VState(object):
             assert getattr(vs, "content")
 
 
+    def test_refresh_ref(self):
+        for tref in ["Exodus 3", "Rashi on Exodus 3:1-4:2", "Shabbat 2a"]:
+            oref = Ref(tref)
+            vs = VersionState(oref.index)
+            vs.refresh_ref(oref)
+            assert vs.consistency_errors() == []
+            assert VersionState(oref.index).consistency_errors() == []
+
+    def test_refresh_ref_keeps_concurrent_changes(self):
+        from sefaria.system.database import db
+        stale = VersionState("Exodus")
+        db.vstate.update_one({"_id": stale._id}, {"$set": {"flags.refreshRefTest": True}})
+        try:
+            stale.refresh_ref(Ref("Exodus 3"))
+            assert VersionState("Exodus").get_flag("refreshRefTest")
+            assert VersionState("Exodus").consistency_errors() == []
+        finally:
+            db.vstate.update_one({"_id": stale._id}, {"$unset": {"flags.refreshRefTest": ""}})
+
+
 class Test_VSNode(object):
     def test_section_counts(self):
         sn = StateNode("Exodus")
@@ -15,7 +15,10 @@ import copy
 import bleach
 import json
 import itertools
-from collections import defaultdict
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from collections import defaultdict, OrderedDict
 from bs4 import BeautifulSoup, Tag
 try:
     import re2 as re
@@ -26,7 +29,7 @@ except ImportError:
 
 from . import abstract as abst
 from .schema import deserialize_tree, SchemaNode, VirtualNode, DictionaryNode, JaggedArrayNode, TitledTreeNode, DictionaryEntryNode, SheetNode, AddressTalmud, Term, TermSet, TitleGroup, AddressType
-from sefaria.system.database import db
+from sefaria.system.database import db, QueryAccountingListener
 
 import sefaria.system.cache as scache
 from sefaria.system.exceptions import InputError, BookNameError, PartialRefInputError, IndexSchemaError, \
@@ -34,7 +37,9 @@ from sefaria.system.exceptions import InputError, BookNameError, PartialRefInput
 from sefaria.utils.hebrew import is_hebrew, hebrew_term
 from sefaria.utils.util import list_depth
 from sefaria.datatype.jagged_array import JaggedTextArray, JaggedArray
-from sefaria.settings import DISABLE_INDEX_SAVE, USE_VARNISH, MULTISERVER_ENABLED
+from sefaria.settings import DISABLE_INDEX_SAVE, USE_VARNISH, MULTISERVER_ENABLED, REF_CACHE_MAX_ENTRIES, REF_CACHE_MAX_BYTES, \
+    LIBRARY_SNAPSHOT_PATH, LIBRARY_SNAPSHOT_MAX_AGE, AUTOCOMPLETE_TRIE_DIR, TEXT_FAMILY_THREADS, VERSION_CATALOG_MAX_ENTRIES, \
+    VERSION_CATALOG_CONTENT_MAX_ENTRIES, VERSION_CATALOG_TIMEOUT
 from sefaria.system.multiserver.coordinator import server_coordinator
 
 """
@@ -1328,6 +1333,169 @@ class VersionSet(abst.AbstractMongoSet):
         return merge_texts([v.content_node(node) for v in self], [getattr(v, "versionTitle", None) for v in self])
 
 
+class VersionCatalog(object):
+    """
+    The Versions of one Index: their metadata in priority order, the first section ref of each,
+    and a bitmap of where each has content.  :meth:`Ref.version_list` answers from the catalog, rather than by querying.
+
+    For each JaggedArrayNode of each version, the bitmap maps the address of every array above segment level to an int,
+    whose bit `i` is set if element `i` of the array is non empty (not "", [] or 0).  This is the same test that
+    :meth:`Ref.condition_query` makes in Mongo.
+
+    Catalogs are cached per process, and rebuilt after a Version of the Index is saved or deleted in any process.
+    A rebuild queries only the metadata of the versions.  The bitmaps and first section ref of each version are cached
+    separately, under a generation token per version, so only those of the versions that changed are rebuilt from
+    their content.
+    Both caches are also keyed on the structure of the Index as the library has it (see `_schema_key()`), since
+    restructuring helpers (sefaria.helper.schema) save Versions without notifying dependencies.
+    """
+    fields = ["versionTitle", "versionSource", "language", "status", "license", "versionNotes",
+              "digitizedBySefaria", "priority", "versionTitleInHebrew", "versionNotesInHebrew", "extendedNotes",
+              "extendedNotesHebrew", "purchaseInformationImage", "purchaseInformationURL"]
+    _cache = scache.InMemoryCache(timeout=VERSION_CATALOG_TIMEOUT, max_entries=VERSION_CATALOG_MAX_ENTRIES)
+    _content_cache = scache.InMemoryCache(timeout=VERSION_CATALOG_TIMEOUT, max_entries=VERSION_CATALOG_CONTENT_MAX_ENTRIES)
+    _generations = scache.SharedGenerations(check_interval=5)
+
+    def __init__(self, title, schema_key=None):
+        self.title = title
+        self.versions = []            # metadata of each version, in priority order
+        self.first_section_refs = []  # normal first section ref of each version
+        self.bitmaps = []             # of each version: {(node version address, array address): bitmap}
+        self.dict_paths = []          # of each version: set of the node version addresses in its content
+        records = list(db.texts.find({"title": title}, {f: 1 for f in self.fields}, sort=[("priority", -1), ("_id", 1)]))
+        generations = scache.get_cache_generations([self._content_generation_key(r["_id"]) for r in records],
+                                                   cache_type=scache.SHARED_DATA_CACHE_ALIAS)
+        for record, generation in zip(records, generations):
+            self.versions.append({f: record.get(f, "") for f in self.fields})
+            first_section_ref, bitmaps, dict_paths = self._content_cache.get_or_set(
+                (record["_id"], generation, schema_key), lambda: self._load_content(record["_id"]))
+            self.first_section_refs.append(first_section_ref)
+            self.bitmaps.append(bitmaps)
+            self.dict_paths.append(dict_paths)
+
+    @classmethod
+    def _load_content(cls, version_id):
+        """
+        :return: (first section ref, bitmaps, dict paths) of the version with `version_id`, from its content
+        """
+        v = Version().load({"_id": version_id})
+        bitmaps, dict_paths = {}, set()
+        if v is None:
+            return None, bitmaps, dict_paths
+        if hasattr(v, "chapter"):
+            cls._walk_nodes(v.chapter, (), bitmaps, dict_paths)
+        return cls._first_section_ref(v), bitmaps, dict_paths
+
+    @staticmethod
+    def _first_section_ref(v):
+        try:
+            oref = v.first_section_ref() or v.get_index().nodes.first_leaf().first_section_ref()
+            return oref.normal()
+        except Exception as e:
+            logger.warning("Failed to find first section of {}, {}: {}".format(v.title, getattr(v, "versionTitle", ""), e))
+            return None
+
+    @staticmethod
+    def _is_empty(element):
+        return element == "" or element == [] or (element == 0 and not isinstance(element, bool))
+
+    @classmethod
+    def _walk_nodes(cls, content, node_address, bitmaps, dict_paths):
+        dict_paths.add(node_address)
+        if isinstance(content, dict):
+            for key, child in content.items():
+                cls._walk_nodes(child, node_address + (key,), bitmaps, dict_paths)
+        elif isinstance(content, list):
+            cls._walk_array(content, node_address, (), bitmaps)
+
+    @classmethod
+    def _walk_array(cls, array, node_address, array_address, bitmaps):
+        bitmap = 0
+        for i, element in enumerate(array):
+            if not cls._is_empty(element):
+                bitmap |= 1 << i
+            if isinstance(element, list):
+                cls._walk_array(element, node_address, array_address + (i,), bitmaps)
+        bitmaps[(node_address, array_address)] = bitmap
+
+    def has_content(self, i, oref):
+        """
+        :return bool: True if version `i` has content at `oref`, as :meth:`Ref.condition_query` would find it
+        """
+        node_address = tuple(oref.index_node.version_address())
+        if not isinstance(oref.index_node, JaggedArrayNode):
+            return node_address in self.dict_paths[i]
+        if oref.sections and oref.is_spanning():
+            return any(self.has_content(i, r) for r in oref.split_spanning_ref())
+        bitmaps = self.bitmaps[i]
+        sections = [s - 1 for s in oref.sections]
+        if len(sections) == oref.index_node.depth and not oref.is_range():
+            return bool(bitmaps.get((node_address, tuple(sections[:-1])), 0) >> sections[-1] & 1)
+        array_address = tuple(sections if not oref.is_range() else sections[:-1])
+        return bitmaps.get((node_address, array_address), 0) != 0
+
+    def version_list(self, oref):
+        """
+        :return list: as :meth:`Ref.version_list`
+        """
+        book_level = oref.is_book_level()
+        version_list = []
+        for i, metadata in enumerate(self.versions):
+            if not self.has_content(i, oref):
+                continue
+            version = dict(metadata)
+            if book_level:
+                version["firstSectionRef"] = self.first_section_refs[i]
+            version_list.append(version)
+        return version_list
+
+    @classmethod
+    def _generation_key(cls, title):
+        return "version-catalog:{}".format(title)
+
+    @staticmethod
+    def _schema_key(title):
+        """
+        :return: key of the structure of the Index `title` as the library has it: the version address and depth of
+        each of its leaf nodes, which the bitmaps and first section refs are built against
+        """
+        try:
+            nodes = library.get_index(title).nodes
+        except BookNameError:
+            return None
+        return hash(tuple((tuple(n.version_address()), getattr(n, "depth", None)) for n in nodes.get_leaf_nodes()))
+
+    @classmethod
+    def _content_generation_key(cls, version_id):
+        return "version-catalog-content:{}".format(version_id)
+
+    @classmethod
+    def get(cls, title):
+        """
+        :return: the current :class:`VersionCatalog` of the Index `title`
+        """
+        schema_key = cls._schema_key(title)
+        return cls._cache.get_or_set((title, cls._generations.get(cls._generation_key(title)), schema_key), lambda: cls(title, schema_key))
+
+    @classmethod
+    def invalidate(cls, title, version_id=None):
+        """
+        Rebuilds the catalog of `title` when next requested.
+        :param version_id: _id of the version that changed, whose content is reloaded then.  The content of the other
+        versions is reused.
+        """
+        keys = [cls._generation_key(title)] + ([cls._content_generation_key(version_id)] if version_id else [])
+        cls._generations.bump(keys)
+
+    @classmethod
+    def stats(cls):
+        return dict(cls._cache.stats(), content=cls._content_cache.stats())
+
+
+def process_version_change_in_catalog(version, **kwargs):
+    VersionCatalog.invalidate(version.title, getattr(version, "_id", None))
+
+
 # used in VersionSet.merge(), merge_text_versions(), and export.export_merged()
 # todo: move this to JaggedTextArray class?
 # Doesn't work for complex texts
@@ -1408,12 +1576,16 @@ class TextChunk(AbstractTextRecord, metaclass=TextFamilyDelegator):
 
     text_attr = "text"
 
-    def __init__(self, oref, lang="en", vtitle=None, exclude_copyrighted=False):
+    def __init__(self, oref, lang="en", vtitle=None, exclude_copyrighted=False, versions=None):
         """
         :param oref:
         :type oref: Ref
         :param lang: "he" or "en"
         :param vtitle:
+        :param versions: optional.  Versions of this Index in `lang`, in priority order, each loaded as if with
+        `oref.part_projection()`.  If passed, these are used instead of querying the database, and versions without
+        content at `oref` are skipped.  Used by :class:`TextChunkBatch`, which is responsible for raising
+        NoVersionFoundError when the Index has no versions at all.
         :return:
         """
         if isinstance(oref.index_node, JaggedArrayNode):
@@ -1446,10 +1618,13 @@ class TextChunk(AbstractTextRecord, metaclass=TextFamilyDelegator):
                 self._versions += [v]
                 self.text = self._original_text = self.trim_text(v.content_node(self._oref.index_node))
         elif lang:
-            vset = VersionSet(self._oref.condition_query(lang), proj=self._oref.part_projection())
+            if versions is None:
+                vset = VersionSet(self._oref.condition_query(lang), proj=self._oref.part_projection())
+            else:
+                vset = VersionSet.from_records([v for v in versions if self._version_has_content(v)])
 
             if len(vset) == 0:
-                if VersionSet({"title": self._oref.index.title}).count() == 0:
+                if versions is None and VersionSet({"title": self._oref.index.title}).count() == 0:
                     raise NoVersionFoundError("No text record found for '{}'".format(self._oref.index.title))
                 return
             if len(vset) == 1:
@@ -1488,6 +1663,18 @@ class TextChunk(AbstractTextRecord, metaclass=TextFamilyDelegator):
             args += ", {}".format(self.vtitle)
         return "{}({})".format(self.__class__.__name__, args)
 
+    def _version_has_content(self, v):
+        """
+        Mirrors the test in `Ref.condition_query()`, for versions that have already been loaded
+        """
+        txt = v.content_node(self._oref.index_node)
+        if self._oref.is_spanning():
+            txt = copy.deepcopy(txt)  # trim_text() modifies spanning content in place
+        txt = self.trim_text(txt)
+        if isinstance(txt, list):
+            return any(x not in ("", [], 0) for x in txt)
+        return txt not in ("", [], 0, None)
+
     def version_ids(self):
         if self._version_ids is None:
             if self._versions:
@@ -1872,6 +2059,139 @@ class TextChunk(AbstractTextRecord, metaclass=TextFamilyDelegator):
             return ind_list, ref_list, total_len
 
 
+class TextChunkBatch(object):
+    """
+    Loads the TextChunks of many Refs with few queries.
+
+    Refs are grouped by the schema node that stores their text, and each group is split into runs of Refs whose top
+    level sections are at most `max_section_gap` sections apart.  Each run is loaded with one query per language,
+    projected to the span of top level sections that covers all of the Refs in the run.  TextChunks are then built
+    from those versions, as they would have been by `TextChunk(oref, lang)`.
+    Refs that can't be batched (virtual nodes, non-JaggedArray nodes without a default child) are loaded on request.
+
+        >>> batch = TextChunkBatch([Ref("Rashi on Genesis 1:1"), Ref("Rashi on Genesis 1:2")])
+        >>> batch.get(Ref("Rashi on Genesis 1:2"), "he").text
+    """
+    max_section_gap = 5  # unrequested top level sections loaded to join two runs, rather than query each separately
+
+    def __init__(self, orefs, langs=("en", "he")):
+        self._chunks = {}  # (normal ref, lang) -> TextChunk
+        self._errors = {}  # (normal ref, lang) -> Exception raised when loading
+        self._load(orefs, langs)
+
+    def get(self, oref, lang):
+        """
+        :return: TextChunk of `oref` in `lang`.  Raises the same errors as `TextChunk(oref, lang)`
+        """
+        key = (oref.normal(), lang)
+        if key in self._errors:
+            raise self._errors[key]
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            chunk = self._chunks[key] = TextChunk(oref, lang)
+        return chunk
+
+    def _load(self, orefs, langs):
+        groups = defaultdict(list)  # (title, storage address) -> [(requested Ref, JaggedArray Ref)]
+        seen = set()
+        for oref in orefs:
+            if oref.normal() in seen or oref.index_node.is_virtual:
+                continue
+            seen.add(oref.normal())
+            ja_oref = oref
+            if not isinstance(oref.index_node, JaggedArrayNode):
+                try:
+                    ja_oref = oref.default_child_ref()
+                except (InputError, AttributeError):
+                    continue  # Leave it to TextChunk to raise
+                if ja_oref == oref:
+                    continue
+            groups[(ja_oref.index.title, ja_oref.storage_address())] += [(oref, ja_oref)]
+
+        if not groups:
+            return
+        titles = list({title for title, _ in groups})
+        titles_with_versions = set(db.texts.distinct("title", {"title": {"$in": titles}}))
+
+        for (title, address), group_members in groups.items():
+            for lang in langs:
+                if title not in titles_with_versions:
+                    for oref, _ in group_members:
+                        self._errors[(oref.normal(), lang)] = NoVersionFoundError("No text record found for '{}'".format(title))
+                    continue
+                for members in self._section_runs(group_members):
+                    ja_orefs = [ja_oref for _, ja_oref in members]
+                    versions, start = self._load_group_versions(title, address, ja_orefs, lang)
+                    for oref, ja_oref in members:
+                        try:
+                            ref_versions = [self._version_for_ref(v, ja_oref, start) for v in versions]
+                            self._chunks[(oref.normal(), lang)] = TextChunk(oref, lang, versions=ref_versions)
+                        except Exception as e:
+                            # Raised when this TextChunk is requested, so that one bad Ref doesn't fail the batch
+                            self._errors[(oref.normal(), lang)] = e
+
+    @classmethod
+    def _section_runs(cls, members):
+        """
+        Splits the members of a group into runs that are loaded together.
+        A group with a Ref to the whole node is loaded whole, as one run.
+        :param members: list of (requested Ref, JaggedArray Ref)
+        :return: list of lists of members
+        """
+        if any(not ja_oref.sections for _, ja_oref in members):
+            return [members]
+        runs = []
+        run_last = None
+        for member in sorted(members, key=lambda m: cls._first_level_span(m[1])):
+            first, last = cls._first_level_span(member[1])
+            if run_last is not None and first - run_last - 1 <= cls.max_section_gap:
+                runs[-1].append(member)
+                run_last = max(run_last, last)
+            else:
+                runs.append([member])
+                run_last = last
+        return runs
+
+    @staticmethod
+    def _first_level_span(oref):
+        """
+        :return: (first, last) top level sections, 1-based, that `oref.part_projection()` would select
+        """
+        last = oref.sections[0] if oref.range_index() > 0 else oref.toSections[0]
+        return oref.sections[0], last
+
+    def _load_group_versions(self, title, address, ja_orefs, lang):
+        """
+        :return: (list of Versions, the 1-based top level section that the first element of their content corresponds to)
+        """
+        sectionless = [o for o in ja_orefs if not o.sections]
+        base = sectionless[0] if sectionless else ja_orefs[0]
+        projection = base.part_projection()
+        start = 1
+        if not sectionless:
+            spans = [self._first_level_span(o) for o in ja_orefs]
+            start = min(first for first, _ in spans)
+            end = max(last for _, last in spans)
+            projection[address] = {"$slice": [start - 1, end - start + 1]}
+        query = {"title": title, "language": lang, address: {"$exists": True}}
+        return VersionSet(query, proj=projection).array(), start
+
+    @staticmethod
+    def _version_for_ref(version, ja_oref, start):
+        """
+        :return: shallow copy of `version`, with content cut down to what `ja_oref.part_projection()` would have loaded
+        """
+        content = version.content_node(ja_oref.index_node)
+        if ja_oref.sections:
+            first, last = TextChunkBatch._first_level_span(ja_oref)
+            content = content[first - start:last - start + 1]
+        ref_version = copy.copy(version)
+        for key in reversed(ja_oref.index_node.version_address()):
+            content = {key: content}
+        ref_version.chapter = content
+        return ref_version
+
+
 class VirtualTextChunk(AbstractTextRecord):
     """
     Delegated from TextChunk
@@ -1997,7 +2317,7 @@ class TextFamily(object):
         "he": "heSources"
     }
 
-    def __init__(self, oref, context=1, commentary=True, version=None, lang=None, version2=None, lang2=None, pad=True, alts=False, wrapLinks=False, stripItags=False, wrapNamedEntities=False):
+    def __init__(self, oref, context=1, commentary=True, version=None, lang=None, version2=None, lang2=None, pad=True, alts=False, wrapLinks=False, stripItags=False, wrapNamedEntities=False, concurrent=None):
         """
         :param oref:
         :param context:
@@ -2011,6 +2331,8 @@ class TextFamily(object):
         :param wrapLinks: whether to return the text requested with all internal citations marked up as html links <a>
         :param stripItags: whether to strip inline commentator tags and inline footnotes from text
         :param wrapNamedEntities: whether to return the text requested with all known named entities marked up as html links <a>.
+        :param concurrent: whether to load the texts, links and version list in parallel, on a pool of TEXT_FAMILY_THREADS threads.
+        Default: True if TEXT_FAMILY_THREADS is set.
         :return:
         """
         if pad:
@@ -2039,59 +2361,29 @@ class TextFamily(object):
         self._context_oref = oref
 
         # processes "en" and "he" TextChunks, and puts the text in self.text and self.he, respectively.
-        for language, attr in list(self.text_attr_map.items()):
-            if language == lang:
-                c = TextChunk(oref, language, version)
-                if len(c._versions) == 0:  # indicates `version` doesn't exist
-                    self._nonExistantVersions[language] = version
-            elif language == lang2:
-                c = TextChunk(oref, language, version2)
-                if len(c._versions) == 0:
-                    self._nonExistantVersions[language] = version2
-            else:
-                c = TextChunk(oref, language)
+        # The chunks, links and version list are independent lookups.  If `concurrent`, they run in parallel.
+        tasks = [(self._load_chunk, (oref, language, lang, version, lang2, version2, wrapNamedEntities, stripItags, wrapLinks))
+                 for language in self.text_attr_map]
+        if commentary:
+            tasks += [(self._load_commentary, (oref,))]
+        tasks += [(oref.version_list, ())]
+        results = self._run_tasks(tasks, concurrent)
+
+        for language in self.text_attr_map:
+            c, text, nonexistant_version = next(results)
             self._chunks[language] = c
-            text_modification_funcs = []
-            if wrapNamedEntities and len(c._versions) > 0:
-                from . import RefTopicLinkSet
-                named_entities = RefTopicLinkSet({"expandedRefs": {"$in": [r.normal() for r in oref.all_segment_refs()]}, "charLevelData.versionTitle": c._versions[0].versionTitle, "charLevelData.language": language})
-                if len(named_entities) > 0:
-                    # assumption is that refTopicLinks are all to unranged refs
-                    ne_by_secs = defaultdict(list)
-                    for ne in named_entities:
-                        try:
-                            temp_ref = Ref(ne.ref)
-                        except InputError:
-                            continue
-                        temp_secs = tuple(s-1 for s in temp_ref.sections)
-                        ne_by_secs[temp_secs] += [ne]
-                    text_modification_funcs += [lambda s, secs: library.get_wrapped_named_entities_string(ne_by_secs[tuple(secs)], s)]
-            if stripItags:
-                text_modification_funcs += [lambda s, secs: c._strip_itags(s), lambda s, secs: ' '.join(s.split()).strip()]
-            if wrapLinks and c.version_ids():
-                #only wrap links if we know there ARE links- get the version, since that's the only reliable way to get it's ObjectId
-                #then count how many links came from that version. If any- do the wrapping.
-                from . import Link
-                query = oref.ref_regex_query()
-                query.update({"generated_by": "add_links_from_text"})  # , "source_text_oid": {"$in": c.version_ids()}
-                if Link().load(query) is not None:
-                    text_modification_funcs += [lambda s, secs: library.get_wrapped_refs_string(s, lang=language, citing_only=True)]
-            padded_sections, _ = oref.get_padded_sections()
-            setattr(self, self.text_attr_map[language], c._get_text_after_modifications(text_modification_funcs, start_sections=padded_sections))
+            if nonexistant_version is not False:
+                self._nonExistantVersions[language] = nonexistant_version
+            setattr(self, self.text_attr_map[language], text)
 
         if oref.is_spanning():
             self.spanning = True
         #// todo: should this parameter be renamed? it gets all links, not strictly commentary...
         if commentary:
-            from sefaria.client.wrapper import get_links
-            if not oref.is_spanning():
-                links = get_links(oref.normal())  #todo - have this function accept an object
-            else:
-                links = [get_links(r.normal()) for r in oref.split_spanning_ref()]
-            self.commentary = links if "error" not in links else []
+            self.commentary = next(results)
 
         # get list of available versions of this text
-        self.versions = oref.version_list()
+        self.versions = next(results)
 
         # Adds decoration for the start of each alt structure reference
         if alts:
@@ -2152,6 +2444,99 @@ class TextFamily(object):
 
             self._alts = alts_ja.array()
 
+    _executor = None
+    _executor_lock = threading.Lock()
+    _local = threading.local()
+
+    @classmethod
+    def _get_executor(cls):
+        if cls._executor is None:
+            with cls._executor_lock:
+                if cls._executor is None:
+                    cls._executor = ThreadPoolExecutor(max_workers=TEXT_FAMILY_THREADS, thread_name_prefix="text-family")
+        return cls._executor
+
+    @classmethod
+    def _run_tasks(cls, tasks, concurrent=None):
+        """
+        Runs each (function, args) in `tasks`.
+        :return: iterator of their results, in order.  An exception is raised when its task's result is reached,
+        as it would have been running the tasks one after the other.
+        """
+        if concurrent is None:
+            concurrent = TEXT_FAMILY_THREADS > 0
+        # Tasks of a TextFamily built inside a task run serially, so that the pool can't deadlock waiting on itself
+        if not concurrent or TEXT_FAMILY_THREADS <= 0 or getattr(cls._local, "in_task", False):
+            return (f(*args) for f, args in tasks)
+
+        query_stats = QueryAccountingListener.current()
+
+        def run(f, args):
+            # Count the task's Mongo queries in the stats of the request that started it
+            cls._local.in_task = True
+            QueryAccountingListener.activate(query_stats)
+            try:
+                return f(*args)
+            finally:
+                QueryAccountingListener.activate(None)
+                cls._local.in_task = False
+
+        executor = cls._get_executor()
+        futures = [executor.submit(run, f, args) for f, args in tasks]
+        return (future.result() for future in futures)
+
+    def _load_chunk(self, oref, language, lang, version, lang2, version2, wrapNamedEntities, stripItags, wrapLinks):
+        """
+        :return: (TextChunk, its text after modifications, the version that doesn't exist or False)
+        """
+        nonexistant_version = False
+        if language == lang:
+            c = TextChunk(oref, language, version)
+            if len(c._versions) == 0:  # indicates `version` doesn't exist
+                nonexistant_version = version
+        elif language == lang2:
+            c = TextChunk(oref, language, version2)
+            if len(c._versions) == 0:
+                nonexistant_version = version2
+        else:
+            c = TextChunk(oref, language)
+        text_modification_funcs = []
+        if wrapNamedEntities and len(c._versions) > 0:
+            from . import RefTopicLinkSet
+            named_entities = RefTopicLinkSet({"expandedRefs": {"$in": [r.normal() for r in oref.all_segment_refs()]}, "charLevelData.versionTitle": c._versions[0].versionTitle, "charLevelData.language": language})
+            if len(named_entities) > 0:
+                # assumption is that refTopicLinks are all to unranged refs
+                ne_by_secs = defaultdict(list)
+                for ne in named_entities:
+                    try:
+                        temp_ref = Ref(ne.ref)
+                    except InputError:
+                        continue
+                    temp_secs = tuple(s-1 for s in temp_ref.sections)
+                    ne_by_secs[temp_secs] += [ne]
+                text_modification_funcs += [lambda s, secs: library.get_wrapped_named_entities_string(ne_by_secs[tuple(secs)], s)]
+        if stripItags:
+            text_modification_funcs += [lambda s, secs: c._strip_itags(s), lambda s, secs: ' '.join(s.split()).strip()]
+        if wrapLinks and c.version_ids():
+            #only wrap links if we know there ARE links- get the version, since that's the only reliable way to get it's ObjectId
+            #then count how many links came from that version. If any- do the wrapping.
+            from . import Link
+            query = oref.ref_regex_query()
+            query.update({"generated_by": "add_links_from_text"})  # , "source_text_oid": {"$in": c.version_ids()}
+            if Link().load(query) is not None:
+                text_modification_funcs += [lambda s, secs: library.get_wrapped_refs_string(s, lang=language, citing_only=True)]
+        padded_sections, _ = oref.get_padded_sections()
+        return c, c._get_text_after_modifications(text_modification_funcs, start_sections=padded_sections), nonexistant_version
+
+    @staticmethod
+    def _load_commentary(oref):
+        from sefaria.client.wrapper import get_links
+        if not oref.is_spanning():
+            links = get_links(oref.normal())  #todo - have this function accept an object
+        else:
+            links = [get_links(r.normal()) for r in oref.split_spanning_ref()]
+        return links if "error" not in links else []
+
     def contents(self):
         """
         :return dict: Returns the contents of the text family.
@@ -2256,14 +2641,30 @@ class TextFamily(object):
 class RefCacheType(type):
     """
     Metaclass for Ref class.
-    Caches all Ref isntances according to the string they were instanciated with and their normal form.
+    Caches Ref instances according to the string they were instanciated with and their normal form.
     Returns cached instance on instanciation if either instanciation string or normal form are matched.
+
+    The cache is bounded.  Keys are kept in least-recently-used order, and once the cache holds more than
+    REF_CACHE_MAX_ENTRIES keys, or more than REF_CACHE_MAX_BYTES of (estimated) memory, the least recently used keys
+    are evicted.  A limit of None means unbounded.
+    Each Ref is accounted for once, no matter how many strings map to it.  Its memory is released from the budget
+    when the last key pointing at it is evicted.
+    The cache may be used from several threads.  Reads and changes of the cache hold a reentrant lock, which is not
+    held while a new Ref is parsed.
     """
 
     def __init__(cls, name, parents, dct):
         super(RefCacheType, cls).__init__(name, parents, dct)
-        cls.__tref_oref_map = {}
-        cls.__index_tref_map = {}
+        cls.__tref_oref_map = OrderedDict()  # tref -> Ref, in LRU order (oldest first)
+        cls.__index_tref_map = {}            # index title -> set of trefs
+        cls.__oref_accounting = {}           # id(Ref) -> [number of keys pointing at Ref, estimated bytes of Ref]
+        cls.__cache_bytes = 0
+        cls.__max_entries = REF_CACHE_MAX_ENTRIES
+        cls.__max_bytes = REF_CACHE_MAX_BYTES
+        cls.__hits = 0
+        cls.__misses = 0
+        cls.__evictions = 0
+        cls.__lock = threading.RLock()
 
     def cache_size(cls):
         return len(cls.__tref_oref_map)
@@ -2273,14 +2674,53 @@ class RefCacheType(type):
         return get_size(cls.__tref_oref_map)
 
     def cache_dump(cls):
-        return [(a, repr(b)) for (a, b) in cls.__tref_oref_map.items()]
+        with cls.__lock:
+            return [(a, repr(b)) for (a, b) in cls.__tref_oref_map.items()]
+
+    def cache_stats(cls):
+        """
+        :return dict: Counters and sizes of the Ref cache.  `bytes` is the running estimate used for the byte budget,
+        which is much cheaper to compute than `cache_size_bytes()`
+        """
+        with cls.__lock:
+            return {
+                "entries": len(cls.__tref_oref_map),
+                "refs": len(cls.__oref_accounting),
+                "indexes": len(cls.__index_tref_map),
+                "bytes": cls.__cache_bytes,
+                "max_entries": cls.__max_entries,
+                "max_bytes": cls.__max_bytes,
+                "hits": cls.__hits,
+                "misses": cls.__misses,
+                "evictions": cls.__evictions,
+            }
+
+    def reset_cache_stats(cls):
+        with cls.__lock:
+            cls.__hits = 0
+            cls.__misses = 0
+            cls.__evictions = 0
+
+    def set_cache_limits(cls, max_entries=None, max_bytes=None):
+        """
+        Changes the cache budget, evicting immediately if the cache is over the new limits.
+        :param max_entries: Maximum number of keys held in the cache.  None for no limit.
+        :param max_bytes: Maximum estimated bytes held in the cache.  None for no limit.
+        """
+        with cls.__lock:
+            cls.__max_entries = max_entries
+            cls.__max_bytes = max_bytes
+            cls._enforce_cache_limits()
 
     def _raw_cache(cls):
         return cls.__tref_oref_map
 
     def clear_cache(cls):
-        cls.__tref_oref_map = {}
-        cls.__index_tref_map = {}
+        with cls.__lock:
+            cls.__tref_oref_map = OrderedDict()
+            cls.__index_tref_map = {}
+            cls.__oref_accounting = {}
+            cls.__cache_bytes = 0
 
     def remove_index_from_cache(cls, index_title):
         """
@@ -2289,14 +2729,71 @@ class RefCacheType(type):
         :param index_title:
         :return:
         """
-        try:
-            for tref in cls.__index_tref_map[index_title]:
-                try:
-                    del cls.__tref_oref_map[tref]
-                except KeyError:
-                    continue
-        except KeyError:
-            pass
+        with cls.__lock:
+            for tref in cls.__index_tref_map.pop(index_title, ()):
+                cls._remove_cache_key(tref, index_title)
+
+    @staticmethod
+    def _estimate_ref_bytes(oref):
+        """
+        Shallow estimate of the memory held by a single Ref.
+        Objects shared between Refs (the Index and its nodes) are not counted.
+        """
+        attrs = oref.__dict__
+        size = sys.getsizeof(oref) + sys.getsizeof(attrs)
+        for v in attrs.values():
+            if isinstance(v, (str, list, dict, tuple)):
+                size += sys.getsizeof(v)
+        return size
+
+    def _add_cache_key(cls, tref, oref, title):
+        with cls.__lock:
+            if tref in cls.__tref_oref_map:
+                cls.__tref_oref_map.move_to_end(tref)
+                return
+            cls.__tref_oref_map[tref] = oref
+            cls.__index_tref_map.setdefault(title, set()).add(tref)
+            cls.__cache_bytes += sys.getsizeof(tref)
+
+            accounting = cls.__oref_accounting.get(id(oref))
+            if accounting is None:
+                oref_bytes = cls._estimate_ref_bytes(oref)
+                cls.__oref_accounting[id(oref)] = [1, oref_bytes]
+                cls.__cache_bytes += oref_bytes
+            else:
+                accounting[0] += 1
+
+    def _remove_cache_key(cls, tref, title=None):
+        with cls.__lock:
+            oref = cls.__tref_oref_map.pop(tref, None)
+            if oref is None:
+                return
+            cls.__cache_bytes -= sys.getsizeof(tref)
+
+            accounting = cls.__oref_accounting[id(oref)]
+            accounting[0] -= 1
+            if accounting[0] == 0:
+                del cls.__oref_accounting[id(oref)]
+                cls.__cache_bytes -= accounting[1]
+
+            if title is None:
+                title = oref.index.title
+                trefs = cls.__index_tref_map.get(title)
+                if trefs is not None:
+                    trefs.discard(tref)
+                    if not trefs:
+                        del cls.__index_tref_map[title]
+
+    def _over_cache_limits(cls):
+        return (cls.__max_entries is not None and len(cls.__tref_oref_map) > cls.__max_entries) \
+            or (cls.__max_bytes is not None and cls.__cache_bytes > cls.__max_bytes)
+
+    def _enforce_cache_limits(cls):
+        with cls.__lock:
+            while cls.__tref_oref_map and cls._over_cache_limits():
+                oldest_tref = next(iter(cls.__tref_oref_map))
+                cls._remove_cache_key(oldest_tref)
+                cls.__evictions += 1
 
     def __call__(cls, *args, **kwargs):
         if len(args) == 1:
@@ -2307,41 +2804,39 @@ class RefCacheType(type):
         obj_arg = kwargs.get("_obj")
 
         if tref:
-            if tref in cls.__tref_oref_map:
-                return cls.__tref_oref_map[tref]
-            else:
-                result = super(RefCacheType, cls).__call__(*args, **kwargs)
-                uid = result.uid()
-                title = result.index.title
-                if uid in cls.__tref_oref_map:
-                    #del result  #  Do we need this to keep memory clean?
-                    cls.__tref_oref_map[tref] = cls.__tref_oref_map[uid]
-                    try:
-                        cls.__index_tref_map[title] += [tref]
-                    except KeyError:
-                        cls.__index_tref_map[title] = [tref]
-                    return cls.__tref_oref_map[uid]
-                cls.__tref_oref_map[uid] = result
-                cls.__tref_oref_map[tref] = result
-                try:
-                    cls.__index_tref_map[title] += [tref]
-                except KeyError:
-                    cls.__index_tref_map[title] = [tref]
-                cls.__index_tref_map[title] += [uid]
+            with cls.__lock:
+                cached = cls.__tref_oref_map.get(tref)
+                if cached is not None:
+                    cls.__hits += 1
+                    cls.__tref_oref_map.move_to_end(tref)
+                    return cached
+                cls.__misses += 1
 
-                return result
-        elif obj_arg:
             result = super(RefCacheType, cls).__call__(*args, **kwargs)
             uid = result.uid()
             title = result.index.title
-            if uid in cls.__tref_oref_map:
-                #del result  #  Do we need this to keep memory clean?
-                return cls.__tref_oref_map[uid]
-            cls.__tref_oref_map[uid] = result
-            try:
-                cls.__index_tref_map[title] += [uid]
-            except KeyError:
-                cls.__index_tref_map[title] = [uid]
+            with cls.__lock:
+                cached = cls.__tref_oref_map.get(uid)
+                if cached is not None:
+                    #del result  #  Do we need this to keep memory clean?
+                    result = cached
+                cls._add_cache_key(uid, result, title)
+                cls._add_cache_key(tref, result, title)
+                cls._enforce_cache_limits()
+            return result
+        elif obj_arg:
+            result = super(RefCacheType, cls).__call__(*args, **kwargs)
+            uid = result.uid()
+            with cls.__lock:
+                cached = cls.__tref_oref_map.get(uid)
+                if cached is not None:
+                    #del result  #  Do we need this to keep memory clean?
+                    cls.__hits += 1
+                    cls.__tref_oref_map.move_to_end(uid)
+                    return cached
+                cls.__misses += 1
+                cls._add_cache_key(uid, result, result.index.title)
+                cls._enforce_cache_limits()
             return result
         else:  # Default.  Shouldn't be used.
             return super(RefCacheType, cls).__call__(*args, **kwargs)
@@ -4150,12 +4645,14 @@ class Ref(object, metaclass=RefCacheType):
         """
         A list of available text versions titles and languages matching this ref.
         If this ref is book level, decorate with the first available section of content per version.
+        Answered from the :class:`VersionCatalog` of the Index, except for virtual nodes.
 
         :return list: each list element is an object with keys 'versionTitle' and 'language'
         """
-        fields = ["versionTitle", "versionSource", "language", "status", "license", "versionNotes",
-                  "digitizedBySefaria", "priority", "versionTitleInHebrew", "versionNotesInHebrew", "extendedNotes",
-                  "extendedNotesHebrew", "purchaseInformationImage", "purchaseInformationURL"]
+        if not self.index_node.is_virtual:
+            return VersionCatalog.get(self.index.title).version_list(self)
+
+        fields = VersionCatalog.fields
         versions = VersionSet(self.condition_query())
         version_list = []
         if self.is_book_level():
@@ -4469,6 +4966,13 @@ class Library(object):
         self._title_regex_strings = {}
         self._title_regexes = {}
 
+        # Title scanners, keyed like `_title_regexes`.  See `title_scanner()`
+        self._title_scanners = {}
+
+        # Held while the title lists, regexes and scanners above are built or reset, which may happen on several
+        # threads at once (see `TextFamily`)
+        self._title_lock = threading.RLock()
+
         # Maps, keyed by language, from term names to text refs
         self._term_ref_maps = {lang: {} for lang in self.langs}
 
@@ -4534,21 +5038,20 @@ class Library(object):
                 logger.error("Error in generating title node dictionary: {}".format(e))
 
     def _reset_index_derivative_objects(self, include_auto_complete=False):
-        self._full_title_lists = {}
-        self._full_title_list_jsons = {}
-        self._title_regex_strings = {}
-        self._title_regexes = {}
+        with self._title_lock:
+            self._full_title_lists = {}
+            self._full_title_list_jsons = {}
+            self._title_regex_strings = {}
+            self._title_regexes = {}
+            self._title_scanners = {}
         # TOC is handled separately since it can be edited in place
 
     def rebuild(self, include_toc = False, include_auto_complete=False):
         self.get_simple_term_mapping_json(rebuild=True)
         self._build_topic_mapping()
         self._build_index_maps()
-        self._full_title_lists = {}
-        self._full_title_list_jsons = {}
         self.reset_text_titles_cache()
-        self._title_regex_strings = {}
-        self._title_regexes = {}
+        self._reset_index_derivative_objects()
         Ref.clear_cache()
         if include_toc:
             self.rebuild_toc()
@@ -4595,6 +5098,227 @@ class Library(object):
         self.last_cached = time.time() # just use the unix timestamp, we dont need any fancy timezone faffing, just objective point in time.
         scache.set_shared_cache_elem("last_cached", self.last_cached)
 
+    # Bump when the layout of the snapshot payload, or of the objects pickled into it, changes.
+    SNAPSHOT_FORMAT_VERSION = 1
+
+    # Library attributes stored in a snapshot.  Compiled regexes are not stored (re2 objects can not be pickled),
+    # but the regex strings are, and are compiled lazily by `all_titles_regex()`.
+    _snapshot_attrs = [
+        "_index_map",
+        "_index_title_maps",
+        "_title_node_maps",
+        "_full_title_lists",
+        "_title_regex_strings",
+        "_term_ref_maps",
+        "_simple_term_mapping",
+        "_full_term_mapping",
+        "_topic_mapping",
+        "_full_auto_completer",
+        "_ref_auto_completer",
+        "_lexicon_auto_completer",
+        "_cross_lexicon_auto_completer",
+    ]
+
+    def _snapshot_key(self):
+        """
+        :return dict: Identifies the state of the library that a snapshot was built from.
+        `last_cached` moves forward whenever an Index, Term or the TOC changes, so any such change makes old snapshots stale.
+        The full auto completer and the topic mapping also draw on topics, people, user profiles and collections,
+        so their counts, and the latest modification of a collection, are included.  Changes that these don't reveal
+        (renamed topics or users, sheet counts) are bounded by LIBRARY_SNAPSHOT_MAX_AGE.
+        """
+        latest_collection = db.groups.find_one({}, {"lastModified": 1}, sort=[("lastModified", -1)])
+        return {
+            "format": self.SNAPSHOT_FORMAT_VERSION,
+            "db": db.name,
+            "last_cached": self.get_last_cached_time(),
+            "index_count": db.index.estimated_document_count(),
+            "term_count": db.term.estimated_document_count(),
+            "topic_count": db.topics.estimated_document_count(),
+            "person_count": db.person.estimated_document_count(),
+            "profile_count": db.profiles.estimated_document_count(),
+            "collection_count": db.groups.estimated_document_count(),
+            "collection_modified": latest_collection.get("lastModified") if latest_collection else None,
+        }
+
+    def _snapshot_is_current(self, stored_key):
+        """
+        :param stored_key: the key stored in a snapshot, which also has the time it was created
+        :return bool: True if the snapshot was built from the current state of the library, and isn't too old
+        """
+        if not stored_key:
+            return False
+        stored_key = dict(stored_key)
+        created = stored_key.pop("created", 0)
+        if LIBRARY_SNAPSHOT_MAX_AGE and time.time() - created > LIBRARY_SNAPSHOT_MAX_AGE:
+            return False
+        return stored_key == self._snapshot_key()
+
+    def map_auto_completer_tries(self, directory, token=None):
+        """
+        Moves the tries of the built auto completers into memory mapped files in `directory` (see :class:`MappedTrie`).
+        A snapshot saved afterwards refers to the files, so every process that loads it shares their pages.
+        :param token: included in the names of the files written.  Defaults to a new random token.
+        :return str: the token.  Files of earlier calls are left in place; `save_snapshot()` removes them once no
+        snapshot refers to them.
+        """
+        import os
+        import uuid
+        from sefaria.utils.mapped_trie import MappedTrie
+
+        os.makedirs(directory, exist_ok=True)
+        token = token or uuid.uuid4().hex[:12]
+        path_prefix = lambda name: os.path.join(directory, "{}.{}".format(name, token))
+        for lang, ac in self._full_auto_completer.items():
+            ac.map_tries(path_prefix("full-{}".format(lang)))
+        for lang, ac in self._ref_auto_completer.items():
+            ac.map_tries(path_prefix("ref-{}".format(lang)))
+        if self._cross_lexicon_auto_completer is not None:
+            self._cross_lexicon_auto_completer.map_tries(path_prefix("cross-lexicon"))
+        for lexicon, trie in list(self._lexicon_auto_completer.items()):
+            self._lexicon_auto_completer[lexicon] = MappedTrie.build(
+                path_prefix("lexicon-{}".format(lexicon.replace(" ", "_"))) + ".trie", trie.items())
+        return token
+
+    @staticmethod
+    def _remove_unreferenced_tries(directory, token):
+        """
+        Removes the trie files in `directory` that weren't written with `token`.  Processes that have them mapped keep
+        their mappings.
+        """
+        import os
+        import glob
+
+        for old in glob.glob(os.path.join(directory, "*.trie")):
+            if ".{}-".format(token) not in old and ".{}.".format(token) not in old:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+
+    @staticmethod
+    @contextmanager
+    def _snapshot_lock(path, shared=False):
+        """
+        Holds a lock on the snapshot at `path`, in a file beside it.  Writers hold it exclusively while they write the
+        snapshot and remove the trie files of the one it replaces.  Readers hold it shared, so that the files of the
+        snapshot they read aren't removed while they load it.
+        """
+        import fcntl
+
+        with open(path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_snapshot_key(self, path):
+        import pickle
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            return None
+
+    def save_snapshot(self, path=None, trie_dir=None, force=False):
+        """
+        Writes the title maps, term mappings and auto completers to disk, so that other processes can start up
+        with `load_snapshot()` rather than rebuilding them from the database.
+        Only those auto completers that are already built are stored.
+        Writers are serialized.  If another process wrote a current snapshot in the meantime, it is kept.
+        :param path: Defaults to LIBRARY_SNAPSHOT_PATH.  If neither is set, does nothing.
+        :param trie_dir: Defaults to AUTOCOMPLETE_TRIE_DIR.  If set, the auto completer tries are moved to memory mapped
+        files in this directory (see `map_auto_completer_tries()`), and the snapshot refers to them.
+        :param force: write even if the snapshot on disk is current, e.g. after rebuilding the auto completers
+        :return bool: True if a snapshot was written
+        """
+        import os
+        import uuid
+        import pickle
+        import tempfile
+
+        path = path or LIBRARY_SNAPSHOT_PATH
+        if not path:
+            return False
+        directory = os.path.dirname(os.path.abspath(path))
+        trie_dir = trie_dir or AUTOCOMPLETE_TRIE_DIR
+
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with self._snapshot_lock(path):
+                if not force and self._snapshot_is_current(self._read_snapshot_key(path)):
+                    return False  # Written by another process while this one waited for the lock
+                key = dict(self._snapshot_key(), created=time.time())
+
+                token = uuid.uuid4().hex[:12]
+                if trie_dir:
+                    try:
+                        self.map_auto_completer_tries(trie_dir, token)
+                    except Exception as e:
+                        logger.warning("Failed to write auto completer tries to {}: {}".format(trie_dir, e))
+
+                # Make sure that derivative objects that are cheap to store, but expensive to build, are in the snapshot
+                for lang in self.langs:
+                    self.full_title_list(lang)
+                    self.all_titles_regex_string(lang)
+                    self.all_titles_regex_string(lang, citing_only=True)
+
+                payload = {attr: getattr(self, attr) for attr in self._snapshot_attrs}
+                with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False) as f:
+                    try:
+                        pickle.dump(key, f, protocol=pickle.HIGHEST_PROTOCOL)
+                        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    except Exception:
+                        f.close()
+                        os.remove(f.name)
+                        raise
+                os.replace(f.name, path)  # Atomic, so that concurrently starting processes never see a partial file
+                if trie_dir:
+                    # Only now that the new snapshot is in place are the files of the old one unreferenced
+                    self._remove_unreferenced_tries(trie_dir, token)
+        except Exception as e:
+            logger.warning("Failed to write library snapshot to {}: {}".format(path, e))
+            return False
+        return True
+
+    def load_snapshot(self, path=None):
+        """
+        Loads the objects stored by `save_snapshot()`, if the snapshot was built from the current state of the library.
+        :param path: Defaults to LIBRARY_SNAPSHOT_PATH.  If neither is set, does nothing.
+        :return bool: True if the snapshot was loaded.  False if there was no snapshot, or if it was stale or unreadable.
+        """
+        import os
+        import pickle
+
+        path = path or LIBRARY_SNAPSHOT_PATH
+        if not path or not os.path.exists(path):
+            return False
+
+        try:
+            with self._snapshot_lock(path, shared=True), open(path, "rb") as f:
+                key = pickle.load(f)
+                if not self._snapshot_is_current(key):
+                    logger.info("Library snapshot at {} is stale.  Rebuilding.".format(path))
+                    return False
+                payload = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning("Failed to read library snapshot from {}: {}".format(path, e))
+            return False
+
+        for attr in self._snapshot_attrs:
+            setattr(self, attr, payload[attr])
+        self._title_regexes = {}
+        self._title_scanners = {}
+        self._full_title_list_jsons = {}
+        self._full_auto_completer_is_ready = bool(self._full_auto_completer)
+        self._ref_auto_completer_is_ready = bool(self._ref_auto_completer)
+        self._lexicon_auto_completer_is_ready = bool(self._lexicon_auto_completer)
+        self._cross_lexicon_auto_completer_is_ready = self._cross_lexicon_auto_completer is not None
+        return True
+
     def get_toc(self, rebuild=False):
         """
         Returns table of contents object from cache,
@@ -4807,12 +5531,16 @@ class Library(object):
             logger.warning("Built {} ref auto completer.".format(lang))
             return self._ref_auto_completer[lang]
 
-    def recount_index_in_toc(self, indx):
+    def recount_index_in_toc(self, indx, tref=None):
+        """
+        :param indx: Index, or its title when called remotely, in multiserver mode
+        :param tref: optional.  If passed, only the sections of this ref are recounted.
+        """
         # This is used in the case of a remotely triggered multiserver update
         if isinstance(indx, str):
             indx = Index().load({"title": indx})
 
-        self.get_toc_tree().update_title(indx, recount=True)
+        self.get_toc_tree().update_title(indx, recount=True, changed_ref=Ref(tref) if tref else None)
 
         from sefaria.summaries import update_title_in_toc
         self._search_filter_toc = update_title_in_toc(self.get_search_filter_toc(), indx, recount=False, for_search=True)
@@ -4953,6 +5681,8 @@ class Library(object):
         new_index = Index().load({"title": index_object_title})
         assert new_index, "No Index record found for {}: {}".format(index_object.__class__.__name__, index_object_title)
         self.add_index_record_to_cache(new_index, rebuild=True)
+        # The Versions may have been restructured along with the Index, and saved without notifying dependencies
+        VersionCatalog.invalidate(index_object_title)
 
     #todo: the for_js path here does not appear to be in use.
     #todo: Rename, as method not gauraunteed to return all titles
@@ -4971,21 +5701,24 @@ class Library(object):
             key += "_terms"
         re_string = self._title_regex_strings.get(key)
         if not re_string:
-            re_string = ""
-            if citing_only:
-                simple_books = list(map(re.escape, self.citing_title_list(lang)))
-            else:
-                simple_books = list(map(re.escape, self.full_title_list(lang, with_terms=with_terms)))
-            simple_book_part = r'|'.join(sorted(simple_books, key=len, reverse=True))  # Match longer titles first
-
-            # re_string += ur'(?:^|[ ([{>,-]+)' if for_js else u''  # Why don't we check for word boundaries internally as well?
-            # re_string += ur'(?:\u05d5?(?:\u05d1|\u05de|\u05dc|\u05e9|\u05d8|\u05d8\u05e9)?)' if for_js and lang == "he" else u'' # likewise leading characters in Hebrew?
-            # re_string += ur'(' if for_js else
-            re_string = r'(?P<title>'
-            re_string += simple_book_part
-            re_string += r')'
-            re_string += r'($|[:., <]+)'
-            self._title_regex_strings[key] = re_string
+            with self._title_lock:
+                re_string = self._title_regex_strings.get(key)
+                if not re_string:
+                    re_string = ""
+                    if citing_only:
+                        simple_books = list(map(re.escape, self.citing_title_list(lang)))
+                    else:
+                        simple_books = list(map(re.escape, self.full_title_list(lang, with_terms=with_terms)))
+                    simple_book_part = r'|'.join(sorted(simple_books, key=len, reverse=True))  # Match longer titles first
+
+                    # re_string += ur'(?:^|[ ([{>,-]+)' if for_js else u''  # Why don't we check for word boundaries internally as well?
+                    # re_string += ur'(?:\u05d5?(?:\u05d1|\u05de|\u05dc|\u05e9|\u05d8|\u05d8\u05e9)?)' if for_js and lang == "he" else u'' # likewise leading characters in Hebrew?
+                    # re_string += ur'(' if for_js else
+                    re_string = r'(?P<title>'
+                    re_string += simple_book_part
+                    re_string += r')'
+                    re_string += r'($|[:., <]+)'
+                    self._title_regex_strings[key] = re_string
 
         return re_string
 
@@ -5007,14 +5740,37 @@ class Library(object):
             key += "_terms" if with_terms else ""
         reg = self._title_regexes.get(key)
         if not reg:
-            re_string = self.all_titles_regex_string(lang, with_terms, citing_only)
-            try:
-                reg = re.compile(re_string, max_mem=512 * 1024 * 1024)
-            except TypeError:
-                reg = re.compile(re_string)
-            self._title_regexes[key] = reg
+            with self._title_lock:
+                reg = self._title_regexes.get(key)
+                if not reg:
+                    re_string = self.all_titles_regex_string(lang, with_terms, citing_only)
+                    try:
+                        reg = re.compile(re_string, max_mem=512 * 1024 * 1024)
+                    except TypeError:
+                        reg = re.compile(re_string)
+                    self._title_regexes[key] = reg
         return reg
 
+    def title_scanner(self, lang="en", with_terms=False, citing_only=False):
+        """
+        :return: :class:`TitleScanner` that finds the same titles as `all_titles_regex()` with the same arguments,
+        in one pass over a string and without the memory of the compiled regex
+        """
+        if citing_only:
+            key = "citing_titles_" + lang
+        else:
+            key = "all_titles_" + lang
+            key += "_terms" if with_terms else ""
+        scanner = self._title_scanners.get(key)
+        if not scanner:
+            with self._title_lock:
+                scanner = self._title_scanners.get(key)
+                if not scanner:
+                    from sefaria.utils.title_scanner import TitleScanner
+                    titles = self.citing_title_list(lang) if citing_only else self.full_title_list(lang, with_terms=with_terms)
+                    scanner = self._title_scanners[key] = TitleScanner(titles)
+        return scanner
+
     def ref_list(self):
         """
         :return: list of all section-level Refs in the library
@@ -5137,10 +5893,13 @@ class Library(object):
         key = "citing-{}".format(lang)
         titles = self._full_title_lists.get(key)
         if not titles:
-            titles = []
-            for i in IndexSet({"is_cited": True}):
-                titles.extend(self._index_title_maps[lang][i.title])
-            self._full_title_lists[key] = titles
+            with self._title_lock:
+                titles = self._full_title_lists.get(key)
+                if not titles:
+                    titles = []
+                    for i in IndexSet({"is_cited": True}):
+                        titles.extend(self._index_title_maps[lang][i.title])
+                    self._full_title_lists[key] = titles
         return titles
 
 
@@ -5155,10 +5914,13 @@ class Library(object):
         key += "_terms" if with_terms else ""
         titles = self._full_title_lists.get(key)
         if not titles:
-            titles = list(self.get_title_node_dict(lang).keys())
-            if with_terms:
-                titles += list(self.get_term_dict(lang).keys())
-            self._full_title_lists[key] = titles
+            with self._title_lock:
+                titles = self._full_title_lists.get(key)
+                if not titles:
+                    titles = list(self.get_title_node_dict(lang).keys())
+                    if with_terms:
+                        titles += list(self.get_term_dict(lang).keys())
+                    self._full_title_lists[key] = titles
         return titles
 
     def build_text_titles_json(self, lang="en"):
@@ -5247,7 +6009,7 @@ class Library(object):
         """
         if not lang:
             lang = "he" if is_hebrew(s) else "en"
-        return [m.group('title') for m in self.all_titles_regex(lang, citing_only=citing_only).finditer(s)]
+        return self.title_scanner(lang, citing_only=citing_only).findall(s)
 
     def get_refs_in_string(self, st, lang=None, citing_only=False):
         """
@@ -5278,12 +6040,9 @@ class Library(object):
                     logger.error("Error finding ref for {} in: {}".format(title, st))
 
         else:  # lang == "en"
-            for match in self.all_titles_regex(lang, citing_only=citing_only).finditer(st):
-                title = match.group('title')
-                if not title:
-                    continue
+            for title, start, end in self.title_scanner(lang, citing_only=citing_only).finditer(st):
                 try:
-                    res = self._build_ref_from_string(title, st[match.start():])  # Slice string from title start
+                    res = self._build_ref_from_string(title, st[start:])  # Slice string from title start
                     refs += res
                 except AssertionError as e:
                     logger.info("Skipping Schema Node: {}".format(title))
@@ -2,6 +2,7 @@
 version_state.py
 Writes to MongoDB Collection:
 """
+import copy
 import logging
 from functools import reduce
 
@@ -12,9 +13,11 @@ from . import abstract as abst
 from . import text
 from . import link
 from .text import VersionSet, AbstractIndex, AbstractSchemaContent, IndexSet, library, Ref
-from sefaria.datatype.jagged_array import JaggedTextArray, JaggedIntArray
+from .schema import JaggedArrayNode
+from sefaria.datatype.jagged_array import JaggedTextArray, JaggedIntArray, PackedJaggedArray
 from sefaria.system.exceptions import InputError, BookNameError
 from sefaria.system.cache import delete_template_cache
+from sefaria.system.database import db
 try:
     from sefaria.settings import USE_VARNISH
 except ImportError:
@@ -97,6 +100,7 @@ class VersionState(abst.AbstractMongoRecord, AbstractSchemaContent):
     langs = ["en", "he"]
     lang_map = {lang: "_" + lang for lang in langs}
     lang_keys = list(lang_map.values())
+    refresh_ref_attempts = 3
 
     def __init__(self, index=None, attrs=None, proj=None):
         """
@@ -176,15 +180,7 @@ class VersionState(abst.AbstractMongoRecord, AbstractSchemaContent):
         if self.is_new_state:  # refresh done on init
             return
         self.content = self.index.nodes.visit_content(self._content_node_visitor, self.content)
-        self.index.nodes.visit_structure(self._aggregate_structure_state, self)
-        self.linksCount = link.LinkSet(Ref(self.index.title)).count()
-        fsr = self._first_section_ref()
-        self.first_section_ref = fsr.normal() if fsr else None
-        self.save()
-
-        if USE_VARNISH:
-            from sefaria.system.varnish.wrapper import invalidate_counts
-            invalidate_counts(self.index)
+        self._save_derived_state()
 
     def get_flag(self, flag):
         return self.flags.get(flag, False) # consider all flags False until set True
@@ -240,6 +236,8 @@ class VersionState(abst.AbstractMongoRecord, AbstractSchemaContent):
 
             ja[lkey] = self._node_count(snode, lang)
 
+        ja = self._common_count_type(ja)
+
         # Sum all of the languages
         ja['_all'] = reduce(lambda x, y: x + y, [ja[lkey] for lkey in self.lang_keys])
         zero_mask = ja['_all'].zero_mask()
@@ -252,49 +250,84 @@ class VersionState(abst.AbstractMongoRecord, AbstractSchemaContent):
             # build zero-padded count ("availableTexts")
             padded_ja[lkey] = ja[lkey] + zero_mask
             current[lkey]["availableTexts"] = padded_ja[lkey].array()
+            self._derive_lang_state(snode, current[lkey], ja[lkey])
 
-            # number of units at each level ("availableCounts") from raw counts
-            # depth_sum() reduces anything greater than 1 to 1,
-            # so that the count returned is an accurate measure of how much material is there
-            current[lkey]["availableCounts"] = [ja[lkey].depth_sum(d) for d in range(depth)]
-
-            # Percent of text available, versus its metadata count ("percentAvailable")
-            # and if it's a valid measure ('percentAvailableInvalid')
-            if getattr(snode, "lengths", None):
-                if len(snode.lengths) == depth:
-                    langtotal = reduce(lambda x, y: x + y, current[lkey]["availableCounts"])
-                    schematotal = reduce(lambda x, y: x + y, snode.lengths)
-                    try:
-                        current[lkey]["percentAvailable"] = langtotal / float(schematotal) * 100
-                    except ZeroDivisionError:
-                        current[lkey]["percentAvailable"] = 0
-                elif len(snode.lengths) < depth:
-                    current[lkey]["percentAvailable"] = current[lkey]["availableCounts"][0] / float(snode.lengths[0]) * 100
-                else:
-                    raise Exception("Text has less sections than node.lengths for {}".format(snode.full_title()))
-                current[lkey]['percentAvailableInvalid'] = current[lkey]["percentAvailable"] > 100
+        return current
+
+    def _derive_lang_state(self, snode, lang_state, counts):
+        """
+        Sets the values derived from the counts of one language on `lang_state`, in place.
+        :param lang_state: content of the node for one language, with "availableTexts" already set
+        :param counts: JaggedIntArray or PackedJaggedArray of the language's counts
+        """
+        depth = snode.depth
+
+        # number of units at each level ("availableCounts") from raw counts
+        # depth_sum() reduces anything greater than 1 to 1,
+        # so that the count returned is an accurate measure of how much material is there
+        lang_state["availableCounts"] = [counts.depth_sum(d) for d in range(depth)]
+
+        # Percent of text available, versus its metadata count ("percentAvailable")
+        # and if it's a valid measure ('percentAvailableInvalid')
+        if getattr(snode, "lengths", None):
+            if len(snode.lengths) == depth:
+                langtotal = reduce(lambda x, y: x + y, lang_state["availableCounts"])
+                schematotal = reduce(lambda x, y: x + y, snode.lengths)
+                try:
+                    lang_state["percentAvailable"] = langtotal / float(schematotal) * 100
+                except ZeroDivisionError:
+                    lang_state["percentAvailable"] = 0
+            elif len(snode.lengths) < depth:
+                lang_state["percentAvailable"] = lang_state["availableCounts"][0] / float(snode.lengths[0]) * 100
             else:
-                current[lkey]["percentAvailable"] = 0
-                current[lkey]['percentAvailableInvalid'] = True
+                raise Exception("Text has less sections than node.lengths for {}".format(snode.full_title()))
+            lang_state['percentAvailableInvalid'] = lang_state["percentAvailable"] > 100
+        else:
+            lang_state["percentAvailable"] = 0
+            lang_state['percentAvailableInvalid'] = True
 
-            # Is this text complete? ("textComplete")
-            current[lkey]["textComplete"] = current[lkey]["percentAvailable"] > 99.9
+        # Is this text complete? ("textComplete")
+        lang_state["textComplete"] = lang_state["percentAvailable"] > 99.9
 
-            # What percent complete? ('completenessPercent')
-            # are we doing this with the zero-padded array on purpose?
-            current[lkey]['completenessPercent'] = self._calc_text_structure_completeness(depth, current[lkey]["availableTexts"])
+        # What percent complete? ('completenessPercent')
+        # are we doing this with the zero-padded array on purpose?
+        lang_state['completenessPercent'] = self._calc_text_structure_completeness(depth, lang_state["availableTexts"])
 
-        return current
+    @staticmethod
+    def _common_count_type(counts):
+        """
+        Counts can only be combined if they are all PackedJaggedArrays or all JaggedIntArrays.
+        :param counts: dict of counts
+        """
+        if all(isinstance(c, PackedJaggedArray) for c in counts.values()):
+            return counts
+        return {k: JaggedIntArray(c.array()) if isinstance(c, PackedJaggedArray) else c for k, c in counts.items()}
 
     def _node_count(self, snode, lang="en"):
         """
         Count available versions of a text in the db, segment by segment.
         :return counts:
-        :type return: JaggedIntArray
+        :type return: PackedJaggedArray|JaggedIntArray
         """
-        counts = JaggedIntArray()
+        return self._count_versions(self.versions(lang), snode)
 
-        versions = self.versions(lang)
+    @staticmethod
+    def _count_versions(versions, snode):
+        """
+        Regular texts are counted as PackedJaggedArrays, others as JaggedIntArrays.  Both support the operations
+        used in `_content_node_visitor`.
+        :return counts:
+        :type return: PackedJaggedArray|JaggedIntArray
+        """
+        try:
+            counts = PackedJaggedArray.empty(snode.depth)
+            for version in versions:
+                counts = counts + PackedJaggedArray.from_list(version.content_node(snode), snode.depth).mask()
+            return counts
+        except ValueError:
+            pass
+
+        counts = JaggedIntArray()
         for version in versions:
             raw_text_ja = version.content_node(snode)
             ja = JaggedTextArray(raw_text_ja)
@@ -303,6 +336,144 @@ class VersionState(abst.AbstractMongoRecord, AbstractSchemaContent):
 
         return counts
 
+    def refresh_ref(self, oref):
+        """
+        Updates this state after text at `oref` has changed.
+        Only the top level sections of `oref` are recounted, and patched into the stored state.
+        The patched state is written only if the stored content hasn't changed since it was loaded.  Otherwise it is
+        reloaded and patched again, up to `refresh_ref_attempts` times.
+        Falls back to a full `refresh()` where that isn't possible: for whole nodes, depth 1 texts,
+        states that don't match the current schema, and states that keep changing concurrently.
+        :param oref: Ref to the changed text
+        """
+        if self.is_new_state:  # refresh done on init
+            return
+        snode = oref.index_node
+        if not isinstance(snode, JaggedArrayNode) or snode.is_virtual or snode.depth < 2 or not oref.sections \
+                or oref.index.title != self.index.title:
+            return self.refresh()
+        for attempt in range(self.refresh_ref_attempts):
+            if attempt:
+                self.load({"_id": self._id})
+            original = copy.deepcopy(self.content)
+            if not self._patch_sections(oref, snode):
+                return self.refresh()
+            self._derive_state()
+            result = getattr(db, self.collection).update_one({"_id": self._id, "content": original}, {"$set": {
+                "content": self.content,
+                "linksCount": self.linksCount,
+                "first_section_ref": self.first_section_ref,
+            }})
+            if result.matched_count:
+                self._invalidate_counts()
+                return
+        logger.info("VersionState of {} changed during {} attempts to refresh {}.  Refreshing fully.".format(
+            self.index.title, self.refresh_ref_attempts, oref.normal()))
+        self.load({"_id": self._id})
+        return self.refresh()
+
+    def _patch_sections(self, oref, snode):
+        """
+        Recounts the top level sections of `oref` and patches them into `self.content`.
+        :return: False if the stored state doesn't match the schema, and wasn't patched
+        """
+        try:
+            current = self.content_node(snode)
+            stored = {lkey: current[lkey]["availableTexts"] for lkey in self.lang_keys + ["_all"]}
+        except (KeyError, TypeError):
+            logger.info("VersionState of {} doesn't match its schema.  Refreshing fully.".format(self.index.title))
+            return False
+        if not all(isinstance(a, list) for a in stored.values()):
+            return False
+
+        # Sections past the end of the stored state are recounted with the edited sections, so that the padding
+        # of the new sections matches a full refresh.
+        start = min(oref.sections[0], len(stored["_all"]) + 1) - 1
+        end = oref.toSections[0]
+        recounted = self._recount_sections(oref, snode, start, end)
+        for lkey, section_counts in recounted.items():
+            if len(section_counts) < end - start:
+                # No version has text past the recounted sections, so the stored sections after them are stale.
+                stored[lkey][start:] = section_counts
+            else:
+                stored[lkey][start:start + len(section_counts)] = section_counts
+
+        current["_all"]["shape"] = JaggedIntArray(stored["_all"]).shape()
+        for lkey in self.lang_keys:
+            try:
+                counts = PackedJaggedArray.from_list(stored[lkey], snode.depth)
+            except ValueError:
+                counts = JaggedIntArray(stored[lkey])
+            self._derive_lang_state(snode, current[lkey], counts)
+        return True
+
+    def _recount_sections(self, oref, snode, start, end):
+        """
+        :param start: 0-based index of the first top level section to recount
+        :param end: 0-based index after the last top level section to recount
+        :return: dict of padded counts of the sections for each language, and '_all', as stored in `availableTexts`
+        """
+        address = oref.storage_address()
+        projection = oref.part_projection()
+        projection[address] = {"$slice": [start, end - start]}
+        counts = {}
+        for lang, lkey in self.lang_map.items():
+            versions = VersionSet({"title": self.index.title, "language": lang, address: {"$exists": True}}, proj=projection)
+            counts[lkey] = self._count_versions(versions, snode)
+        counts = self._common_count_type(counts)
+        all_counts = reduce(lambda x, y: x + y, [counts[lkey] for lkey in self.lang_keys])
+        zero_mask = all_counts.zero_mask()
+        padded = {lkey: (counts[lkey] + zero_mask).array() for lkey in self.lang_keys}
+        padded["_all"] = all_counts.array()
+        return padded
+
+    def _save_derived_state(self):
+        """
+        Recomputes the values that depend on node content - aggregates, links count, first section - and saves.
+        """
+        self._derive_state()
+        self.save()
+        self._invalidate_counts()
+
+    def _derive_state(self):
+        """
+        Recomputes the values that depend on node content - aggregates, links count, first section.
+        """
+        self.index.nodes.visit_structure(self._aggregate_structure_state, self)
+        self.linksCount = link.LinkSet(Ref(self.index.title)).count()
+        fsr = self._first_section_ref()
+        self.first_section_ref = fsr.normal() if fsr else None
+
+    def _invalidate_counts(self):
+        if USE_VARNISH:
+            from sefaria.system.varnish.wrapper import invalidate_counts
+            invalidate_counts(self.index)
+
+    def consistency_errors(self):
+        """
+        Compares this state with a full recount, without saving.  Used to check `refresh_ref()`.
+        :return: list of (path, stored value, recounted value) for each difference
+        """
+        stored = (self.content, getattr(self, "first_section_ref", None))
+        try:
+            self.content = self.index.nodes.visit_content(self._content_node_visitor, copy.deepcopy(stored[0]))
+            self.index.nodes.visit_structure(self._aggregate_structure_state, self)
+            fsr = self._first_section_ref()
+            recounted = (self.content, fsr.normal() if fsr else None)
+        finally:
+            self.content, self.first_section_ref = stored
+        errors = self._differences(stored[0], recounted[0], "content")
+        if stored[1] != recounted[1]:
+            errors += [("first_section_ref", stored[1], recounted[1])]
+        return errors
+
+    @classmethod
+    def _differences(cls, a, b, path):
+        if isinstance(a, dict) and isinstance(b, dict):
+            return [d for key in sorted(set(a) | set(b), key=str) for d in cls._differences(a.get(key), b.get(key), "{}.{}".format(path, key))]
+        if isinstance(a, float) or isinstance(b, float):
+            return [] if isinstance(a, (int, float)) and isinstance(b, (int, float)) and abs(a - b) < 1e-9 else [(path, a, b)]
+        return [] if a == b else [(path, a, b)]
 
     @classmethod
     def _calc_text_structure_completeness(cls, text_depth, structure):
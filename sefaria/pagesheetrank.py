@@ -15,6 +15,9 @@ from sefaria.system.database import db
 from .settings import STATICFILES_DIRS
 from functools import reduce
 
+import logging
+logger = logging.getLogger(__name__)
+
 tanach_indexes = set(library.get_indexes_in_category("Tanakh"))
 
 
@@ -96,21 +99,108 @@ def step(w, p, s=0.85):
     return v / numpy.sum(v)
 
 
-def pagerank(g, s=0.85, tolerance=0.00001, maxiter=100, verbose=False, normalize=False):
-    w = create_web(g)
+class sparse_web:
+    """
+    Integer indexed link graph, stored as flat NumPy arrays rather than per node lists.
+    Every in link of every node is one entry in (`link_targets`, `link_sources`, `link_weights`).
+    """
+    def __init__(self, n, link_targets, link_sources, link_weights, number_out_links):
+        self.size = n
+        self.link_targets = link_targets
+        self.link_sources = link_sources
+        self.link_weights = link_weights
+        self.number_out_links = number_out_links
+        self.dangling = number_out_links == 0
+        # 1/out degree for non-dangling pages.  Dangling pages never appear as link sources.
+        self.inv_out_links = numpy.zeros(n)
+        self.inv_out_links[~self.dangling] = 1.0 / number_out_links[~self.dangling]
+
+
+def create_sparse_web(g):
+    """
+    Equivalent of `create_web()`, building a `sparse_web`
+    :param g: list of (ref, {linked_ref: count}) tuples.  Every linked_ref must also be a ref in the list.
+    """
+    n = len(g)
+    node2index = {r: i for i, r in enumerate([x[0] for x in g])}
+    targets, sources, weights = [], [], []
+    number_out_links = numpy.zeros(n)
+    for r_ind, (r, links) in enumerate(g):
+        for r_temp, count in links.items():
+            j = node2index[r_temp]
+            # As in create_web(), in links are counted in whole links, out links are counted by weight
+            rounded = int(round(count))
+            if rounded:
+                targets.append(r_ind)
+                sources.append(j)
+                weights.append(rounded)
+            number_out_links[j] += count
+    return sparse_web(
+        n,
+        numpy.array(targets, dtype=numpy.int64),
+        numpy.array(sources, dtype=numpy.int64),
+        numpy.array(weights, dtype=numpy.float64),
+        number_out_links
+    )
+
+
+def sparse_step(w, p, s=0.85):
+    """
+    Vectorized version of `step()`, over a `sparse_web` and a 1-d probability vector `p`
+    """
     n = w.size
-    p = numpy.matrix(numpy.ones((n, 1))) / n
+    flow = p * w.inv_out_links
+    v = numpy.bincount(w.link_targets, weights=w.link_weights * flow[w.link_sources], minlength=n)
+    inner_product = p[w.dangling].sum()
+    v = s * v + s * inner_product / n + (1 - s) / n
+    return v / v.sum()
+
+
+def initial_pagerank_vector(g, start=None):
+    """
+    :param g: list of (ref, links) tuples, as passed to `pagerank()`
+    :param start: optional dict of ref -> pagerank from a previous run, used to warm start the iteration.
+    Refs missing from `start` are started at the smallest value in `start`.
+    :return: 1-d probability vector
+    """
+    n = len(g)
+    if not start:
+        return numpy.ones(n) / n
+    floor = min(start.values())
+    p = numpy.array([start.get(r, floor) for r, _ in g], dtype=numpy.float64)
+    total = p.sum()
+    return p / total if total > 0 else numpy.ones(n) / n
+
+
+def pagerank(g, s=0.85, tolerance=0.00001, maxiter=100, verbose=False, normalize=False, start=None):
+    """
+    Power iteration PageRank
+    :param g: list of (ref, {linked_ref: count}) tuples
+    :param s: damping factor
+    :param tolerance: stop when the l1 change between iterations falls below this
+    :param maxiter:
+    :param verbose: print convergence per iteration
+    :param normalize: scale results so that the smallest value is 1
+    :param start: optional dict of ref -> pagerank (e.g. from a previous run) to warm start from
+    :return: dict of ref -> pagerank
+    """
+    w = create_sparse_web(g)
+    if w.size == 0:
+        return {}
+    p = initial_pagerank_vector(g, start)
     iteration = 1
     change = 2
     while change > tolerance and iteration < maxiter:
         if verbose:
             print("Iteration: %s" % iteration)
-        new_p = step(w, p, s)
+        new_p = sparse_step(w, p, s)
         change = numpy.sum(numpy.abs(p - new_p))
         if verbose:
             print("Change in l1 norm: %s" % change)
         p = new_p
         iteration += 1
+    logger.info("PageRank of {} nodes {} after {} iterations. Change in l1 norm: {}".format(
+        w.size, "converged" if change <= tolerance else "stopped", iteration - 1, change))
     if normalize:
         # This is interesting and nerdy, but min seems to do the exact same thing
         # dangling_pr_sum = sum(p[j] for j in w.dangling_pages.keys())
@@ -120,10 +210,17 @@ def pagerank(g, s=0.85, tolerance=0.00001, maxiter=100, verbose=False, normalize
             p /= p.min()
         except ValueError:
             pass  # empty list can't calculate min
-    pr_list = list(numpy.squeeze(numpy.asarray(p)))
+    pr_list = p.tolist()
     return {k: v for k, v in zip([x[0] for x in g], pr_list)}
 
 
+def previous_pagerank():
+    """
+    :return: dict of ref -> pagerank, as stored by the last run of `update_pagesheetrank()`
+    """
+    return {r["ref"]: r["pagerank"] for r in db.ref_data.find({"pagerank": {"$exists": True}}, {"ref": 1, "pagerank": 1, "_id": 0})}
+
+
 def has_intersection(a, b):
     for temp_a in a:
         if temp_a in b:
@@ -280,10 +377,14 @@ def pagerank_rank_ref_list(ref_list, normalize=False):
     return ref_list_with_pr
 
 
-def calculate_pagerank():
+def calculate_pagerank(warm_start=True):
+    """
+    :param warm_start: start iterating from the pageranks stored by the last run, which converges in far fewer iterations
+    """
     graph, all_ref_cat_counts = init_pagerank_graph()
     # json.dump(graph.items(), open("{}pagerank_graph3.json".format(STATICFILES_DIRS[0]), "wb"))
-    ranked = pagerank(list(graph.items()), 0.85, verbose=True, tolerance=0.00005)
+    start = previous_pagerank() if warm_start else None
+    ranked = pagerank(list(graph.items()), 0.85, verbose=True, tolerance=0.00005, start=start)
     sorted_ranking = sorted(list(dict(ranked).items()), key=lambda x: x[1])
     count = 0
     smallest_pr = sorted_ranking[0][1]
@@ -306,10 +407,16 @@ def update_pagesheetrank():
         temp_sheetrank_scaled = (1.0 + sheetrank[tref] / 5) ** 2 if tref in sheetrank else RefData.DEFAULT_SHEETRANK
         pagesheetrank[tref] = temp_pagerank_scaled * temp_sheetrank_scaled
     from pymongo import UpdateOne
-    result = db.ref_data.bulk_write([
-        UpdateOne({"ref": tref}, {"$set": {"pagesheetrank": psr}}, upsert=True) for tref, psr in
-        list(pagesheetrank.items())
-    ])
+    # Refs dropped from the pagerank vector (e.g. by the low pagerank cut) lose their stored pagerank, which
+    # would otherwise warm start the next run through `previous_pagerank()`
+    stale = {r["ref"] for r in db.ref_data.find({"pagerank": {"$exists": True}}, {"ref": 1, "_id": 0})} - set(pagerank)
+    updates = [
+        UpdateOne({"ref": tref}, {"$set": {"pagesheetrank": psr, "pagerank": pagerank[tref]}} if tref in pagerank else
+                  {"$set": {"pagesheetrank": psr}, "$unset": {"pagerank": ""}}, upsert=True)
+        for tref, psr in list(pagesheetrank.items())
+    ]
+    updates += [UpdateOne({"ref": tref}, {"$unset": {"pagerank": ""}}) for tref in stale - all_trefs]
+    result = db.ref_data.bulk_write(updates)
 
 
 def cat_bonus(num_cats):
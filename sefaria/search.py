@@ -17,6 +17,7 @@ os.environ['DJANGO_SETTINGS_MODULE'] = "settings"
 import logging
 import json
 import math
+import multiprocessing
 from logging import NullHandler
 from collections import defaultdict
 import time as pytime
@@ -24,13 +25,13 @@ logger = logging.getLogger(__name__)
 
 from elasticsearch import Elasticsearch
 from elasticsearch.client import IndicesClient
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import bulk, streaming_bulk
 from elasticsearch.exceptions import NotFoundError
 from sefaria.model import *
 from sefaria.model.text import AbstractIndex
 from sefaria.model.user_profile import user_link, public_user_data
 from sefaria.model.collection import CollectionSet
-from sefaria.system.database import db
+from sefaria.system.database import db, reconnect
 from sefaria.system.exceptions import InputError
 from sefaria.utils.util import strip_tags
 from .settings import SEARCH_ADMIN, SEARCH_INDEX_NAME_TEXT, SEARCH_INDEX_NAME_SHEET, SEARCH_INDEX_NAME_MERGED, STATICFILES_DIRS
@@ -495,45 +496,122 @@ class TextIndexer(object):
                 raise e
 
     @classmethod
-    def index_all(cls, index_name, merged=False, debug=False, for_es=True, action=None):
+    def get_index_partitions(cls):
+        """
+        :return: sorted list of (title, lang) for every Index and language with a version in the version priority map.
+        A full index is partitioned along these, since in the merged case all versions of a (title, lang) have to
+        be indexed together.
+        """
+        return sorted({(title, lang) for (title, vtitle, lang) in cls.version_priority_map})
+
+    @classmethod
+    def get_partition_versions(cls, title, lang):
+        """
+        :return: iterator of the Versions of `title` in `lang` that are in the version priority map, in priority order.
+        Versions are read from a cursor one at a time, so that only one is in memory.  The cursor's sort is the one
+        that `version_list()` (and so the version priority map) is ordered by.
+        """
+        cursor = db.texts.find({"title": title, "language": lang}, sort=[("priority", -1), ("_id", 1)])
+        for record in cursor:
+            version = Version(record)
+            if (version.title, version.versionTitle, version.language) in cls.version_priority_map:
+                yield version
+
+    @classmethod
+    def index_all(cls, index_name, merged=False, for_es=True, action=None, num_processes=1, checkpoint_path=None, sink=None):
+        """
+        Index every version in the version priority map.
+        :param index_name: name of the Elasticsearch index
+        :param merged:
+        :param for_es: if False, documents are only passed to `action`, not sent anywhere
+        :param action: callback for each segment.  Defaults to `_cache_action`, which queues a bulk action for `sink`.  Only supported with one process.
+        :param num_processes: number of worker processes to spread (title, lang) partitions over
+        :param checkpoint_path: optional file recording partitions that were indexed without failures.  A later run with the same path and index name skips them.
+        :param sink: where bulk actions are sent.  Defaults to an `ElasticsearchBulkSink`.
+        """
+        assert action is None or num_processes == 1, "Custom actions are only supported when indexing in a single process"
         cls.index_name = index_name
         cls.merged = merged
         cls.create_version_priority_map()
         cls.create_terms_dict()
         Ref.clear_cache()  # try to clear Ref cache to save RAM
 
-        versions = sorted([x for x in cls.get_all_versions() if (x.title, x.versionTitle, x.language) in cls.version_priority_map], key=lambda x: cls.version_priority_map[(x.title, x.versionTitle, x.language)][0])
-        versions_by_index = {}
-        # organizing by index for the merged case
-        for v in versions:
-            key = (v.title, v.language)
-            if key in versions_by_index:
-                versions_by_index[key] += [v]
-            else:
-                versions_by_index[key] = [v]
-        print("Beginning index of {} versions.".format(len(versions)))
-        vcount = 0
-        total_versions = len(versions)
-        versions = None  # release RAM
-        for title, vlist in list(versions_by_index.items()):
-            cls.trefs_seen = set()
-            cls.curr_index = vlist[0].get_index() if len(vlist) > 0 else None
-            if for_es:
-                cls._bulk_actions = []
-                try:
-                    cls.best_time_period = cls.curr_index.best_time_period()
-                except ValueError:
-                    cls.best_time_period = None
-            for v in vlist:
-                if v.versionTitle == "Yehoyesh's Yiddish Tanakh Translation [yi]":
-                    print("skipping yiddish. we don't like yiddish")
-                    continue
-
-                cls.index_version(v, action=action)
-                print("Indexed Version {}/{}".format(vcount, total_versions))
-                vcount += 1
-            if for_es:
-                bulk(es_client, cls._bulk_actions, stats_only=True, raise_on_error=False)
+        if for_es and sink is None:
+            sink = ElasticsearchBulkSink()
+        elif not for_es:
+            sink = None
+
+        partitions = cls.get_index_partitions()
+        checkpoint = IndexCheckpoint(checkpoint_path, index_name) if checkpoint_path else None
+        if checkpoint:
+            num_partitions = len(partitions)
+            partitions = [p for p in partitions if not checkpoint.is_done(*p)]
+            print("Resuming from checkpoint. Skipping {} of {} indexes.".format(num_partitions - len(partitions), num_partitions))
+        print("Beginning index of {} indexes in {} process{}.".format(len(partitions), num_processes, "es" if num_processes > 1 else ""))
+
+        start = pytime.time()
+        total_docs = total_failed = 0
+        if num_processes > 1:
+            # Workers are forked, so that they inherit the version priority map and terms dict.
+            # Mongo and Elasticsearch connections are reopened per process, by _reconnect_in_worker.
+            pool = multiprocessing.get_context("fork").Pool(num_processes, initializer=_reconnect_in_worker)
+            results = pool.imap_unordered(_index_partition_in_worker, [(title, lang, sink) for title, lang in partitions])
+        else:
+            pool = None
+            results = (cls.index_partition(title, lang, sink, action) for title, lang in partitions)
+
+        try:
+            for i, (title, lang, num_docs, num_failed) in enumerate(results, 1):
+                total_docs += num_docs
+                total_failed += num_failed
+                if num_failed:
+                    # Not checkpointed, so that a resumed run indexes the partition again
+                    logger.error("Failed to index {} of {} docs of {} ({})".format(num_failed, num_docs + num_failed, title, lang))
+                elif checkpoint:
+                    checkpoint.mark_done(title, lang)
+                elapsed = pytime.time() - start
+                print("Indexed {} ({}) {}/{}. {} docs, {} failed. {:.1f} docs/sec".format(title, lang, i, len(partitions), num_docs, num_failed, total_docs / elapsed if elapsed else 0))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        print("Indexed {} docs in {:.0f} seconds. {} failed".format(total_docs, pytime.time() - start, total_failed))
+
+    @classmethod
+    def index_partition(cls, title, lang, sink=None, action=None):
+        """
+        Index all versions of `title` in `lang`.
+        :param sink: object with a `send(actions)` method, which receives an iterator of the bulk actions created for
+        this partition, and returns (number of documents indexed, number of failures)
+        :param action: passed to `index_version`
+        :return: (title, lang, number of documents indexed, number of failures)
+        """
+        cls.trefs_seen = set()
+        cls.curr_index = library.get_index(title)
+        try:
+            cls.best_time_period = cls.curr_index.best_time_period()
+        except ValueError:
+            cls.best_time_period = None
+        actions = cls._partition_actions(title, lang, action)
+        if sink is None:
+            # Custom actions do their work as the versions are walked
+            return (title, lang, sum(1 for _ in actions), 0)
+        return (title, lang) + tuple(sink.send(actions))
+
+    @classmethod
+    def _partition_actions(cls, title, lang, action=None):
+        """
+        :return: iterator of the bulk actions of the versions of `title` in `lang`.  Versions are walked one at a time,
+        as the actions are consumed, so only the actions of one version are held at once.
+        """
+        for v in cls.get_partition_versions(title, lang):
+            if v.versionTitle == "Yehoyesh's Yiddish Tanakh Translation [yi]":
+                print("skipping yiddish. we don't like yiddish")
+                continue
+            cls._bulk_actions = []
+            cls.index_version(v, action=action)
+            version_actions, cls._bulk_actions = cls._bulk_actions, []
+            yield from version_actions
 
     @classmethod
     def index_version(cls, version, tries=0, action=None):
@@ -662,6 +740,110 @@ class TextIndexer(object):
         }
 
 
+def _reconnect_in_worker():
+    global es_client, index_client
+    reconnect()  # Mongo clients are created per process, so this only connects early
+    es_client = Elasticsearch(SEARCH_ADMIN)
+    index_client = IndicesClient(es_client)
+
+
+def _index_partition_in_worker(args):
+    title, lang, sink = args
+    return TextIndexer.index_partition(title, lang, sink)
+
+
+class ElasticsearchBulkSink(object):
+    """
+    Sends bulk actions to Elasticsearch with `streaming_bulk`.
+    The client is created lazily in each process, so that the sink can be handed to worker processes.
+    """
+    def __init__(self, host=SEARCH_ADMIN, chunk_size=500, max_retries=3):
+        self.host = host
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self._client = None
+        self._pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_client"] = None
+        return state
+
+    def client(self):
+        if self._client is None or self._pid != os.getpid():
+            self._client = Elasticsearch(self.host)
+            self._pid = os.getpid()
+        return self._client
+
+    def send(self, actions):
+        """
+        :return: (number of documents indexed, number of failures)
+        """
+        num_ok = num_failed = 0
+        for ok, item in streaming_bulk(self.client(), actions, chunk_size=self.chunk_size, max_retries=self.max_retries, raise_on_error=False):
+            if ok:
+                num_ok += 1
+            else:
+                num_failed += 1
+                logger.error("Failed to index document: {}".format(item))
+        return num_ok, num_failed
+
+
+class JsonLinesFileSink(object):
+    """
+    Writes bulk actions to json lines files in `directory`, one file per process.
+    Stands in for Elasticsearch in tests and offline runs.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def send(self, actions):
+        path = os.path.join(self.directory, "{}.jsonl".format(os.getpid()))
+        num_ok = 0
+        with open(path, "a", encoding="utf-8") as f:
+            for a in actions:
+                f.write(json.dumps(a, ensure_ascii=False) + "\n")
+                num_ok += 1
+        return num_ok, 0
+
+
+class IndexCheckpoint(object):
+    """
+    Records the (title, lang) partitions of a full text index that have been completely sent,
+    so that a run that stopped can be resumed.  One json line per partition.
+    """
+    def __init__(self, path, index_name):
+        self.path = path
+        self.index_name = index_name
+        self._done = set()
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        continue  # partial line from a crash
+                    if item.get("index_name") == index_name:
+                        self._done.add((item["title"], item["lang"]))
+        except FileNotFoundError:
+            pass
+
+    def is_done(self, title, lang):
+        return (title, lang) in self._done
+
+    def mark_done(self, title, lang):
+        self._done.add((title, lang))
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"index_name": self.index_name, "title": title, "lang": lang}, ensure_ascii=False) + "\n")
+
+    def clear(self):
+        self._done = set()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
 def index_sheets_by_timestamp(timestamp):
     """
     :param timestamp str: index all sheets modified after `timestamp` (in isoformat)
@@ -791,22 +973,23 @@ def get_new_and_current_index_names(type, debug=False):
     return {"new": new_index_name, "current": old_index_name, "alias": alias_name}
 
 
-def index_all(skip=0, merged=False, debug=False):
+def index_all(skip=0, merged=False, debug=False, num_processes=1, checkpoint_path=None):
     """
     Fully create the search index from scratch.
+    To resume a text index that stopped, call again with the same `checkpoint_path` and `skip` > 0.
     """
     start = datetime.now()
     if merged:
-        index_all_of_type('merged', skip=skip, merged=merged, debug=debug)
+        index_all_of_type('merged', skip=skip, merged=merged, debug=debug, num_processes=num_processes, checkpoint_path=checkpoint_path)
     else:
-        index_all_of_type('text', skip=skip, merged=merged, debug=debug)
+        index_all_of_type('text', skip=skip, merged=merged, debug=debug, num_processes=num_processes, checkpoint_path=checkpoint_path)
         index_all_of_type('sheet', skip=skip, merged=merged, debug=debug)
     end = datetime.now()
     db.index_queue.delete_many({})  # index queue is now stale
     print("Elapsed time: %s" % str(end-start))
 
 
-def index_all_of_type(type, skip=0, merged=False, debug=False):
+def index_all_of_type(type, skip=0, merged=False, debug=False, num_processes=1, checkpoint_path=None):
     index_names_dict = get_new_and_current_index_names(type=type, debug=debug)
     print('CREATING / DELETING {}'.format(index_names_dict['new']))
     print('CURRENT {}'.format(index_names_dict['current']))
@@ -816,9 +999,11 @@ def index_all_of_type(type, skip=0, merged=False, debug=False):
 
     if skip == 0:
         create_index(index_names_dict['new'], type)
+        if checkpoint_path:
+            IndexCheckpoint(checkpoint_path, index_names_dict['new']).clear()  # the index is new, so nothing in it is done
     if type == 'text' or type == 'merged':
         TextIndexer.clear_cache()
-        TextIndexer.index_all(index_names_dict['new'], merged=merged, debug=debug)
+        TextIndexer.index_all(index_names_dict['new'], merged=merged, num_processes=num_processes, checkpoint_path=checkpoint_path)
     elif type == 'sheet':
         index_public_sheets(index_names_dict['new'])
 
@@ -849,7 +1034,7 @@ def index_all_commentary_refactor(skip=0, merged=False, debug=False):
 
     if skip == 0:
         create_index(new_index_name, 'merged')
-    TextIndexer.index_all(new_index_name, merged=merged, debug=debug)
+    TextIndexer.index_all(new_index_name, merged=merged)
 
     end = datetime.now()
     print("Elapsed time: %s" % str(end-start))
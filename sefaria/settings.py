@@ -117,6 +117,8 @@ MIDDLEWARE = [
     'sefaria.system.middleware.LanguageCookieMiddleware',
     'sefaria.system.middleware.LanguageSettingsMiddleware',
     'sefaria.system.middleware.ProfileMiddleware',
+    'sefaria.system.middleware.QueryAccountingMiddleware',
+    'sefaria.system.middleware.SamplingProfileMiddleware',
     'sefaria.system.middleware.CORSDebugMiddleware',
     'sefaria.system.middleware.SharedCacheMiddleware',
     'sefaria.system.multiserver.coordinator.MultiServerEventListenerMiddleware',
@@ -310,6 +312,88 @@ GLOBAL_INTERRUPTING_MESSAGE = {
 """
 GLOBAL_INTERRUPTING_MESSAGE = None
 
+# Budget for the in-process Ref cache (see RefCacheType).  None means no limit.
+# Can be overridden in local_settings.
+REF_CACHE_MAX_ENTRIES = 500000
+REF_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# File where the library's title maps and auto completers are snapshotted, to speed up process startup.
+# None disables snapshots.
+LIBRARY_SNAPSHOT_PATH = None
+
+# Seconds after which a library snapshot is rebuilt, even if nothing that its key tracks has changed.  Bounds how long
+# new processes serve auto completion with renamed topics or users, or outdated sheet counts.  None disables.
+LIBRARY_SNAPSHOT_MAX_AGE = 60 * 60 * 6
+
+# Directory where the auto completer tries are written when a library snapshot is saved.  Processes that load the
+# snapshot memory map these files, and so share one copy of the tries.  None keeps the tries in the snapshot itself.
+AUTOCOMPLETE_TRIE_DIR = None
+
+# In-process cache of the version catalog of each Index (see sefaria.model.text.VersionCatalog)
+VERSION_CATALOG_MAX_ENTRIES = 2000
+VERSION_CATALOG_CONTENT_MAX_ENTRIES = 10000  # Bitmaps of one version each
+VERSION_CATALOG_TIMEOUT = 60 * 60 * 6
+
+# In-process cache of WordForm records by form (see sefaria.model.lexicon.LexiconLookupAggregator)
+LEXICON_FORM_CACHE_MAX_ENTRIES = 50000
+LEXICON_FORM_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Related content bundles (see sefaria.client.wrapper.get_related_bundle) are invalidated when their links, sheets,
+# webpages or topic links change.  The timeout bounds staleness of the rest (manuscripts, media, collections).
+RELATED_BUNDLE_CACHE_TIMEOUT = 60 * 60 * 6
+RELATED_BUNDLE_THREADS = 6
+
+# Topic pages (see sefaria.helper.topic.get_topic) are invalidated when their topic, its links or linked topics change.
+# The pages of the TOPIC_PAGE_PREBUILD_COUNT topics with the most sources are rebuilt by recalculate_secondary_topic_data.
+TOPIC_PAGE_CACHE_TIMEOUT = 60 * 60 * 6
+TOPIC_PAGE_PREBUILD_COUNT = 500
+
+# MongoClient connection pool options (see sefaria.system.database).  None leaves the pymongo default.
+MONGO_MAX_POOL_SIZE = 100
+MONGO_MIN_POOL_SIZE = 0
+MONGO_MAX_IDLE_TIME_MS = None
+MONGO_WAIT_QUEUE_TIMEOUT_MS = None
+MONGO_CONNECT_TIMEOUT_MS = 20000
+MONGO_SOCKET_TIMEOUT_MS = None
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 30000
+MONGO_READ_PREFERENCE = "primary"  # e.g. "primaryPreferred", "secondaryPreferred", "nearest"
+
+# Count the Mongo queries, documents and time of each request.  Reported in the X-Mongo-Queries response header,
+# and logged as a warning for requests that issue more than MONGO_QUERY_LOG_THRESHOLD queries.
+MONGO_QUERY_ACCOUNTING = False
+MONGO_QUERY_LOG_THRESHOLD = 100
+
+# Sampling profiler (see sefaria.system.middleware.SamplingProfileMiddleware).  Profiles one in every
+# PROFILER_SAMPLE_RATE requests, and staff requests with an X-Sefaria-Profile header.  0 disables it.
+PROFILER_SAMPLE_RATE = 0
+PROFILER_INTERVAL = 0.005  # seconds between stack samples
+PROFILER_DIR = relative_to_abs_path('../log/profiles')
+PROFILER_MAX_FILE_BYTES = 1024 * 1024 * 20
+PROFILER_BACKUP_COUNT = 5
+
+# Node server side rendering.  Renders for anonymous users are cached in process, keyed on their props.
+NODE_POOL_SIZE = 10  # persistent connections to Node per process
+NODE_RENDER_CACHE_TIMEOUT = 60 * 5
+# Bytes of rendered HTML held by each process (not shared), so the total is this times the number of web processes.
+# A rendered page is typically 50-300KB, so the default holds roughly 100 pages.
+NODE_RENDER_CACHE_MAX_BYTES = 1024 * 1024 * 20
+
+# Varnish purges and bans are queued, deduplicated and sent in batches (see sefaria.system.varnish.common).
+# If async, they are sent from a background thread rather than in the save path.
+VARNISH_ASYNC_INVALIDATION = True
+VARNISH_PURGE_BATCH_SIZE = 200
+VARNISH_BAN_BATCH_SIZE = 20  # ban expressions combined into one ban
+
+# Multiserver events are sent in batches on a Redis Stream (see sefaria.system.multiserver.coordinator).
+MULTISERVER_REDIS_EVENT_STREAM = "msync-events"
+MULTISERVER_REDIS_CONSUMERS_KEY = "msync-consumers"  # heartbeats of the server processes reading the stream
+MULTISERVER_STREAM_MAXLEN = 10000
+MULTISERVER_BATCH_INTERVAL = 0.5  # seconds between batches.  0 sends each event as it's published.
+MULTISERVER_HEARTBEAT_TIMEOUT = 60  # seconds without a heartbeat after which a server process is considered gone
+
+# Threads per process used by TextFamily to load its texts, links and version list concurrently.  0 loads them serially.
+TEXT_FAMILY_THREADS = 0
+
 # Grab environment specific settings from a file which
 # is left out of the repo.
 try: 
@@ -405,6 +405,7 @@ def save_sheet(sheet, user_id, search_override=False, rebuild_nodes=False):
 		if sheet["status"] != existing["status"]:
 			status_changed = True
 
+		old_refs = existing.get("includedRefs", [])
 		old_topics = existing.get("topics", [])
 		topics_diff = topic_list_diff(old_topics, sheet.get("topics", []))
 
@@ -426,6 +427,7 @@ def save_sheet(sheet, user_id, search_override=False, rebuild_nodes=False):
 		sheet["owner"] = user_id
 		sheet["views"] = 1
 		
+		old_refs = []
 		old_topics = []
 		topics_diff = topic_list_diff(old_topics, sheet.get("topics", []))
 
@@ -479,6 +481,9 @@ def save_sheet(sheet, user_id, search_override=False, rebuild_nodes=False):
 	else:
 		db.sheets.find_one_and_replace({"id": sheet["id"]}, sheet)
 
+	from sefaria.client.wrapper import invalidate_related_bundles
+	invalidate_related_bundles(set(old_refs) | set(sheet["includedRefs"]))
+
 	if len(topics_diff["added"]) or len(topics_diff["removed"]):
 		update_sheet_topics(sheet["id"], sheet.get("topics", []), old_topics)
 		sheet = db.sheets.find_one({"id": sheet["id"]})
@@ -1,6 +1,10 @@
 
 import hashlib
+import uuid
 import sys
+import time
+import threading
+from collections import OrderedDict
 from functools import wraps
 from django.http import HttpRequest
 from sefaria import settings
@@ -129,3 +133,198 @@ def get_template_cache(fragment_name='', *args):
 
 def delete_template_cache(fragment_name='', *args):
     delete_cache_elem('template.cache.%s.%s' % (fragment_name, hashlib.md5(':'.join([arg for arg in args]).encode('utf-8')).hexdigest()))
+
+
+def get_cache_generations(keys, cache_type=None):
+    """
+    Returns the current generation token of each key in `keys`, creating tokens for keys that have none.
+    Including the tokens in a cache key lets many cached values be invalidated at once with :func:`bump_cache_generations`.
+    :return: list of tokens, in the order of `keys`
+    """
+    cache_instance = get_cache_factory(cache_type)
+    generations = cache_instance.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in generations}
+    if missing:
+        cache_instance.set_many(missing, None)
+        generations.update(missing)
+    return [generations[key] for key in keys]
+
+
+def bump_cache_generations(keys, cache_type=None):
+    """
+    Gives each key in `keys` a new generation token, orphaning values cached under the old ones.
+    """
+    if keys:
+        get_cache_factory(cache_type).set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+
+class SharedGenerations(object):
+    """
+    Generation tokens of keys in the shared cache, as seen by this process, for in-process caches that must be
+    rebuilt when the data under a key changes in any process.  Each token is fetched at most every `check_interval`
+    seconds, so a change made in another process is seen within that time.  A change made through :meth:`bump` is
+    seen at once in this process.
+    """
+
+    def __init__(self, check_interval, cache_type=SHARED_DATA_CACHE_ALIAS):
+        self.check_interval = check_interval
+        self.cache_type = cache_type
+        self._tokens = {}  # key -> (generation token, time checked)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :return: the current generation token of `key`
+        """
+        # The lock is held while the token is fetched, so that a token fetched before `bump()` can't replace
+        # the token it cleared
+        with self._lock:
+            now = time.time()
+            generation, checked_at = self._tokens.get(key, (None, 0))
+            if now - checked_at >= self.check_interval:
+                generation = get_cache_generations([key], cache_type=self.cache_type)[0]
+                self._tokens[key] = (generation, now)
+            return generation
+
+    def bump(self, keys):
+        """
+        Gives each key in `keys` a new generation token, in the shared cache and in this process.
+        """
+        with self._lock:
+            bump_cache_generations(keys, cache_type=self.cache_type)
+            for key in keys:
+                self._tokens.pop(key, None)
+
+
+class InMemoryCache(object):
+    """
+    Thread safe, in process cache with a timeout, evicting the least recently used values once it holds more than
+    `max_entries` values or more than `max_bytes`, as measured by `size`.  A limit of None means unbounded.
+
+    `get_or_set()` coalesces concurrent misses of a key: the first caller computes the value, and other callers
+    wait for it instead of computing it again.
+    """
+
+    class _Pending(object):
+        def __init__(self):
+            self.event = threading.Event()
+            self.value = None
+            self.error = None
+
+    def __init__(self, timeout=None, max_entries=None, max_bytes=None, size=len):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._size = size
+        self._data = OrderedDict()  # key -> (expiry time or None, value, bytes), in LRU order (oldest first)
+        self._pending = {}          # key -> _Pending
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _get(self, key):
+        # Call with the lock held
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] < time.time():
+            self._remove(key)
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def _remove(self, key):
+        # Call with the lock held
+        entry = self._data.pop(key, None)
+        if entry:
+            self._bytes -= entry[2]
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+            self._hits += 1
+            return entry[1]
+
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        nbytes = self._size(value) if self.max_bytes is not None else 0
+        with self._lock:
+            self._remove(key)
+            if self.max_bytes is not None and nbytes > self.max_bytes:
+                return
+            self._data[key] = (time.time() + timeout if timeout else None, value, nbytes)
+            self._bytes += nbytes
+            while (self.max_entries is not None and len(self._data) > self.max_entries) or \
+                    (self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._data)))
+                self._evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data = OrderedDict()
+            self._bytes = 0
+
+    def get_or_set(self, key, compute, timeout=None, cache_if=None):
+        """
+        :param compute: function of no arguments returning the value of `key`
+        :param cache_if: optional function of the computed value.  The value is only cached if it returns True.
+        Callers that were waiting on the computation get the value either way.
+        :return: the cached or computed value.  If `compute` raises, the error is raised to every waiting caller.
+        """
+        with self._lock:
+            entry = self._get(key)
+            if entry is not None:
+                self._hits += 1
+                return entry[1]
+            pending = self._pending.get(key)
+            is_leader = pending is None
+            if is_leader:
+                self._misses += 1
+                pending = self._pending[key] = self._Pending()
+            else:
+                self._coalesced += 1
+
+        if not is_leader:
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        try:
+            pending.value = compute()
+            if cache_if is None or cache_if(pending.value):
+                self.set(key, pending.value, timeout)
+            return pending.value
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            pending.event.set()
+
+    def stats(self):
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "coalesced": self._coalesced,
+            "evictions": self._evictions,
+        }
+
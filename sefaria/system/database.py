@@ -2,35 +2,192 @@
 database.py -- connection to MongoDB
 The system attribute _called_from_test is set in the py.test conftest.py file
 """
+import os
 import sys
+import threading
+from collections import Counter
 from sefaria.settings import *
 import pymongo
+from pymongo import monitoring
 from pymongo.errors import OperationFailure
 
+
+class QueryStats(object):
+    """
+    Count of the Mongo commands issued, documents returned and time spent while a `QueryStats` is active
+    on the current thread.  See `start_query_accounting()`.
+    """
+    def __init__(self):
+        self.queries = 0
+        self.documents = 0
+        self.duration = 0.0  # seconds
+        self.commands = Counter()  # (command name, collection) -> count
+
+    def header_value(self):
+        return "queries={}; docs={}; ms={:.1f}".format(self.queries, self.documents, self.duration * 1000)
+
+    def most_common(self, n=5):
+        return ", ".join("{} {} x{}".format(command, collection, count) for (command, collection), count in self.commands.most_common(n))
+
+
+class QueryAccountingListener(monitoring.CommandListener):
+    """
+    Adds every command issued by this process to the `QueryStats` active on the issuing thread, if any.
+    Command events are published on the thread that runs the command, so work handed off to other threads
+    isn't counted.
+    """
+    _local = threading.local()
+    _ignored_commands = {"isMaster", "ismaster", "hello", "ping", "saslStart", "saslContinue", "endSessions"}
+
+    @classmethod
+    def current(cls):
+        return getattr(cls._local, "stats", None)
+
+    @classmethod
+    def activate(cls, stats):
+        cls._local.stats = stats
+
+    def started(self, event):
+        stats = self.current()
+        if stats is None or event.command_name in self._ignored_commands:
+            return
+        stats.queries += 1
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        stats.commands[(event.command_name, collection if isinstance(collection, str) else "")] += 1
+
+    def succeeded(self, event):
+        stats = self.current()
+        if stats is None or event.command_name in self._ignored_commands:
+            return
+        stats.duration += event.duration_micros / 1e6
+        reply = event.reply or {}
+        cursor = reply.get("cursor")
+        if cursor:
+            stats.documents += len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+        elif isinstance(reply.get("values"), list):
+            stats.documents += len(reply["values"])  # distinct
+
+    def failed(self, event):
+        stats = self.current()
+        if stats is None or event.command_name in self._ignored_commands:
+            return
+        stats.duration += event.duration_micros / 1e6
+
+
+def start_query_accounting():
+    """
+    Starts counting the Mongo commands issued on the current thread, and returns the `QueryStats` they are counted in.
+    Has no effect on counts unless MONGO_QUERY_ACCOUNTING or PROFILER_SAMPLE_RATE is set.
+    """
+    stats = QueryStats()
+    QueryAccountingListener.activate(stats)
+    return stats
+
+
+def stop_query_accounting():
+    """
+    Stops counting Mongo commands on the current thread.
+    :return: the `QueryStats` that was active, or None
+    """
+    stats = QueryAccountingListener.current()
+    QueryAccountingListener.activate(None)
+    return stats
+
+
+def client_options():
+    """
+    Keyword arguments for MongoClient, from the MONGO_* connection pool settings.
+    """
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "readPreference": MONGO_READ_PREFERENCE,
+    }
+    options = {k: v for k, v in options.items() if v is not None}
+    if MONGO_QUERY_ACCOUNTING or PROFILER_SAMPLE_RATE:
+        options["event_listeners"] = [QueryAccountingListener()]
+    return options
+
+
+# TEST_DB = SEFARIA_DB + "_test"
+TEST_DB = SEFARIA_DB
+DB_NAME = TEST_DB if hasattr(sys, '_called_from_test') else SEFARIA_DB
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    :return: the MongoClient of this process.  It is created on first use in each process, and doesn't connect until
+    then, so a process forked from one that has connected (e.g. a `multiprocessing` worker) opens its own connections
+    rather than using the ones it inherited: pymongo clients are not fork safe.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                client = pymongo.MongoClient(MONGO_HOST, MONGO_PORT, connect=False, **client_options())
+                if SEFARIA_DB_USER and SEFARIA_DB_PASSWORD:
+                    client[DB_NAME].authenticate(SEFARIA_DB_USER, SEFARIA_DB_PASSWORD)
+                _client, _client_pid = client, os.getpid()
+    return _client
+
+
+def _reset_client_lock():
+    # A fork while another thread holds the lock would leave it held in the child
+    global _client_lock
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_client_lock)
+
+
+def reconnect():
+    """
+    Opens the MongoClient of this process.  Used as the initializer of worker process pools, so that workers connect
+    when they start rather than on their first query.
+    """
+    get_client()
+
+
+class LazyDatabase(object):
+    """
+    The Database `name` of the MongoClient of the current process (see `get_client()`).
+    Modules import `db` once, and each attribute or item of it is looked up on the client of the process it is used in.
+    """
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, item):
+        if item.startswith("__"):  # not a collection, e.g. a lookup by copy or pickle
+            raise AttributeError(item)
+        return getattr(get_client()[self._name], item)
+
+    def __getitem__(self, item):
+        return get_client()[self._name][item]
+
+
 if hasattr(sys, '_doc_build'):
     db = ""
 else:
-    # TEST_DB = SEFARIA_DB + "_test"
-    TEST_DB = SEFARIA_DB 
-    client = pymongo.MongoClient(MONGO_HOST, MONGO_PORT)
-
-    if not hasattr(sys, '_called_from_test'):
-        db = client[SEFARIA_DB]
-        if SEFARIA_DB_USER and SEFARIA_DB_PASSWORD:
-            db.authenticate(SEFARIA_DB_USER, SEFARIA_DB_PASSWORD)
-    else:
-        db = client[TEST_DB] 
-        if SEFARIA_DB_USER and SEFARIA_DB_PASSWORD:
-            db.authenticate(SEFARIA_DB_USER, SEFARIA_DB_PASSWORD)
+    db = LazyDatabase(DB_NAME)
 
 
 def get_test_db():
-    return client[TEST_DB]
+    return get_client()[TEST_DB]
 
 
 def drop_test():
-    global client
-    client.drop_database(TEST_DB)
+    get_client().drop_database(TEST_DB)
 
 
 # Not used
@@ -54,6 +211,7 @@ def ensure_indices(active_db=None):
         ('groups', ["privateSlug"], {'unique': True}),
         ('groups', ["members"], {}),
         ('groups', ["admins"], {}),
+        ('groups', ["lastModified"], {}),
         ('history', ["revision"],{}),
         ('history', ["method"],{}),
         ('history', [[("ref", pymongo.ASCENDING), ("version", pymongo.ASCENDING), ("language", pymongo.ASCENDING)]],{}),
@@ -77,6 +235,8 @@ def ensure_indices(active_db=None):
         ('links', ["expandedRefs1"],{}),
         ('links', ["source_text_oid"],{}),
         ('links', ["is_first_comment"],{}),
+        ('link_sections', ["section"],{}),
+        ('link_sections', ["link"],{}),
         ('metrics', ["timestamp"], {'unique': True}),
         ('media', ["ref.sefaria_ref"], {}),
         ('notes', [[("owner", pymongo.ASCENDING), ("ref", pymongo.ASCENDING), ("public", pymongo.ASCENDING)]],{}),
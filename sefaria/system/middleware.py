@@ -1,4 +1,6 @@
 import sys 
+import logging
+import random
 import tempfile
 import cProfile
 import pstats
@@ -8,14 +10,19 @@ from django.conf import settings
 from django.utils import translation
 from django.shortcuts import redirect
 from django.http import HttpResponse
+from django.core.exceptions import MiddlewareNotUsed
 
 from sefaria.settings import *
 from sefaria.site.site_settings import SITE_SETTINGS
 from sefaria.model.user_profile import UserProfile
 from sefaria.utils.util import short_to_long_lang_code
 from sefaria.system.cache import get_shared_cache_elem, set_shared_cache_elem
+from sefaria.system.database import start_query_accounting, stop_query_accounting, QueryAccountingListener
+from sefaria.system.profiler import RequestProfile, ProfileStore
 from django.utils.deprecation import MiddlewareMixin
 
+logger = logging.getLogger(__name__)
+
 
 class SharedCacheMiddleware(MiddlewareMixin):
     def process_request(self, request):
@@ -185,3 +192,76 @@ class ProfileMiddleware(MiddlewareMixin):
 
             response = HttpResponse('<pre>%s</pre>' % io.getvalue())
         return response
+
+
+class QueryAccountingMiddleware(MiddlewareMixin):
+    """
+    Counts the Mongo queries, documents returned and time spent in Mongo for each request.
+    The counts are returned in the X-Mongo-Queries header, and requests that issue more than
+    MONGO_QUERY_LOG_THRESHOLD queries are logged with their most repeated commands, to help find N+1 query patterns.
+    Only active when MONGO_QUERY_ACCOUNTING is set.
+    """
+    def __init__(self, get_response=None):
+        if not MONGO_QUERY_ACCOUNTING:
+            raise MiddlewareNotUsed
+        super(QueryAccountingMiddleware, self).__init__(get_response)
+
+    def process_request(self, request):
+        start_query_accounting()
+
+    def process_response(self, request, response):
+        stats = stop_query_accounting()
+        if stats is None:
+            return response
+        response["X-Mongo-Queries"] = stats.header_value()
+        if stats.queries > MONGO_QUERY_LOG_THRESHOLD:
+            logger.warning("{} {} - {} - {}".format(request.method, request.get_full_path(), stats.header_value(), stats.most_common()))
+        else:
+            logger.debug("{} {} - {}".format(request.method, request.get_full_path(), stats.header_value()))
+        return response
+
+
+class SamplingProfileMiddleware(MiddlewareMixin):
+    """
+    Profiles one in every PROFILER_SAMPLE_RATE requests, and requests from staff with the X-Sefaria-Profile header,
+    without changing the response.  Wall clock stacks, Mongo time and Node time are written to the profile store
+    in PROFILER_DIR, and aggregated per view at /admin/profile/stats.
+    Unlike ProfileMiddleware, this is meant to run in production.  Not active if PROFILER_SAMPLE_RATE is 0.
+    """
+    def __init__(self, get_response=None):
+        if not PROFILER_SAMPLE_RATE:
+            raise MiddlewareNotUsed
+        super(SamplingProfileMiddleware, self).__init__(get_response)
+        self.store = ProfileStore()
+
+    def _should_profile(self, request):
+        if "HTTP_X_SEFARIA_PROFILE" in request.META and request.user.is_staff:
+            return True
+        return random.random() * PROFILER_SAMPLE_RATE < 1
+
+    def process_request(self, request):
+        if not self._should_profile(request):
+            return
+        # Counted Mongo queries with QueryAccountingMiddleware's stats if it's active, otherwise with our own.
+        request._profile_own_query_stats = QueryAccountingListener.current() is None
+        request._profile_query_stats = start_query_accounting() if request._profile_own_query_stats else QueryAccountingListener.current()
+        request._profile = RequestProfile().start()
+
+    def process_response(self, request, response):
+        profile = getattr(request, "_profile", None)
+        if profile is None:
+            return response
+        profile.stop()
+        if request._profile_own_query_stats:
+            stop_query_accounting()
+        stats = request._profile_query_stats
+        resolver_match = getattr(request, "resolver_match", None)
+        self.store.append(profile.record(
+            view=resolver_match.view_name if resolver_match else None,
+            path=request.path,
+            method=request.method,
+            status=response.status_code,
+            mongo={"queries": stats.queries, "documents": stats.documents, "duration": stats.duration},
+        ))
+        return response
+
@@ -1,11 +1,17 @@
+import os
 import json
+import time
 import uuid
+import atexit
+import socket
+import threading
 
 from django.core.exceptions import MiddlewareNotUsed
 
-from sefaria.settings import MULTISERVER_ENABLED, MULTISERVER_REDIS_EVENT_CHANNEL, MULTISERVER_REDIS_CONFIRM_CHANNEL
+from sefaria.settings import MULTISERVER_ENABLED, MULTISERVER_REDIS_CONFIRM_CHANNEL, MULTISERVER_BATCH_INTERVAL, \
+    MULTISERVER_HEARTBEAT_TIMEOUT
 
-from .messaging import MessagingNode
+from .messaging import MessagingNode, RedisEventStream
 
 import logging
 logger = logging.getLogger("multiserver")
@@ -15,88 +21,188 @@ class ServerCoordinator(MessagingNode):
     """
     Runs on each instance of the server.
     publish_event() - Used for publishing events to other servers
-    sync() - used for listening for events. Invoked periodically from MultiServerEventListenerMiddleware
+    start_listener() - Starts a background thread that sends published events in batches, and fetches the batches
+    published by other servers.  Invoked from MultiServerEventListenerMiddleware.
+    process_pending() - Applies the fetched batches.  Invoked from MultiServerEventListenerMiddleware on the request
+    thread, before the request is handled.  See the middleware for what that does and doesn't guarantee.
+
+    Events are sent as batches on an event stream (see RedisEventStream), which each server process reads through
+    its own consumer group.  Repeated events in `coalesced_methods` with the same arguments are sent once per batch.
     """
-    subscription_channels = [MULTISERVER_REDIS_EVENT_CHANNEL]
+    subscription_channels = []
+    coalesced_methods = {("library", "refresh_index_record_in_cache")}
+
+    def __init__(self, stream=None, batch_interval=MULTISERVER_BATCH_INTERVAL, group=None):
+        self.stream = stream
+        self._group = group
+        self.batch_interval = batch_interval
+        self._outbox = []
+        self._inbox = []  # (entry id, batch) fetched and not yet processed
+        self._lock = threading.Lock()
+        self._process_lock = threading.Lock()
+        self._listener = None
+        self._listener_pid = None
+        self._stats = {
+            "events_published": 0, "events_coalesced": 0, "batches_published": 0,
+            "events_processed": 0, "events_failed": 0, "batches_processed": 0,
+            "last_lag": None, "max_lag": 0.0,
+        }
 
-    def publish_event(self, obj, method, args = None):
+    @property
+    def group(self):
         """
+        Name of this process' consumer group
+        """
+        return self._group or "{}:{}".format(socket.gethostname(), os.getpid())
+
+    def connect(self):
+        super(ServerCoordinator, self).connect()
+        if self.stream is None and getattr(self, "redis_client", None):
+            self.stream = RedisEventStream(self.redis_client)
+
+    def _check_initialization(self):
+        if self.stream is None:
+            self.connect()
 
-        :param obj:
+    def publish_event(self, obj, method, args = None):
+        """
+        Queues an event, to be sent to the other servers with the next batch.
+        :param obj: name of the object to call `method` on.  See `_process_event()`
         :param method:
         :param args:
         :return:
         """
-        # Check to see if there's any messages in the queue before pushing/popping a new one.
-        ## Edge case - needs thought - does the order of operations make for trouble in this case?##
-        self.sync()
-
         payload = {
             "obj": obj,
             "method": method,
             "args": args or [],
             "id": uuid.uuid4().hex
         }
-        msg_data = json.dumps(payload)
+        logger.info("publish_event from {} - {}".format(self.group, json.dumps(payload)))
+        with self._lock:
+            if (obj, method) in self.coalesced_methods:
+                # Keep the last of the repeated events, so that it runs after everything queued before it
+                repeated = [e for e in self._outbox if (e["obj"], e["method"], e["args"]) == (obj, method, payload["args"])]
+                self._stats["events_coalesced"] += len(repeated)
+                self._outbox = [e for e in self._outbox if e not in repeated]
+            self._outbox.append(payload)
+            self._stats["events_published"] += 1
+        if self.batch_interval:
+            self.start_listener()
+        else:
+            self.flush()
 
-        import socket
-        import os
-        logger.info("publish_event from {}:{} - {}".format(socket.gethostname(), os.getpid(), msg_data))
-        try:
-            self.redis_client.publish(MULTISERVER_REDIS_EVENT_CHANNEL, msg_data)
-        except Exception:
-            logger.error("Failed to connect to Redis instance while doing message publish.")
+    def flush(self):
+        """
+        Sends the queued events as one batch.
+        """
+        self._check_initialization()
+        with self._lock:
+            events, self._outbox = self._outbox, []
+        if not events:
             return
-
-        # Since we are subscribed to this channel as well, throw away the message we just sent.
-        # It would be nice to assume that nothing new came through in the microseconds that it took to publish ##
-        # But the below should insulate against even that case ##
         try:
-            popped_msg = self.pubsub.get_message()
+            self.stream.add({"origin": self.group, "time": time.time(), "events": events})
+            self._stats["batches_published"] += 1
         except Exception:
-            logger.error("Failed to connect to Redis instance while doing message publish listen.")
-            popped_msg = None
-
-        while popped_msg:
-            if popped_msg["data"] != msg_data:
-                logger.warning("Multiserver Message collision!")
-                self._process_message(popped_msg)
-            try:
-                popped_msg = self.pubsub.get_message()
-            except Exception:
-                logger.error("Failed to connect to Redis instance while doing message publish listen.")
-                popped_msg = None
+            logger.error("Failed to connect to Redis instance while doing message publish.")
 
-    def sync(self):
+    def fetch(self, block_ms=None):
+        """
+        Fetches the batches published by other servers since the last fetch, to be applied by `process_pending()`.
+        """
         self._check_initialization()
         try:
-            msg = self.pubsub.get_message()
+            self.stream.create_group(self.group)
+            self.stream.heartbeat(self.group)
+            entries = self.stream.read(self.group, block_ms=block_ms)
         except Exception:
             logger.error("Failed to connect to Redis instance while doing multiserver sync.")
             return
-        if not msg or msg["type"] == "subscribe":
-            return
+        with self._lock:
+            self._inbox += entries
 
-        if msg["type"] != "message":
-            logger.error("Surprising redis message type: {}".format(msg["type"]))
+    def process_pending(self):
+        """
+        Applies the fetched batches, in order, on the calling thread, and acknowledges them.
+        """
+        if not self._inbox:
+            return
+        with self._process_lock:
+            with self._lock:
+                entries, self._inbox = self._inbox, []
+            for entry_id, batch in entries:
+                self._process_batch(batch)
+                try:
+                    self.stream.ack(self.group, [entry_id])
+                except Exception:
+                    logger.error("Failed to connect to Redis instance while acknowledging {}".format(entry_id))
+
+    def sync(self, block_ms=None):
+        """
+        Fetches and applies the batches published by other servers since the last sync.
+        """
+        self.fetch(block_ms=block_ms)
+        self.process_pending()
 
-        self._process_message(msg)
-        self.sync()  # While there are still live messages, keep processing them.
+    def start_listener(self):
+        """
+        Starts the listener thread of this process, if it isn't running.  Threads don't survive a fork, so this is
+        called in each worker process rather than at import.
+        """
+        if self._listener is not None and self._listener_pid == os.getpid() and self._listener.is_alive():
+            return
+        with self._lock:
+            if self._listener is not None and self._listener_pid == os.getpid() and self._listener.is_alive():
+                return
+            self._check_initialization()
+            try:
+                self.stream.create_group(self.group)
+            except Exception:
+                logger.error("Failed to create multiserver consumer group {}".format(self.group))
+            self._listener_pid = os.getpid()
+            self._listener = threading.Thread(target=self._listen, name="multiserver-listener", daemon=True)
+            self._listener.start()
 
-    def _process_message(self, msg):
+    def _listen(self):
+        while True:
+            try:
+                self.flush()
+                self.fetch(block_ms=int(self.batch_interval * 1000) or 1000)
+            except Exception as e:
+                logger.error("Multiserver listener error: {}".format(e))
+                time.sleep(1)
+
+    def stats(self):
+        stats = dict(self._stats, group=self.group, outbox=len(self._outbox), inbox=len(self._inbox),
+                     listener_alive=bool(self._listener and self._listener.is_alive()))
+        try:
+            stats.update(self.stream.pending(self.group))
+            stats["live_servers"] = len(self.stream.live_groups(MULTISERVER_HEARTBEAT_TIMEOUT))
+        except Exception:
+            pass
+        return stats
+
+    def _process_batch(self, batch):
+        if batch["origin"] == self.group:
+            return  # Our own events, which were applied here before they were published
+        lag = time.time() - batch["time"]
+        self._stats["last_lag"] = lag
+        self._stats["max_lag"] = max(self._stats["max_lag"], lag)
+        self._stats["batches_processed"] += 1
+        for data in batch["events"]:
+            self._process_event(data)
+
+    def _process_event(self, data):
         """
-        :param msg: JSON encoded message.
-         Expecting a message that looks like this:
-         {'channel': 'msync',
-          'data': {
+        :param data: Event.
+         Expecting an event that looks like this:
+          {
             "obj": obj,
             "method": method,
             "args": args or [],
             "id": uuid.uuid4().hex
           }
-          'pattern': None,
-          'type': 'message',
-         }
 
         :return:
         """
@@ -107,18 +213,15 @@ class ServerCoordinator(MessagingNode):
         import sefaria.system.cache as scache
         import sefaria.model.text as text
 
-        import socket
-        import os
         host = socket.gethostname()
         pid = os.getpid()
 
-        data = json.loads(msg["data"])
-
         obj = locals()[data["obj"]]
         method = getattr(obj, data["method"])
 
         try:
             method(*data["args"])
+            self._stats["events_processed"] += 1
             logger.info("Processing succeeded for {} on {}:{}".format(self.event_description(data), host, pid))
 
             confirm_msg = {
@@ -129,6 +232,7 @@ class ServerCoordinator(MessagingNode):
             }
 
         except Exception as e:
+            self._stats["events_failed"] += 1
             logger.error("Processing failed for {} on {}:{} - {}".format(self.event_description(data), host, pid, str(e)))
 
             confirm_msg = {
@@ -141,7 +245,7 @@ class ServerCoordinator(MessagingNode):
 
         # Send confirmation
         msg_data = json.dumps(confirm_msg)
-        logger.info("Sending confirm from {}:{} - {}".format(host, pid, msg["data"]))
+        logger.info("Sending confirm from {}:{} - {}".format(host, pid, data["id"]))
         try:
             self.redis_client.publish(MULTISERVER_REDIS_CONFIRM_CHANNEL, msg_data)
         except Exception:
@@ -149,23 +253,25 @@ class ServerCoordinator(MessagingNode):
 
 
 class MultiServerEventListenerMiddleware(object):
-    delay = 20  # Will check for library updates every X requests.  0 means every request.
-
+    """
+    Makes sure that the listener thread of this server process is running, and applies the events it has fetched
+    before each request.  Events are applied on the request thread rather than the listener thread, so with single
+    threaded workers the library doesn't change while a request is handled.  This is not thread safe with threaded
+    workers: events applied before one request change the shared library while other threads handle their requests
+    and read it.
+    """
     def __init__(self, get_response):
         self.get_response = get_response
 
         if not MULTISERVER_ENABLED:
             raise MiddlewareNotUsed
-        self.req_counter = 0
 
     def __call__(self, request):
-        if self.req_counter == self.delay:
-            server_coordinator.sync()
-            self.req_counter = 0
-        else:
-            self.req_counter += 1
-
+        server_coordinator.start_listener()
+        server_coordinator.process_pending()
         response = self.get_response(request)
         return response
 
 server_coordinator = ServerCoordinator() if MULTISERVER_ENABLED else None
+if server_coordinator:
+    atexit.register(server_coordinator.flush)
@@ -1,6 +1,9 @@
+import json
 import time
+import threading
 import redis
-from sefaria.settings import MULTISERVER_REDIS_SERVER, MULTISERVER_REDIS_PORT, MULTISERVER_REDIS_DB
+from sefaria.settings import MULTISERVER_REDIS_SERVER, MULTISERVER_REDIS_PORT, MULTISERVER_REDIS_DB, \
+    MULTISERVER_REDIS_EVENT_STREAM, MULTISERVER_REDIS_CONSUMERS_KEY, MULTISERVER_STREAM_MAXLEN
 
 import logging
 logger = logging.getLogger("multiserver")
@@ -36,4 +39,135 @@ class MessagingNode(object):
 
     @staticmethod
     def event_description(data):
-        return "{}.{}({}) [{}]".format(data["obj"], data["method"], str(data["args"]), data["id"])
\ No newline at end of file
+        return "{}.{}({}) [{}]".format(data["obj"], data["method"], str(data["args"]), data["id"])
+
+
+class RedisEventStream(object):
+    """
+    Batches of multiserver events on a Redis Stream.
+
+    Every server process reads the stream through its own consumer group, so that each process gets every batch and
+    acknowledges it once processed.  Processes record a heartbeat in a sorted set, which is used to count the live
+    consumers, and to remove the groups of processes that have gone away.
+    """
+    def __init__(self, redis_client, name=MULTISERVER_REDIS_EVENT_STREAM, consumers_key=MULTISERVER_REDIS_CONSUMERS_KEY,
+                 maxlen=MULTISERVER_STREAM_MAXLEN):
+        self.redis_client = redis_client
+        self.name = name
+        self.consumers_key = consumers_key
+        self.maxlen = maxlen
+
+    def add(self, batch):
+        return self.redis_client.xadd(self.name, {"batch": json.dumps(batch)}, maxlen=self.maxlen, approximate=True)
+
+    def create_group(self, group):
+        """
+        Creates `group`, starting from the end of the stream.
+        """
+        try:
+            self.redis_client.xgroup_create(self.name, group, id="$", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def read(self, group, block_ms=None, count=100):
+        """
+        :return: list of (entry id, batch) delivered to `group` and not yet read
+        """
+        response = self.redis_client.xreadgroup(group, group, {self.name: ">"}, count=count, block=block_ms)
+        return [(entry_id, json.loads(fields["batch"])) for _, entries in (response or []) for entry_id, fields in entries]
+
+    def ack(self, group, entry_ids):
+        if entry_ids:
+            self.redis_client.xack(self.name, group, *entry_ids)
+
+    def heartbeat(self, group):
+        self.redis_client.zadd(self.consumers_key, {group: time.time()})
+
+    def live_groups(self, timeout):
+        return self.redis_client.zrangebyscore(self.consumers_key, time.time() - timeout, "+inf")
+
+    def remove_dead_groups(self, timeout):
+        """
+        Destroys the groups of processes that haven't sent a heartbeat in `timeout` seconds.
+        :return: list of removed groups
+        """
+        dead = self.redis_client.zrangebyscore(self.consumers_key, "-inf", time.time() - timeout)
+        for group in dead:
+            try:
+                self.redis_client.xgroup_destroy(self.name, group)
+            except redis.exceptions.ResponseError:
+                pass
+            self.redis_client.zrem(self.consumers_key, group)
+        return dead
+
+    def pending(self, group):
+        """
+        :return: number of batches delivered to `group` and not yet acknowledged, and not yet delivered
+        """
+        unacked = self.redis_client.xpending(self.name, group)["pending"]
+        lag = None
+        for info in self.redis_client.xinfo_groups(self.name):
+            if info["name"] == group:
+                lag = info.get("lag")  # Redis 7+
+        return {"unacknowledged": unacked, "undelivered": lag}
+
+
+class LocalEventStream(object):
+    """
+    In process stand in for `RedisEventStream`, with the same interface.  Used in tests and for running
+    several coordinators in one process.
+    """
+    def __init__(self):
+        self._entries = []      # [(entry id, batch)]
+        self._groups = {}       # group -> index of next entry to deliver
+        self._unacked = {}      # group -> set of entry ids
+        self._heartbeats = {}   # group -> time
+        self._cond = threading.Condition()
+
+    def add(self, batch):
+        with self._cond:
+            entry_id = "{}-0".format(len(self._entries) + 1)
+            self._entries.append((entry_id, json.loads(json.dumps(batch))))
+            self._cond.notify_all()
+            return entry_id
+
+    def create_group(self, group):
+        with self._cond:
+            if group not in self._groups:
+                self._groups[group] = len(self._entries)
+                self._unacked[group] = set()
+
+    def read(self, group, block_ms=None, count=100):
+        with self._cond:
+            if self._groups[group] >= len(self._entries) and block_ms:
+                self._cond.wait(block_ms / 1000.0)
+            start = self._groups[group]
+            entries = self._entries[start:start + count]
+            self._groups[group] = start + len(entries)
+            self._unacked[group].update(entry_id for entry_id, _ in entries)
+            return entries
+
+    def ack(self, group, entry_ids):
+        with self._cond:
+            self._unacked[group].difference_update(entry_ids)
+
+    def heartbeat(self, group):
+        self._heartbeats[group] = time.time()
+
+    def live_groups(self, timeout):
+        return [g for g, t in self._heartbeats.items() if t >= time.time() - timeout]
+
+    def remove_dead_groups(self, timeout):
+        with self._cond:
+            dead = [g for g, t in self._heartbeats.items() if t < time.time() - timeout]
+            for group in dead:
+                self._groups.pop(group, None)
+                self._unacked.pop(group, None)
+                del self._heartbeats[group]
+            return dead
+
+    def pending(self, group):
+        with self._cond:
+            return {"unacknowledged": len(self._unacked[group]), "undelivered": len(self._entries) - self._groups[group]}
+
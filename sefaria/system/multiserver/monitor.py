@@ -1,58 +1,85 @@
 import json
 import time
 
-from sefaria.settings import MULTISERVER_REDIS_EVENT_CHANNEL, MULTISERVER_REDIS_CONFIRM_CHANNEL
+from sefaria.settings import MULTISERVER_REDIS_CONFIRM_CHANNEL, MULTISERVER_HEARTBEAT_TIMEOUT
 
 import logging
 logging.basicConfig()
 logger = logging.getLogger("multiserver")
 logger.setLevel(logging.INFO)
 
-from .messaging import MessagingNode
+from .messaging import MessagingNode, RedisEventStream
 from sefaria.system.varnish.thin_wrapper import invalidate_title
 
 
 class MultiServerMonitor(MessagingNode):
-    subscription_channels = [MULTISERVER_REDIS_EVENT_CHANNEL, MULTISERVER_REDIS_CONFIRM_CHANNEL]
+    """
+    Reads the event stream through its own consumer group, and listens for confirmations from the servers.
+    Once every live server has confirmed an event, does the follow up work for it (see `_process_completion`).
+    """
+    subscription_channels = [MULTISERVER_REDIS_CONFIRM_CHANNEL]
+    group = "monitor"
 
     def __init__(self):
         super(MultiServerMonitor, self).__init__()
         self.connect()
+        self.stream = RedisEventStream(self.redis_client)
+        self.stream.create_group(self.group)
         self.events = {}
         self.event_order = []
+        self.last_cleanup = 0
 
     def listen(self):
         while True:
-            time.sleep(0.2)
-            self.process_messages()
-
-    def process_messages(self):
+            self.process_messages(block_ms=200)
+            if time.time() - self.last_cleanup > MULTISERVER_HEARTBEAT_TIMEOUT:
+                self.last_cleanup = time.time()
+                try:
+                    for group in self.stream.remove_dead_groups(MULTISERVER_HEARTBEAT_TIMEOUT):
+                        logger.info("Removed consumer group of departed server {}".format(group))
+                except Exception:
+                    logger.error("Failed to connect to Redis instance while removing departed servers")
+
+    def process_messages(self, block_ms=None):
         """
 
         :return:
         """
+        self._read_events(block_ms)
+        self._process_confirms()
+
+    def _read_events(self, block_ms=None):
+        try:
+            entries = self.stream.read(self.group, block_ms=block_ms)
+        except Exception:
+            logger.error("Failed to connect to Redis instance while reading events")
+            return
+        for entry_id, batch in entries:
+            for data in batch["events"]:
+                self._process_event(data)
+            self.stream.ack(self.group, [entry_id])
+
+    def _process_confirms(self):
         try:
             msg = self.pubsub.get_message()
         except Exception:
             logger.error("Failed to connect to Redis instance while getting new message")
             return
-        if not msg:
-            return
-
-        if msg["type"] != "message":
-            logger.error("Surprising redis message type: {}".format(msg))
-
-        elif msg["channel"] == MULTISERVER_REDIS_EVENT_CHANNEL:
-            data = json.loads(msg["data"])
-            self._process_event(data)
-        elif msg["channel"] == MULTISERVER_REDIS_CONFIRM_CHANNEL:
-            data = json.loads(msg["data"])
-            self._process_confirm(data)
-        else:
-            logger.error("Surprising redis message channel: {}".format(msg["channel"]))
-
-        # There may be more than one message waiting
-        self.process_messages()
+        while msg:
+            if msg["type"] != "message":
+                logger.error("Surprising redis message type: {}".format(msg))
+            elif msg["channel"] == MULTISERVER_REDIS_CONFIRM_CHANNEL:
+                data = json.loads(msg["data"])
+                if data["event_id"] not in self.events:
+                    self._read_events()  # The event may have been published since the last read
+                self._process_confirm(data)
+            else:
+                logger.error("Surprising redis message channel: {}".format(msg["channel"]))
+            try:
+                msg = self.pubsub.get_message()
+            except Exception:
+                logger.error("Failed to connect to Redis instance while getting new message")
+                return
 
     def _process_event(self, data):
         """
@@ -62,11 +89,11 @@ class MultiServerMonitor(MessagingNode):
         """
         event_id = data["id"]
         try:
-            (_, subscribers) = self.redis_client.execute_command('PUBSUB', 'NUMSUB', MULTISERVER_REDIS_EVENT_CHANNEL)
+            servers = len(self.stream.live_groups(MULTISERVER_HEARTBEAT_TIMEOUT))
         except Exception:
-            logger.error("Failed to connect to Redis instance while getting subscriber count")
+            logger.error("Failed to connect to Redis instance while getting server count")
             return
-        expected = int(subscribers - 2)  # No confirms from the publisher or the monitor => subscribers - 2
+        expected = servers - 1  # No confirms from the publisher
         self.events[event_id] = {
             "data": data,
             "expected": expected,
@@ -90,6 +117,7 @@ class MultiServerMonitor(MessagingNode):
 
         if not event_record:
             logger.error("Got confirmation of unknown event. {}".format(data))
+            return
 
         event_record["confirmed"] += 1
         event_record["confirmations"] += [data]
@@ -0,0 +1,176 @@
+"""
+profiler.py -- sampling profiler for requests in production.
+
+A `RequestProfile` samples the wall clock stack of the thread serving a request, and records the time the request spent
+in Mongo and in other services (see `record_timing`).  Finished profiles are appended as json lines to a rotating file
+per process in PROFILER_DIR, and can be aggregated per view with `aggregate_profiles`.
+"""
+import os
+import sys
+import json
+import time
+import glob
+import threading
+from collections import Counter, defaultdict
+
+from sefaria.settings import PROFILER_DIR, PROFILER_INTERVAL, PROFILER_MAX_FILE_BYTES, PROFILER_BACKUP_COUNT
+
+import logging
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def current_profile():
+    """
+    :return: the `RequestProfile` running on the current thread, or None
+    """
+    return getattr(_local, "profile", None)
+
+
+def record_timing(name, seconds):
+    """
+    Adds `seconds` to the time spent in `name` (e.g. "node") by the request profiled on the current thread, if any.
+    """
+    profile = current_profile()
+    if profile is not None:
+        profile.timings[name] += seconds
+
+
+class RequestProfile(object):
+    """
+    Samples the stack of the thread that starts it every `interval` seconds, from a background thread, until stopped.
+    Stacks are counted in the collapsed format used by flame graph tools: "file.py:function;file.py:function".
+    """
+    max_depth = 100
+
+    def __init__(self, interval=None):
+        self.interval = interval or PROFILER_INTERVAL
+        self.stacks = Counter()
+        self.timings = Counter()
+        self.duration = 0.0
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+        self._start_time = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._start_time = time.time()
+        _local.profile = self
+        self._sampler = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        self.duration = time.time() - self._start_time
+        self._stop.set()
+        self._sampler.join()
+        if current_profile() is self:
+            _local.profile = None
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.stacks[self._collapse(frame)] += 1
+
+    def _collapse(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def record(self, **details):
+        """
+        :return: json serializable record of this profile, with `details` (view, path, mongo time, etc.)
+        """
+        record = dict(details)
+        record.update({
+            "time": self._start_time,
+            "duration": self.duration,
+            "timings": dict(self.timings),
+            "interval": self.interval,
+            "stacks": dict(self.stacks),
+        })
+        return record
+
+
+class ProfileStore(object):
+    """
+    Json lines files of profile records, one per process, rotated at `max_bytes` with `backup_count` old files kept.
+    """
+    def __init__(self, directory=None, max_bytes=None, backup_count=None):
+        self.directory = directory or PROFILER_DIR
+        self.max_bytes = max_bytes or PROFILER_MAX_FILE_BYTES
+        self.backup_count = PROFILER_BACKUP_COUNT if backup_count is None else backup_count
+        self._lock = threading.Lock()
+
+    def _path(self):
+        return os.path.join(self.directory, "profiles-{}.jsonl".format(os.getpid()))
+
+    def _rotate(self, path):
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists("{}.{}".format(path, i)):
+                os.replace("{}.{}".format(path, i), "{}.{}".format(path, i + 1))
+        if self.backup_count:
+            os.replace(path, path + ".1")
+        else:
+            os.remove(path)
+
+    def append(self, record):
+        line = json.dumps(record) + "\n"
+        path = self._path()
+        with self._lock:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                if os.path.exists(path) and os.path.getsize(path) + len(line) > self.max_bytes:
+                    self._rotate(path)
+                with open(path, "a") as f:
+                    f.write(line)
+            except (IOError, OSError) as e:
+                logger.warning("Failed to write request profile: {}".format(e))
+
+    def records(self):
+        for path in glob.glob(os.path.join(self.directory, "profiles-*.jsonl*")):
+            try:
+                with open(path, "r") as f:
+                    for line in f:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue  # Partly written line
+            except (IOError, OSError):
+                continue
+
+
+def aggregate_profiles(records, view=None):
+    """
+    Aggregates profile records per view.
+    :param records: iterable of records from `RequestProfile.record()`
+    :param view: if set, only aggregate this view
+    :return: dict from view name to {"requests", "duration", "mongo", "timings", "stacks"}.  Times are total seconds.
+    Stacks are sample counts in collapsed format, which can be fed to flame graph tools.
+    """
+    views = defaultdict(lambda: {"requests": 0, "duration": 0.0, "mongo": 0.0, "timings": Counter(), "stacks": Counter()})
+    for record in records:
+        name = record.get("view") or "unknown"
+        if view and name != view:
+            continue
+        agg = views[name]
+        agg["requests"] += 1
+        agg["duration"] += record.get("duration", 0.0)
+        agg["mongo"] += (record.get("mongo") or {}).get("duration", 0.0)
+        agg["timings"].update(record.get("timings", {}))
+        agg["stacks"].update(record.get("stacks", {}))
+    return {name: dict(agg, timings=dict(agg["timings"]), stacks=dict(agg["stacks"])) for name, agg in views.items()}
+
+
+def collapsed_stacks(stacks):
+    """
+    :return: `stacks` as text, one "<stack> <count>" line per stack, as read by flamegraph.pl and speedscope
+    """
+    return "\n".join("{} {}".format(stack, count) for stack, count in sorted(stacks.items(), key=lambda x: -x[1]))
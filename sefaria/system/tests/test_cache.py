@@ -0,0 +1,97 @@
+import time
+import threading
+import pytest
+import sefaria.system.cache as scache
+from sefaria.system.cache import InMemoryCache, SharedGenerations
+
+
+class TestInMemoryCache(object):
+
+    def test_lru_limits(self):
+        c = InMemoryCache(max_entries=2)
+        c.set("a", "1")
+        c.set("b", "2")
+        c.get("a")
+        c.set("c", "3")
+        assert c.get("b") is None
+        assert c.get("a") == "1" and c.get("c") == "3"
+
+        c = InMemoryCache(max_bytes=10)
+        c.set("a", "12345")
+        c.set("b", "12345")
+        c.set("c", "1")
+        assert c.get("a") is None
+        assert c.stats()["bytes"] == 6
+        c.set("d", "12345678901")  # Larger than the whole cache
+        assert c.get("d") is None
+
+    def test_timeout(self):
+        c = InMemoryCache(timeout=0.05)
+        c.set("a", "1")
+        assert c.get("a") == "1"
+        time.sleep(0.06)
+        assert c.get("a") is None
+        assert len(c) == 0
+
+    def test_get_or_set_coalesces(self):
+        c = InMemoryCache()
+        calls = []
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(1)
+            return "value"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(c.get_or_set("k", compute))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        time.sleep(0.05)
+        release.set()
+        for t in threads:
+            t.join()
+        assert results == ["value"] * 5
+        assert len(calls) == 1
+        assert c.stats()["coalesced"] == 4
+        assert c.get_or_set("k", compute) == "value"
+        assert len(calls) == 1
+
+    def test_get_or_set_cache_if_and_errors(self):
+        c = InMemoryCache()
+        assert c.get_or_set("k", lambda: ("fallback", False), cache_if=lambda r: r[1]) == ("fallback", False)
+        assert c.get("k") is None
+
+        def fail():
+            raise ValueError("no")
+        with pytest.raises(ValueError):
+            c.get_or_set("k", fail)
+        assert c.get_or_set("k", lambda: "ok") == "ok"
+
+
+class TestSharedGenerations(object):
+
+    def test_check_interval_and_bump(self, monkeypatch):
+        shared = {}
+        fetches = []
+
+        def get_cache_generations(keys, cache_type=None):
+            fetches.extend(keys)
+            return [shared.setdefault(key, 0) for key in keys]
+
+        def bump_cache_generations(keys, cache_type=None):
+            for key in keys:
+                shared[key] = shared.get(key, 0) + 1
+
+        monkeypatch.setattr(scache, "get_cache_generations", get_cache_generations)
+        monkeypatch.setattr(scache, "bump_cache_generations", bump_cache_generations)
+        g = SharedGenerations(check_interval=60)
+        assert g.get("a") == 0
+        shared["a"] = 5  # A change in another process isn't seen until the check interval passes
+        assert g.get("a") == 0
+        assert fetches == ["a"]
+        g.bump(["a"])  # A change in this process is seen at once
+        assert g.get("a") == 6
+        g.check_interval = 0
+        shared["a"] = 9
+        assert g.get("a") == 9
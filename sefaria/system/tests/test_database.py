@@ -4,6 +4,7 @@ import pymongo
 import sefaria.model.lock as lock
 from sefaria.settings import *
 import pytest
+from types import SimpleNamespace
 
 #This one is purposefully circumvented on Travis, to speed up build time.
 @pytest.mark.xfail(reason="unknown")
@@ -41,4 +42,28 @@ def get_test_connection():
     db = connection[d.TEST_DB]
     if SEFARIA_DB_USER and SEFARIA_DB_PASSWORD:
         db.authenticate(SEFARIA_DB_USER, SEFARIA_DB_PASSWORD)
-    return db
\ No newline at end of file
+    return db
+
+
+def test_query_accounting_listener():
+    listener = d.QueryAccountingListener()
+    find = SimpleNamespace(command_name="find", command={"find": "texts"}, duration_micros=2000,
+                           reply={"cursor": {"firstBatch": [{}, {}, {}]}})
+    get_more = SimpleNamespace(command_name="getMore", command={"getMore": 1, "collection": "texts"}, duration_micros=1000,
+                               reply={"cursor": {"nextBatch": [{}]}})
+    hello = SimpleNamespace(command_name="hello", command={"hello": 1}, duration_micros=1000, reply={})
+
+    listener.started(find)  # not counted before accounting starts
+    stats = d.start_query_accounting()
+    for event in (find, get_more, hello, find):
+        listener.started(event)
+        listener.succeeded(event)
+    assert d.stop_query_accounting() is stats
+    listener.started(find)
+
+    assert stats.queries == 3
+    assert stats.documents == 7
+    assert stats.duration == pytest.approx(0.005)
+    assert stats.commands[("find", "texts")] == 2
+    assert stats.header_value() == "queries=3; docs=7; ms=5.0"
+
@@ -0,0 +1,57 @@
+from sefaria.system.multiserver.coordinator import ServerCoordinator
+from sefaria.system.multiserver.messaging import LocalEventStream
+
+
+def make_coordinator(stream, group):
+    coordinator = ServerCoordinator(stream=stream, batch_interval=10, group=group)
+    coordinator.start_listener = lambda: None  # Flush and sync by hand
+    coordinator.processed = []
+    coordinator._process_event = lambda data: coordinator.processed.append((data["method"], data["args"]))
+    stream.create_group(group)
+    return coordinator
+
+
+def test_batches_and_coalescing():
+    stream = LocalEventStream()
+    a = make_coordinator(stream, "a")
+    b = make_coordinator(stream, "b")
+
+    a.publish_event("library", "refresh_index_record_in_cache", ["Genesis"])
+    a.publish_event("library", "update_index_in_toc", ["Genesis", None])
+    a.publish_event("library", "refresh_index_record_in_cache", ["Genesis"])
+    a.publish_event("library", "refresh_index_record_in_cache", ["Exodus"])
+    a.flush()
+
+    b.sync()
+    assert b.processed == [
+        ("update_index_in_toc", ["Genesis", None]),
+        ("refresh_index_record_in_cache", ["Genesis"]),
+        ("refresh_index_record_in_cache", ["Exodus"]),
+    ]
+    a.sync()
+    assert a.processed == []  # Its own events
+
+    stats = a.stats()
+    assert stats["events_published"] == 4
+    assert stats["events_coalesced"] == 1
+    assert stats["batches_published"] == 1
+    assert b.stats()["batches_processed"] == 1
+    assert stream.pending("b") == {"unacknowledged": 0, "undelivered": 0}
+
+
+def test_fetched_batches_wait_for_process_pending():
+    stream = LocalEventStream()
+    a = make_coordinator(stream, "a")
+    b = make_coordinator(stream, "b")
+
+    a.publish_event("library", "build_full_auto_completer")
+    a.flush()
+    b.fetch()
+    assert b.processed == []  # The listener thread only fetches
+    assert b.stats()["inbox"] == 1
+    assert stream.pending("b")["unacknowledged"] == 1
+
+    b.process_pending()
+    assert b.processed == [("build_full_auto_completer", [])]
+    assert b.stats()["inbox"] == 0
+    assert stream.pending("b") == {"unacknowledged": 0, "undelivered": 0}
@@ -0,0 +1,39 @@
+import time
+from sefaria.system.profiler import RequestProfile, ProfileStore, aggregate_profiles, collapsed_stacks, record_timing
+
+
+def busy_function(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+def test_request_profile():
+    profile = RequestProfile(interval=0.001).start()
+    busy_function(0.05)
+    record_timing("node", 0.01)
+    profile.stop()
+    record_timing("node", 1)  # Not profiled anymore
+
+    assert profile.timings["node"] == 0.01
+    assert profile.duration >= 0.05
+    assert sum(profile.stacks.values()) > 0
+    assert any(stack.endswith("test_profiler.py:busy_function") for stack in profile.stacks)
+
+
+def test_profile_store(tmpdir):
+    store = ProfileStore(directory=str(tmpdir), max_bytes=300, backup_count=2)
+    for i in range(10):
+        store.append({"view": "reader.views.catchall" if i % 2 else "sefaria.views.bulktext_api", "duration": 1.0,
+                      "mongo": {"duration": 0.5}, "timings": {"node": 0.25}, "stacks": {"a;b": 1, "a;c": i}})
+    records = list(store.records())
+    assert 0 < len(records) < 10  # Rotated
+    assert len(tmpdir.listdir()) == 3
+
+    views = aggregate_profiles(records)
+    catchall = views["reader.views.catchall"]
+    assert catchall["duration"] == catchall["requests"] * 1.0
+    assert catchall["mongo"] == catchall["requests"] * 0.5
+    assert catchall["timings"]["node"] == catchall["requests"] * 0.25
+    assert list(aggregate_profiles(records, view="sefaria.views.bulktext_api")) == ["sefaria.views.bulktext_api"]
+    assert collapsed_stacks({"a;b": 1, "a;c": 3}) == "a;c 3\na;b 1"
@@ -1,4 +1,5 @@
 from sefaria.settings import USE_VARNISH
+import sefaria.system.varnish.common as vc
 
 if USE_VARNISH:
     import sefaria.system.varnish.wrapper as v
@@ -13,4 +14,51 @@ if USE_VARNISH:
                 assert v.url_regex(Ref("Yoma 14a")) == r'Yoma(\\.14a$|\\.14a\\.)'
                 assert v.url_regex(Ref("Yoma 14a:12-15")) == r'Yoma(\\.14a\\.12$|\\.14a\\.12\\.|\\.14a\\.13$|\\.14a\\.13\\.|\\.14a\\.14$|\\.14a\\.14\\.|\\.14a\\.15$|\\.14a\\.15\\.)'
                 assert v.url_regex(Ref("Yoma")) == r'Yoma($|\\.)'
-                assert v.url_regex(Ref("Rashi on Genesis 1.1")) == r'Rashi\\_on\\_Genesis(\\.1\\.1$|\\.1\\.1\\.)'
\ No newline at end of file
+                assert v.url_regex(Ref("Rashi on Genesis 1.1")) == r'Rashi\\_on\\_Genesis(\\.1\\.1$|\\.1\\.1\\.)'
+
+
+# Runs without Varnish: the queue is flushed synchronously and its sends are replaced
+class Test_Invalidation_Queue(object):
+
+    def test_batches_and_dedupes(self, monkeypatch):
+        queue = vc.InvalidationQueue(asynchronous=False, purge_batch_size=2, ban_batch_size=2)
+        purged, banned = [], []
+        monkeypatch.setattr(queue, "_send_purge", lambda url: purged.append(url))
+        monkeypatch.setattr(queue, "_send_ban", lambda expressions: banned.append(expressions))
+        monkeypatch.setattr(vc, "invalidation_queue", queue)
+
+        with vc.invalidation_batch():
+            for _ in range(3):
+                vc.purge_url("http://localhost/api/texts/Genesis.1")
+                vc.purge_url("http://localhost/api/links/Genesis.1")
+                vc.ban_url("/api/texts/Genesis")
+            vc.ban_url("/api/links/Genesis")
+            vc.ban_url("/api/related/Genesis")
+            assert purged == [] and banned == []
+
+        assert purged == ["http://localhost/api/texts/Genesis.1", "http://localhost/api/links/Genesis.1"]
+        assert banned == [["/api/texts/Genesis", "/api/links/Genesis"], ["/api/related/Genesis"]]
+        stats = queue.stats()
+        assert stats["depth"] == 0
+        assert stats["batches"] == 2
+        assert stats["purges_sent"] == 2 and stats["bans_sent"] == 3
+
+
+    def test_unexpected_errors_dont_stop_sending(self, monkeypatch):
+        queue = vc.InvalidationQueue(asynchronous=True)
+        purged = []
+
+        def send_purge(url):
+            if url.endswith("bad"):
+                raise ValueError(url)
+            purged.append(url)
+        monkeypatch.setattr(queue, "_send_purge", send_purge)
+        monkeypatch.setattr(queue, "_send_ban", lambda expressions: None)
+
+        queue.add(purges=["http://localhost/bad", "http://localhost/good"])
+        queue._worker.join(0.5)  # Stays alive, waiting for more
+        queue.add(purges=["http://localhost/later"])
+        queue.flush()
+        assert purged == ["http://localhost/good", "http://localhost/later"]
+        assert queue._worker.is_alive()
+        assert queue.stats()["errors"] == 1
@@ -1,7 +1,13 @@
+import time
+import atexit
+import threading
 import subprocess
+from collections import OrderedDict
+from contextlib import contextmanager
 from urllib.parse import urlparse
-from http.client import HTTPConnection
-from sefaria.settings import VARNISH_ADM_ADDR, VARNISH_HOST, VARNISH_FRNT_PORT, VARNISH_SECRET, FRONT_END_URL
+from http.client import HTTPConnection, HTTPException
+from sefaria.settings import VARNISH_ADM_ADDR, VARNISH_HOST, VARNISH_FRNT_PORT, VARNISH_SECRET, FRONT_END_URL, \
+    VARNISH_ASYNC_INVALIDATION, VARNISH_PURGE_BATCH_SIZE, VARNISH_BAN_BATCH_SIZE
 
 from sefaria.utils.util import graceful_exception
 
@@ -9,29 +15,201 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+class InvalidationQueue(object):
+    """
+    Collects Varnish purges and bans, and sends them in batches.
+
+    Pending purge URLs and ban expressions are deduplicated.  Purges are sent over one persistent connection, and
+    up to `ban_batch_size` ban expressions are combined into a single ban.  If `asynchronous`, batches are sent by a
+    background thread, so that saves don't wait on Varnish.  Otherwise they are sent when `flush()` is called.
+    """
+    def __init__(self, asynchronous=VARNISH_ASYNC_INVALIDATION, purge_batch_size=VARNISH_PURGE_BATCH_SIZE,
+                 ban_batch_size=VARNISH_BAN_BATCH_SIZE):
+        self.asynchronous = asynchronous
+        self.purge_batch_size = purge_batch_size
+        self.ban_batch_size = ban_batch_size
+        self._purges = OrderedDict()  # url -> time queued
+        self._bans = OrderedDict()    # ban expression -> time queued
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._connection = None
+        self._worker = None
+        self._stats = {
+            "purges_queued": 0, "bans_queued": 0, "duplicates": 0,
+            "purges_sent": 0, "bans_sent": 0, "batches": 0, "errors": 0,
+            "last_latency": None, "max_latency": 0.0,
+        }
+
+    def purge(self, url):
+        self.add(purges=[url])
+
+    def ban(self, expression):
+        self.add(bans=[expression])
+
+    def add(self, purges=(), bans=()):
+        now = time.time()
+        with self._cond:
+            for pending, items, stat in ((self._purges, purges, "purges_queued"), (self._bans, bans, "bans_queued")):
+                for item in items:
+                    if item in pending:
+                        self._stats["duplicates"] += 1
+                    else:
+                        pending[item] = now
+                        self._stats[stat] += 1
+            if self.asynchronous:
+                self._ensure_worker()
+                self._cond.notify()
+
+    def depth(self):
+        return len(self._purges) + len(self._bans)
+
+    def stats(self):
+        with self._cond:
+            oldest = min(list(self._purges.values())[:1] + list(self._bans.values())[:1], default=None)
+            return dict(self._stats, depth=self.depth(), oldest_pending_age=time.time() - oldest if oldest else None)
+
+    def _ensure_worker(self):
+        # Call with the lock held.  Also restarts the worker in processes forked after it started.
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._work, name="varnish-invalidation", daemon=True)
+            self._worker.start()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._purges and not self._bans:
+                    self._cond.wait()
+            try:
+                self.flush()
+            except Exception:
+                # Keep the worker alive, or nothing would be sent until the process restarts
+                logger.exception("Varnish invalidation worker failed to flush")
+
+    def _take_batch(self):
+        # Call with the lock held
+        purges = [self._purges.popitem(last=False) for _ in range(min(self.purge_batch_size, len(self._purges)))]
+        bans = [self._bans.popitem(last=False) for _ in range(min(self.ban_batch_size, len(self._bans)))]
+        return purges, bans
+
+    def flush(self):
+        """
+        Sends everything pending, in batches.
+        """
+        with self._send_lock:
+            while True:
+                with self._cond:
+                    purges, bans = self._take_batch()
+                if not purges and not bans:
+                    return
+                for url, _ in purges:
+                    self._send_safely(self._send_purge, url)
+                if bans:
+                    self._send_safely(self._send_ban, [expression for expression, _ in bans])
+                latency = time.time() - min(queued for _, queued in purges + bans)
+                with self._cond:
+                    self._stats["purges_sent"] += len(purges)
+                    self._stats["bans_sent"] += len(bans)
+                    self._stats["batches"] += 1
+                    self._stats["last_latency"] = latency
+                    self._stats["max_latency"] = max(self._stats["max_latency"], latency)
+
+    def _send_safely(self, send, item):
+        # Errors that `send` doesn't handle itself are logged and counted, so that they don't lose the rest of the
+        # batch, which has already been taken off the queue
+        try:
+            send(item)
+        except Exception:
+            with self._cond:
+                self._stats["errors"] += 1
+            logger.exception("Varnish invalidation of {} failed".format(item))
+
+    def _send_purge(self, url, retry=True):
+        """
+        Does an HTTP PURGE of the given asset.
+        The URL is run through urlparse and must point to the varnish instance not the varnishadm
+        """
+        url = urlparse(url)
+        path = url.path or '/'
+        try:
+            if self._connection is None:
+                self._connection = HTTPConnection(VARNISH_HOST, VARNISH_FRNT_PORT, timeout=10)
+            self._connection.request('PURGE', '%s?%s' % (path, url.query) if url.query else path, '',
+                                     {'Host': url.hostname})
+            response = self._connection.getresponse()
+            response.read()
+        except (HTTPException, OSError) as e:
+            # The persistent connection may have been closed by Varnish.  Reconnect once.
+            self._connection = None
+            if retry:
+                return self._send_purge(url.geturl(), retry=False)
+            self._stats["errors"] += 1
+            logger.error("Purge of {} failed: {}".format(url.geturl(), e))
+            return
+        if response.status != 200:
+            self._stats["errors"] += 1
+            logger.error('Purge of {}{} on host {} failed with status: {}'.format(path,
+                                                                                  "?" + url.query if url.query else '',
+                                                                                  url.hostname,
+                                                                                  response.status))
+
+    def _send_ban(self, expressions):
+        """
+        Bans every object whose url matches one of the regular expressions in `expressions`, with one varnishadm call.
+        """
+        pattern = expressions[0] if len(expressions) == 1 else "|".join("({})".format(e) for e in expressions)
+        args = ["varnishadm", "-T", VARNISH_ADM_ADDR, "-S", VARNISH_SECRET, "ban", "obj.http.url ~ {}".format(pattern)]
+        try:
+            subprocess.run(args, check=True)
+        except (subprocess.CalledProcessError, OSError) as e:
+            self._stats["errors"] += 1
+            logger.error("Ban of {} failed: {}".format(pattern, e))
+
+
+invalidation_queue = InvalidationQueue()
+atexit.register(invalidation_queue.flush)
+
+_local = threading.local()
+
+
+@contextmanager
+def invalidation_batch():
+    """
+    Collects the purges and bans made inside the block, and queues them together when it exits.
+    With synchronous invalidation, they are sent then.  Batches can be nested.
+    """
+    outer = getattr(_local, "batch", None)
+    batch = _local.batch = outer if outer is not None else (OrderedDict(), OrderedDict())
+    try:
+        yield
+    finally:
+        if outer is None:
+            _local.batch = None
+            invalidation_queue.add(purges=list(batch[0]), bans=list(batch[1]))
+            if not invalidation_queue.asynchronous:
+                invalidation_queue.flush()
+
+
 @graceful_exception(logger=logger, return_value=None)
 def ban_url(url):
-    args = ["varnishadm", "-T", VARNISH_ADM_ADDR, "-S", VARNISH_SECRET, "ban", "obj.http.url ~ {}".format(url)]
-    subprocess.run(args, check=True)
+    batch = getattr(_local, "batch", None)
+    if batch is not None:
+        batch[1][url] = True
+        return
+    invalidation_queue.ban(url)
+    if not invalidation_queue.asynchronous:
+        invalidation_queue.flush()
 
 
 @graceful_exception(logger=logger, return_value=None)
 def purge_url(url):
     """
-    Do an HTTP PURGE of the given asset.
-    The URL is run through urlparse and must point to the varnish instance not the varnishadm
+    Purges the given asset.
+    The URL must point to the varnish instance not the varnishadm
     """
-    url = urlparse(url)
-    connection = HTTPConnection(VARNISH_HOST, VARNISH_FRNT_PORT)
-    path = url.path or '/'
-    connection.request('PURGE', '%s?%s' % (path, url.query) if url.query else path, '',
-                       {'Host': url.hostname})
-    response = connection.getresponse()
-    if response.status != 200:
-        logger.error('Purge of {}{} on host {} failed with status: {}'.format(path,
-                                                                                  "?" + url.query if url.query else '',
-                                                                                  url.hostname,
-                                                                                  response.status))
-    return response
-
-
+    batch = getattr(_local, "batch", None)
+    if batch is not None:
+        batch[0][url] = True
+        return
+    invalidation_queue.purge(url)
+    if not invalidation_queue.asynchronous:
+        invalidation_queue.flush()
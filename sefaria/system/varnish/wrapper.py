@@ -4,7 +4,7 @@
 import re
 import urllib.request, urllib.parse, urllib.error
 
-from .common import ban_url, purge_url, FRONT_END_URL
+from .common import ban_url, purge_url, invalidation_batch, FRONT_END_URL
 from sefaria.model import *
 from sefaria.system.exceptions import InputError
 from sefaria.utils.util import graceful_exception
@@ -62,12 +62,26 @@ def invalidate_ref(oref, lang=None, version=None, purge=False):
     ban_url("/api/related/{}".format(url_regex(oref)))
 
 
-def invalidate_linked(oref):
-    for linkref in {r.section_ref() for r in oref.linkset().refs_from(oref)}:
+def _linked_section_refs(oref):
+    linked_trefs = link_section_index.linked_refs(oref)
+    if linked_trefs is None:
+        return {r.section_ref() for r in oref.linkset().refs_from(oref)}
+    linked_refs = set()
+    for tref in linked_trefs:
         try:
-            invalidate_ref(linkref)
-        except UnicodeDecodeError:
-            logger.warn("Unable to invalidate {}. We cannot invalidate unicode at this time".format(linkref.normal()))
+            linked_refs.add(Ref(tref).section_ref())
+        except InputError:
+            continue
+    return linked_refs
+
+
+def invalidate_linked(oref):
+    with invalidation_batch():
+        for linkref in _linked_section_refs(oref):
+            try:
+                invalidate_ref(linkref)
+            except UnicodeDecodeError:
+                logger.warn("Unable to invalidate {}. We cannot invalidate unicode at this time".format(linkref.normal()))
 
 
 @graceful_exception(logger=logger, return_value=None, exception_type=UnicodeDecodeError)
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 import pytest
 
-from sefaria.client.wrapper import get_links
+from sefaria.client.wrapper import get_links, get_related_bundle, invalidate_related_bundles, _related_bundle_scopes
+import sefaria.system.cache as scache
 from sefaria.model import *
 
 def setup_module(module): 
@@ -23,6 +24,26 @@ class Test_get_links():
         assert all(r in r3 or r in r4 for r in r34)
 
 
+class Test_related_bundle():
+
+    def test_bundle_matches_lookups(self):
+        bundle = get_related_bundle("Exodus 2")
+        assert sorted(bundle.keys()) == ["links", "manuscripts", "media", "notes", "sheets", "topics", "webpages"]
+        assert [l["ref"] for l in bundle["links"]] == [l["ref"] for l in get_links("Exodus 2", with_text=False)]
+        assert get_related_bundle("Exodus 2") == bundle
+
+    def test_invalidation(self, locmem_cache):
+        scopes = _related_bundle_scopes(Ref("Exodus 2"))
+        generations = scache.get_cache_generations(scopes)
+        invalidate_related_bundles(["Exodus 3:1"])  # Different section
+        assert scache.get_cache_generations(scopes) == generations
+        invalidate_related_bundles(["Exodus 1:5-2:2"])
+        assert scache.get_cache_generations(scopes) != generations
+        generations = scache.get_cache_generations(scopes)
+        invalidate_related_bundles(["Exodus"])
+        assert scache.get_cache_generations(scopes) != generations
+
+
 class Test_links_from_get_text():
 
     def test_links_from_padded_ref(self):
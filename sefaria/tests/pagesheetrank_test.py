@@ -0,0 +1,81 @@
+import random
+import numpy
+import pytest
+from collections import OrderedDict
+import sefaria.pagesheetrank as psr
+from sefaria.pagesheetrank import pagerank, create_web, step
+
+
+def looped_pagerank(g, s=0.85, tolerance=0.00001, maxiter=100):
+    # The original per node implementation, which the vectorized pagerank() must reproduce
+    w = create_web(g)
+    p = numpy.matrix(numpy.ones((w.size, 1))) / w.size
+    iteration, change = 1, 2
+    while change > tolerance and iteration < maxiter:
+        new_p = step(w, p, s)
+        change = numpy.sum(numpy.abs(p - new_p))
+        p = new_p
+        iteration += 1
+    return {k: v for k, v in zip([x[0] for x in g], list(numpy.squeeze(numpy.asarray(p))))}
+
+
+def random_graph(num_nodes=200, num_links=1000):
+    random.seed(613)
+    nodes = ["Ref {}".format(i) for i in range(num_nodes)]
+    g = OrderedDict((n, {}) for n in nodes)
+    for _ in range(num_links):
+        a, b = random.sample(nodes, 2)
+        g[a][b] = g[a].get(b, 0) + random.choice([1.0, 0.3, 2.2])
+    return list(g.items())
+
+
+def test_matches_looped_pagerank():
+    g = random_graph()
+    expected = looped_pagerank(g)
+    actual = pagerank(g)
+    assert expected.keys() == actual.keys()
+    for k in expected:
+        assert actual[k] == pytest.approx(expected[k], rel=1e-9, abs=1e-15)
+
+
+def test_warm_start():
+    g = random_graph()
+    converged = pagerank(g, tolerance=1e-10)
+    warm = pagerank(g, tolerance=1e-10, start=converged, maxiter=3)
+    for k in converged:
+        assert warm[k] == pytest.approx(converged[k], rel=1e-6)
+
+
+def test_empty_graph():
+    assert pagerank([]) == {}
+
+
+def test_dropped_refs_lose_pagerank(monkeypatch):
+    class FakeRefData(object):
+        def __init__(self):
+            self.records = {"Genesis 1:1": {"ref": "Genesis 1:1", "pagerank": 0.5},
+                            "Genesis 1:2": {"ref": "Genesis 1:2", "pagerank": 0.2},
+                            "Genesis 1:3": {"ref": "Genesis 1:3", "pagerank": 0.1}}
+
+        def find(self, query, projection):
+            return [{"ref": r["ref"]} for r in self.records.values() if "pagerank" in r]
+
+        def bulk_write(self, requests):
+            for request in requests:
+                doc = request._doc
+                record = self.records.setdefault(request._filter["ref"], {"ref": request._filter["ref"]})
+                record.update(doc.get("$set", {}))
+                for field in doc.get("$unset", {}):
+                    record.pop(field, None)
+
+    class FakeDB(object):
+        ref_data = FakeRefData()
+
+    monkeypatch.setattr(psr, "db", FakeDB())
+    monkeypatch.setattr(psr, "calculate_pagerank", lambda: {"Genesis 1:1": 0.6})
+    monkeypatch.setattr(psr, "calculate_sheetrank", lambda: {"Genesis 1:2": 3})
+    psr.update_pagesheetrank()
+    records = FakeDB.ref_data.records
+    assert records["Genesis 1:1"]["pagerank"] == 0.6
+    assert "pagerank" not in records["Genesis 1:2"] and "pagesheetrank" in records["Genesis 1:2"]
+    assert "pagerank" not in records["Genesis 1:3"]
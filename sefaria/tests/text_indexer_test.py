@@ -0,0 +1,70 @@
+import json
+import os
+import pytest
+from sefaria.search import TextIndexer, IndexCheckpoint, JsonLinesFileSink
+
+
+def test_checkpoint_resume(tmpdir):
+    path = str(tmpdir.join("checkpoint.jsonl"))
+    checkpoint = IndexCheckpoint(path, "text-a")
+    checkpoint.mark_done("Genesis", "en")
+    checkpoint.mark_done("Genesis", "he")
+
+    resumed = IndexCheckpoint(path, "text-a")
+    assert resumed.is_done("Genesis", "en")
+    assert resumed.is_done("Genesis", "he")
+    assert not resumed.is_done("Exodus", "en")
+
+    # Checkpoints for another index don't count
+    assert not IndexCheckpoint(path, "text-b").is_done("Genesis", "en")
+
+    resumed.clear()
+    assert not IndexCheckpoint(path, "text-a").is_done("Genesis", "en")
+
+
+def test_checkpoint_ignores_partial_line(tmpdir):
+    path = str(tmpdir.join("checkpoint.jsonl"))
+    IndexCheckpoint(path, "text-a").mark_done("Genesis", "en")
+    with open(path, "a") as f:
+        f.write('{"index_name": "text-a", "tit')
+    assert IndexCheckpoint(path, "text-a").is_done("Genesis", "en")
+
+
+@pytest.mark.deep
+def test_index_partition_to_file_sink(tmpdir):
+    TextIndexer.clear_cache()
+    TextIndexer.index_name = "text-test"
+    TextIndexer.merged = False
+    TextIndexer.create_version_priority_map()
+    TextIndexer.create_terms_dict()
+
+    title, lang, num_docs, num_failed = TextIndexer.index_partition("Pirkei Avot", "en", JsonLinesFileSink(str(tmpdir)))
+    assert (title, lang) == ("Pirkei Avot", "en")
+    assert num_docs > 0
+    assert num_failed == 0
+
+    actions = []
+    for filename in os.listdir(str(tmpdir)):
+        with open(os.path.join(str(tmpdir), filename)) as f:
+            actions += [json.loads(line) for line in f]
+    assert len(actions) == num_docs
+    assert all(a["_index"] == "text-test" for a in actions)
+    assert any(a["_source"]["ref"] == "Pirkei Avot 1:1" for a in actions)
+
+
+class FailingSink(object):
+    def send(self, actions):
+        return 0, sum(1 for _ in actions)
+
+
+def test_failed_partition_not_checkpointed(tmpdir, monkeypatch):
+    path = str(tmpdir.join("checkpoint.jsonl"))
+    monkeypatch.setattr(TextIndexer, "create_version_priority_map", classmethod(lambda cls: None))
+    monkeypatch.setattr(TextIndexer, "create_terms_dict", classmethod(lambda cls: None))
+    monkeypatch.setattr(TextIndexer, "get_index_partitions", classmethod(lambda cls: [("Genesis", "en"), ("Exodus", "en")]))
+    results = {"Genesis": 0, "Exodus": 2}
+    monkeypatch.setattr(TextIndexer, "index_partition", classmethod(lambda cls, title, lang, sink=None, action=None: (title, lang, 5, results[title])))
+    TextIndexer.index_all("text-a", sink=FailingSink(), checkpoint_path=path)
+    checkpoint = IndexCheckpoint(path, "text-a")
+    assert checkpoint.is_done("Genesis", "en")
+    assert not checkpoint.is_done("Exodus", "en")
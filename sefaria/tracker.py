@@ -13,7 +13,9 @@ try:
 except ImportError:
     USE_VARNISH = False
 if USE_VARNISH:
-    from sefaria.system.varnish.wrapper import invalidate_ref, invalidate_linked
+    from sefaria.system.varnish.wrapper import invalidate_ref, invalidate_linked, invalidation_batch
+else:
+    from contextlib import nullcontext as invalidation_batch
 
 
 def modify_text(user, oref, vtitle, lang, text, vsource=None, **kwargs):
@@ -75,18 +77,21 @@ def modify_bulk_text(user:int, version:model.Version, text_map: dict, vsource=No
     
     version.save()
 
-    for old_text, new_text, oref in change_map.values():
-        post_modify_text(user, kwargs.get("type"), oref, version.language, version.versionTitle, old_text, new_text, version._id)
+    # Segments of the same section share their purges and bans.  Collect them and send each once.
+    with invalidation_batch():
+        for old_text, new_text, oref in change_map.values():
+            post_modify_text(user, kwargs.get("type"), oref, version.language, version.versionTitle, old_text, new_text, version._id)
 
 
 def post_modify_text(user, action, oref, lang, vtitle, old_text, curr_text, version_id, **kwargs) -> None:
     model.log_text(user, action, oref, lang, vtitle, old_text, curr_text, **kwargs)
     if USE_VARNISH:
-        invalidate_ref(oref, lang=lang, version=vtitle, purge=True)
-        if oref.next_section_ref():
-            invalidate_ref(oref.next_section_ref(), lang=lang, version=vtitle, purge=True)
-        if oref.prev_section_ref():
-            invalidate_ref(oref.prev_section_ref(), lang=lang, version=vtitle, purge=True)
+        with invalidation_batch():
+            invalidate_ref(oref, lang=lang, version=vtitle, purge=True)
+            if oref.next_section_ref():
+                invalidate_ref(oref.next_section_ref(), lang=lang, version=vtitle, purge=True)
+            if oref.prev_section_ref():
+                invalidate_ref(oref.prev_section_ref(), lang=lang, version=vtitle, purge=True)
     if not kwargs.get("skip_links", None):
         from sefaria.helper.link import add_links_from_text
         # Some commentaries can generate links to their base text automatically
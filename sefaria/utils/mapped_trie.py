@@ -0,0 +1,129 @@
+"""
+mapped_trie.py - read only string map stored in a file, that processes memory map rather than load.
+"""
+import os
+import mmap
+import pickle
+import struct
+import tempfile
+from array import array
+
+
+class MappedTrie(object):
+    """
+    Read only map from strings to values, with the lookups of `datrie.Trie` that the auto completers use:
+    `[]`, `get()`, `in`, `len()`, and `keys()`, `items()` and `values()` of a prefix.
+
+    Keys are stored in sorted order with their pickled values, in a file built by `build()`.  The file is memory mapped,
+    so the processes that open it share one copy in the page cache, rather than each holding its own trie.
+    Prefix lookups are a binary search for the first key with the prefix, followed by a scan.
+    Pickles refer to the file by path, so a pickled MappedTrie is small.
+
+        >>> trie = MappedTrie.build("/tmp/t.trie", [("genesis", 1), ("gen", 2), ("exodus", 3)])
+        >>> trie.items("gen")
+        [('gen', 2), ('genesis', 1)]
+    """
+    MAGIC = b"SMTRIE01"
+    _header = struct.Struct("<8sQQQ")  # magic, number of keys, start of keys, start of values
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, self._keys_start, self._values_start = self._header.unpack_from(self._mmap, 0)
+        if magic != self.MAGIC:
+            raise ValueError("{} is not a MappedTrie file".format(path))
+        view = memoryview(self._mmap)
+        offsets_start = self._header.size
+        offsets_size = (self._count + 1) * 8
+        self._key_offsets = view[offsets_start:offsets_start + offsets_size].cast("Q")
+        self._value_offsets = view[offsets_start + offsets_size:offsets_start + 2 * offsets_size].cast("Q")
+
+    @classmethod
+    def build(cls, path, items):
+        """
+        Writes `items` to a new file at `path`, replacing any file there, and opens it.
+        :param path:
+        :param items: iterable of (string, picklable value)
+        :return: MappedTrie
+        """
+        entries = sorted((key.encode("utf-8"), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)) for key, value in items)
+        key_offsets, value_offsets = array("Q", [0]), array("Q", [0])
+        for key, value in entries:
+            key_offsets.append(key_offsets[-1] + len(key))
+            value_offsets.append(value_offsets[-1] + len(value))
+        keys_start = cls._header.size + 2 * 8 * (len(entries) + 1)
+        values_start = keys_start + key_offsets[-1]
+
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False) as f:
+            f.write(cls._header.pack(cls.MAGIC, len(entries), keys_start, values_start))
+            f.write(key_offsets.tobytes())
+            f.write(value_offsets.tobytes())
+            for key, _ in entries:
+                f.write(key)
+            for _, value in entries:
+                f.write(value)
+        os.replace(f.name, path)  # Atomic, so processes never map a partial file
+        return cls(path)
+
+    def __reduce__(self):
+        return self.__class__, (self.path,)
+
+    def __len__(self):
+        return self._count
+
+    def _key(self, i):
+        return self._mmap[self._keys_start + self._key_offsets[i]:self._keys_start + self._key_offsets[i + 1]]
+
+    def _value(self, i):
+        return pickle.loads(self._mmap[self._values_start + self._value_offsets[i]:self._values_start + self._value_offsets[i + 1]])
+
+    def _lower_bound(self, key):
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _find(self, key):
+        encoded = key.encode("utf-8")
+        i = self._lower_bound(encoded)
+        if i < self._count and self._key(i) == encoded:
+            return i
+        return None
+
+    def _prefixed(self, prefix):
+        encoded = prefix.encode("utf-8")
+        i = self._lower_bound(encoded)
+        while i < self._count:
+            key = self._key(i)
+            if not key.startswith(encoded):
+                return
+            yield i, key
+            i += 1
+
+    def __getitem__(self, key):
+        i = self._find(key)
+        if i is None:
+            raise KeyError(key)
+        return self._value(i)
+
+    def get(self, key, default=None):
+        i = self._find(key)
+        return default if i is None else self._value(i)
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def keys(self, prefix=""):
+        return [key.decode("utf-8") for _, key in self._prefixed(prefix)]
+
+    def items(self, prefix=""):
+        return [(key.decode("utf-8"), self._value(i)) for i, key in self._prefixed(prefix)]
+
+    def values(self, prefix=""):
+        return [self._value(i) for i, _ in self._prefixed(prefix)]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import pickle
+import pytest
+from sefaria.utils.mapped_trie import MappedTrie
+
+
+class Test_Mapped_Trie(object):
+    items = [("genesis", [{"title": "Genesis"}]), ("gen", [{"title": "Gen"}]), ("exodus", [{"title": "Exodus"}]),
+             ("בראשית", [{"title": "בראשית"}]), ("בר", 1), ("genesis rabbah", None)]
+
+    def test_lookups(self, tmpdir):
+        trie = MappedTrie.build(str(tmpdir.join("t.trie")), self.items)
+        assert len(trie) == 6
+        assert trie["gen"] == [{"title": "Gen"}]
+        assert trie.get("בר") == 1
+        assert trie.get("genesis rabbah", 0) is None
+        assert trie.get("ge", 0) == 0
+        assert "exodus" in trie and "exod" not in trie
+        with pytest.raises(KeyError):
+            trie["lev"]
+
+    def test_prefixes(self, tmpdir):
+        trie = MappedTrie.build(str(tmpdir.join("t.trie")), self.items)
+        assert trie.keys("gen") == ["gen", "genesis", "genesis rabbah"]
+        assert trie.items("ב") == [("בר", 1), ("בראשית", [{"title": "בראשית"}])]
+        assert trie.values("exodus") == [[{"title": "Exodus"}]]
+        assert trie.keys("x") == []
+        assert len(trie.keys()) == 6
+
+    def test_pickle_and_empty(self, tmpdir):
+        path = str(tmpdir.join("t.trie"))
+        trie = MappedTrie.build(path, self.items)
+        loaded = pickle.loads(pickle.dumps(trie))
+        assert loaded.path == path
+        assert loaded.items("gen") == trie.items("gen")
+        empty = MappedTrie.build(str(tmpdir.join("e.trie")), [])
+        assert len(empty) == 0 and empty.keys("a") == [] and "a" not in empty
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import re
+from sefaria.utils.title_scanner import TitleScanner
+
+
+def regex_matches(titles, s):
+    reg = re.compile(r'(?P<title>' + '|'.join(sorted(map(re.escape, titles), key=len, reverse=True)) + r')($|[:., <]+)')
+    return [(m.group('title'), m.start('title'), m.end('title')) for m in reg.finditer(s)]
+
+
+class Test_Title_Scanner(object):
+    titles = ["Genesis", "Gen", "Rashi on Genesis", "Berakhot", "Ber", "בראשית", "ברכות", "משנה ברכות"]
+
+    def test_longest_title(self):
+        scanner = TitleScanner(self.titles)
+        assert list(scanner.finditer("See Rashi on Genesis 1:1")) == [("Rashi on Genesis", 4, 20)]
+        assert scanner.findall("Gen. 1:1 and Genesis") == ["Gen", "Genesis"]
+
+    def test_delimiters(self):
+        scanner = TitleScanner(self.titles)
+        # Titles must be followed by a delimiter or the end of the string
+        assert scanner.findall("Genesisx 1:1") == []
+        assert scanner.findall("Berakhot") == ["Berakhot"]
+        assert scanner.findall("Berakhot<b>") == ["Berakhot"]
+
+    def test_hebrew_prefixes(self):
+        scanner = TitleScanner(self.titles)
+        assert scanner.findall("(ובבראשית א:א)") == ["בראשית"]
+        assert scanner.findall("(ועיין משנה ברכות א:א)") == ["משנה ברכות"]
+
+    def test_matches_title_regex(self):
+        strings = [
+            "Genesis 1:1, Gen. 2:3 and Rashi on Genesis 4:5; Berakhot 2a",
+            "XGenesis  Ber.,Berakhot:Gen",
+            "ראה בראשית א:א וברכות ב. ובמשנה ברכות",
+            "",
+        ]
+        scanner = TitleScanner(self.titles)
+        for s in strings:
+            assert list(scanner.finditer(s)) == regex_matches(self.titles, s)
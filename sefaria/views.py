@@ -61,6 +61,7 @@ from reader.views import render_template
 
 if USE_VARNISH:
     from sefaria.system.varnish.wrapper import invalidate_index, invalidate_title, invalidate_ref, invalidate_counts, invalidate_all
+    from sefaria.system.varnish.common import invalidation_queue
 
 import logging
 logger = logging.getLogger(__name__)
@@ -288,9 +289,19 @@ def title_regex_api(request, titles):
 
 def bundle_many_texts(refs, useTextFamily=False, as_sized_string=False, min_char=None, max_char=None):
     res = {}
+    orefs = {}
     for tref in refs:
         try:
-            oref = model.Ref(tref)
+            orefs[tref] = model.Ref(tref)
+        except (InputError, ValueError, AttributeError, KeyError):
+            pass
+    if not useTextFamily:
+        # Loads the text of all refs with one query per book and language
+        batch = model.TextChunkBatch(list(orefs.values()))
+
+    for tref in refs:
+        try:
+            oref = orefs[tref]
             lang = "he" if is_hebrew(tref) else "en"
             if useTextFamily:
                 text_fam = model.TextFamily(oref, commentary=0, context=0, pad=False)
@@ -306,8 +317,8 @@ def bundle_many_texts(refs, useTextFamily=False, as_sized_string=False, min_char
                     'url': oref.url()
                 }
             else:
-                he_tc = model.TextChunk(oref, "he")
-                en_tc = model.TextChunk(oref, "en")
+                he_tc = batch.get(oref, "he")
+                en_tc = batch.get(oref, "en")
                 if as_sized_string:
                     kwargs = {}
                     if min_char:
@@ -387,15 +398,10 @@ def passages_api(request, refs):
         cb = request.GET.get("callback", None)
         refs = set(refs.split("|"))
 
-        # todo: Use PassageSet, so that it can be packaged as one query
         for tref in refs:
             try:
                 oref = Ref(tref)
-                p = Passage().load({"ref_list": oref.normal()})
-                if p:
-                    response[tref] = p.full_ref
-                else:
-                    response[tref] = oref.normal()
+                response[tref] = passage_index.full_ref(oref.normal()) or oref.normal()
             except InputError:
                 response[tref] = tref  # is this the best thing to do?  It passes junk along...
 
@@ -548,6 +554,7 @@ def rebuild_auto_completer(request):
     library.build_ref_auto_completer()
     library.build_lexicon_auto_completers()
     library.build_cross_lexicon_auto_completer()
+    library.save_snapshot(force=True)
 
     if MULTISERVER_ENABLED:
         server_coordinator.publish_event("library", "build_full_auto_completer")
@@ -636,9 +643,16 @@ def cache_stats(request):
     import resource
     from sefaria.utils.util import get_size
     from sefaria.model.user_profile import public_user_data_cache
+    from reader.views import get_react_render_cache
     # from sefaria.sheets import last_updated
     resp = {
         'ref_cache_size': model.Ref.cache_size(),
+        'ref_cache_stats': model.Ref.cache_stats(),
+        'react_render_cache_stats': get_react_render_cache().stats(),
+        'varnish_invalidation_stats': invalidation_queue.stats() if USE_VARNISH else None,
+        'multiserver_stats': server_coordinator.stats() if server_coordinator else None,
+        'version_catalog_stats': model.VersionCatalog.stats(),
+        'lexicon_form_cache_stats': model.LexiconLookupAggregator.stats(),
         # 'ref_cache_bytes': model.Ref.cache_size_bytes(), # This pretty expensive, not sure if it should run on prod.
         'public_user_data_size': len(public_user_data_cache),
         'public_user_data_bytes': get_size(public_user_data_cache),
@@ -649,6 +663,26 @@ def cache_stats(request):
     return jsonResponse(resp)
 
 
+@staff_member_required
+def profile_stats(request):
+    """
+    Aggregates the request profiles recorded by SamplingProfileMiddleware per view.
+    `view` limits the results to one view, and with `format=collapsed` its stacks are returned in the collapsed
+    format read by flame graph tools.
+    """
+    from sefaria.system.profiler import ProfileStore, aggregate_profiles, collapsed_stacks
+    view = request.GET.get("view")
+    views = aggregate_profiles(ProfileStore().records(), view=view)
+    if request.GET.get("format") == "collapsed":
+        if not view:
+            return jsonResponse({"error": "Collapsed stacks require a view."})
+        return HttpResponse(collapsed_stacks(views.get(view, {}).get("stacks", {})), content_type="text/plain; charset=utf-8")
+    if not view:
+        # Stacks of every view are too large for one response
+        views = {name: {k: v for k, v in agg.items() if k != "stacks"} for name, agg in views.items()}
+    return jsonResponse(views)
+
+
 @staff_member_required
 def cache_dump(request):
     resp = {
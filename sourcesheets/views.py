@@ -25,6 +25,7 @@ from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
 
 from sefaria.client.util import jsonResponse, HttpResponse
+from sefaria.client.wrapper import invalidate_related_bundles
 from sefaria.model import *
 from sefaria.sheets import *
 from sefaria.model.user_profile import *
@@ -365,6 +366,7 @@ def delete_sheet_api(request, sheet_id):
 
     db.sheets.remove({"id": id})
     process_sheet_deletion_in_collections(id)
+    invalidate_related_bundles(sheet.get("includedRefs", []))
 
     try:
         es_index_name = search.get_new_and_current_index_names("sheet")['current']